@@ -2,22 +2,26 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
 import numpy as np
 import os
+import time
+import threading
+
+from types import MappingProxyType
+from carga import HOJAS_NORMALES, HOJAS_COSTOS, cargar_datos, guardar_snapshot, leer_snapshot
+from fuentes import fuente_desde_config
+from graficos import figura
+from historial_vin import COLUMNAS_HITO, RUTA_HISTORIAL_VIN, actualizar_historial_vin, historial_de_vin, vins_por_vencer
+from irpv import borrar_estado_incremental, procesar_irpv_cache, retencion_incremental, sumar_novedades
+from kpis import (CANALES_REPUESTOS, MESES_NOMBRE, PERIODOS, RATIO_OBJETIVO_REDUCCION, CuboKpis, acumulados, armar_indices,
+                  año_mes, cociente, comparar_periodos, entradas_anuales, facturacion_anual, hist_anio, huella_datos, kpis_mes,
+                  mes_abs, rango_periodo, resumen_periodo, variacion)
+from tarjetas import (fila_tarjetas, pila_tarjetas, tarjeta_canal, tarjeta_comparativa, tarjeta_dato, tarjeta_kpi, tarjeta_kpi_chica,
+                      tarjeta_meses_stock, tarjeta_metrica, tarjeta_mini_kpi, tarjeta_prima)
+from wip import contar_paginas, cubo_wip, paginar
 
 st.set_page_config(page_title="Grupo CENOA - Gestión Posventa", layout="wide")
 
-# --- 1. CONFIGURACIÓN Y MAPEOS ---
-ASESORES_MAP = {
-    "1": "Claudio Molina", "3": "Belen Juarez", "4": "Fatima Polli", "8": "Daniel Espin",
-    "11": "César Oliva", "12": "Hector Corrales", "13": "Nazareno Segovia", "14": "Haydee Garnica",
-    "21": "Javier Gutierrez", "22": "Antonio Mogro", "23": "Samuel Antunez", 
-    "28": "Fernanda Barranco", "29": "Ricardo Alvarez", "30": "Andrea Martins", "31": "Cristian Portal"
-}
-
-CODIGOS_CYP = ['1B', '3G'] 
-
 # --- ESTILO CSS ---
 st.markdown("""<style>
     .block-container { padding-top: 1rem; padding-bottom: 2rem; }
@@ -43,315 +47,215 @@ st.markdown("""<style>
     .metric-footer { border-top: 1px solid #f0f0f0; margin-top: 8px; padding-top: 6px; font-size: 0.7rem; display: flex; justify-content: space-between; color: #666; }
     .cyp-detail { background-color: #f8f9fa; padding: 8px; border-radius: 6px; font-size: 0.8rem; margin-top: 5px; border-left: 3px solid #00235d; line-height: 1.3; }
     .cyp-header { font-weight: bold; color: #00235d; font-size: 0.85rem; margin-bottom: 2px; display: block; }
+    /* Filas de tarjetas en un solo bloque (tarjetas.py): mismo espacio que st.columns y apiladas en pantallas angostas */
+    .fila-tarjetas { display: grid; gap: 1rem; align-items: stretch; }
+    .pila-tarjetas { display: flex; flex-direction: column; gap: 1rem; }
+    @media (max-width: 640px) { .fila-tarjetas { grid-template-columns: 1fr !important; } }
 </style>""", unsafe_allow_html=True)
 
-# --- FUNCIÓN DE BÚSQUEDA ---
-def find_col(df, include_keywords, exclude_keywords=[]):
-    if df is None: return ""
-    for col in df.columns:
-        col_upper = col.upper()
-        if all(k.upper() in col_upper for k in include_keywords):
-            if not any(x.upper() in col_upper for x in exclude_keywords):
-                return col
-    return ""
-
 # --- CARGA DE DATOS ROBUSTA E INTELIGENTE ---
-@st.cache_data(ttl=60)
-def cargar_datos(sheet_id):
-    hojas_normales = ['CALENDARIO', 'SERVICIOS', 'REPUESTOS', 'TALLER', 'CyP JUJUY', 'CyP SALTA', 'WIP']
-    hojas_costos = ['Cta Res Taller', 'Cta Res Repuestos', 'Cta Res Chapa Jujuy', 'Cta Res Chapa Salta']
-    data_dict = {}
-
-    # 1. Cargar Hojas Normales (CON PROTECCIÓN DE FECHAS)
-    for h in hojas_normales:
-        url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={h.replace(' ', '%20')}"
-        try:
-            df = pd.read_csv(url, header=0, dtype=str).fillna("0")
-            df = df.dropna(how='all')
-            df.columns = [
-                str(c).strip().upper()
-                .replace(".", "")
-                .replace("Á", "A").replace("É", "E").replace("Í", "I").replace("Ó", "O").replace("Ú", "U")
-                .replace("Ñ", "N") 
-                for c in df.columns
-            ]
-            
-            for col in df.columns:
-                if not any(x in col for x in ["FECHA", "CANAL", "ESTADO", "MATRICUL", "MODELO", "DESCRIPCION", "TIPO", "VIN", "BASTIDOR", "NOMBRE"]):
-                    serie = df[col].astype(str).str.replace(r'[^\d.,-]', '', regex=True)
-                    serie = serie.str.replace('.', '', regex=False)
-                    serie = serie.str.replace(',', '.', regex=False)
-                    df[col] = pd.to_numeric(serie, errors='coerce').fillna(0.0)
-            data_dict[h] = df
-        except Exception as e:
-            st.warning(f"Error cargando {h}: {e}")
+TTL_DATOS_SEG = 60  # Antigüedad a partir de la cual se refresca en segundo plano
+
+@st.cache_resource
+def almacen_datos(clave):
+    # Estado compartido entre sesiones: última versión buena de las hojas y su refresco en segundo plano
+    return {"data": None, "indice": None, "meses": {}, "huellas": {}, "huella": None, "cubo": None, "errores": [],
+            "cargado": 0.0, "actualizando": False, "armando_cubo": False, "cubo_fallido": None, "error_cubo": None,
+            "lock": threading.Lock(), "lock_carga": threading.RLock()}
+
+def cambiaron(huellas, previas):
+    return not previas or any(huellas.get(h) != previas.get(h, (None,))[0] for h in huellas)
 
-    # 2. Cargar Hojas de Costos (Lógica Blindada + TRADUCTOR DE FECHAS)
-    for h in hojas_costos:
-        url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={h.replace(' ', '%20')}"
+def refrescar_almacen(alm, fuente):
+    with alm["lock_carga"]:
         try:
-            df_raw = pd.read_csv(url, header=None, dtype=str).fillna("")
-            
-            # 1. Encontrar la fila real de cabecera
-            idx_header = 0
-            for i in range(min(5, len(df_raw))):
-                fila_texto = "".join(df_raw.iloc[i].astype(str).values).upper()
-                if "RUBRO" in fila_texto or "UBRO" in fila_texto:
-                    idx_header = i
-                    break
-            
-            # 2. Tomar los títulos de esa fila
-            titulos_crudos = df_raw.iloc[idx_header].astype(str).str.strip().values
-            
-            # 3. Limpiar y estandarizar (AQUÍ TRADUCIMOS LAS FECHAS)
-            titulos_limpios = []
-            meses_es = {1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril", 5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"}
-            
-            for t in titulos_crudos:
-                t_upper = t.upper().replace(" ", "")
-                if "UBRO" in t_upper or "RUBRO" in t_upper:
-                    titulos_limpios.append("RUBRO")
-                elif "CONCEPTO" in t_upper:
-                    titulos_limpios.append("CONCEPTO")
-                elif t == "" or "UNNAMED" in t_upper or "%" in t_upper:
-                    titulos_limpios.append(t) # Lo descartamos luego
-                else:
-                    # Intentamos detectar si es una fecha y la formateamos
-                    try:
-                        # Si es un código numérico interno de Google Sheets (ej: 45689)
-                        if str(t).replace('.', '', 1).isdigit() and float(t) > 40000:
-                            fecha = pd.to_datetime(float(t), unit='D', origin='1899-12-30')
-                        else:
-                            # Si es un texto de fecha largo (ej: "2025-01-01 00:00:00")
-                            fecha = pd.to_datetime(t)
-                            
-                        mes_nombre = meses_es[fecha.month]
-                        anio_corto = str(fecha.year)[-2:] # Toma los ultimos 2 digitos (2025 -> 25)
-                        titulos_limpios.append(f"{mes_nombre} {anio_corto}")
-                    except:
-                        # Si por algún motivo no es una fecha, deja el texto que estaba
-                        titulos_limpios.append(t_upper)
-            
-            # 4. Crear el DataFrame limpio
-            df_clean = df_raw.iloc[idx_header+1:].copy()
-            df_clean.columns = titulos_limpios
-            
-            # 5. Eliminar columnas vacías o de porcentajes
-            cols_to_drop = [c for c in df_clean.columns if '%' in c or 'UNNAMED' in c or c == ""]
-            df_clean = df_clean.drop(columns=cols_to_drop)
-            
-            # 6. Filtrar filas donde CONCEPTO esté vacío
-            if 'CONCEPTO' in df_clean.columns:
-                df_clean = df_clean[df_clean['CONCEPTO'] != "0"]
-                df_clean = df_clean[df_clean['CONCEPTO'] != ""]
-            
-            # 7. Convertir el dinero a números
-            for col in df_clean.columns:
-                if col not in ["RUBRO", "CONCEPTO"]:
-                    s = df_clean[col].astype(str).str.replace(r'[^\d.,-]', '', regex=True)
-                    s = s.str.replace('.', '', regex=False)
-                    s = s.str.replace(',', '.', regex=False)
-                    df_clean[col] = pd.to_numeric(s, errors='coerce').fillna(0.0)
-                    
-            data_dict[h] = df_clean
+            previas = {h: (alm["huellas"].get(h), df) for h, df in (alm["data"] or {}).items()}
+            data_dict, huellas, errores = cargar_datos(fuente, previas)
+            # Si una hoja falla seguimos sirviendo su última versión buena
+            for h, df in previas.items():
+                if h not in data_dict:
+                    data_dict[h], huellas[h] = df[1], df[0]
+            data_dict = {h: data_dict[h] for h in HOJAS_NORMALES + HOJAS_COSTOS if h in data_dict}
+            hubo_cambios = cambiaron(huellas, previas)
+            # Los índices se rehacen sólo si cambió la planilla
+            indice, meses = armar_indices(data_dict) if hubo_cambios else (alm["indice"], alm["meses"])
+            with alm["lock"]:
+                alm["data"], alm["huellas"], alm["errores"] = data_dict, huellas, errores
+                alm["indice"], alm["meses"] = indice, meses
+                if hubo_cambios: alm["huella"] = huella_datos(huellas)
+                alm["cargado"] = time.time()
+            if data_dict and hubo_cambios:
+                lanzar_cubo(alm)
+                guardar_snapshot(fuente.clave, data_dict, huellas)
         except Exception as e:
-            st.warning(f"Error cargando hoja de costos {h}: {e}")
-                
-    return data_dict
-    
-# --- PROCESAMIENTO IRPV ---
-def leer_csv_inteligente(uploaded_file):
+            with alm["lock"]:
+                alm["errores"] = [f"Error actualizando datos: {e}"]
+                alm["cargado"] = time.time()
+        finally:
+            alm["actualizando"] = False
+
+def armar_cubo(alm):
+    # Todos los meses de CALENDARIO, fuera del rerun; si mientras tanto cambiaron los datos se descarta
+    with alm["lock"]:
+        data_dict, indice, meses, huella = alm["data"], alm["indice"], alm["meses"], alm["huella"]
     try:
-        uploaded_file.seek(0)
-        preview = pd.read_csv(uploaded_file, header=None, nrows=20, sep=None, engine='python', encoding='utf-8', on_bad_lines='skip')
-        idx_header = -1
-        keywords = ['BASTIDOR', 'VIN', 'CHASIS', 'MATRICULA', 'REF.OR']
-        for i, row in preview.iterrows():
-            row_txt = " ".join([str(x).upper() for x in row.values])
-            if any(kw in row_txt for kw in keywords):
-                idx_header = i
-                break
-        if idx_header == -1: idx_header = 0
-        
-        uploaded_file.seek(0)
-        try:
-            df = pd.read_csv(uploaded_file, header=idx_header, sep=';', encoding='utf-8', on_bad_lines='skip')
-        except:
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, header=idx_header, sep=',', encoding='utf-8', on_bad_lines='skip')
-        return df, "OK"
+        cubo = CuboKpis(data_dict, indice, meses, huella)
+        with alm["lock"]:
+            if alm["huella"] == huella: alm["cubo"] = cubo
     except Exception as e:
-        return None, str(e)
-
-def procesar_irpv(file_v, file_t):
-    df_v, msg_v = leer_csv_inteligente(file_v)
-    if df_v is None: return None, f"Ventas: {msg_v}"
-    df_v.columns = [str(c).upper().strip() for c in df_v.columns]
-    
-    col_vin = next((c for c in df_v.columns if 'BASTIDOR' in c or 'VIN' in c), None)
-    col_fec = next((c for c in df_v.columns if 'FEC' in c or 'ENTR' in c), None)
-    if not col_vin or not col_fec: return None, "Ventas: Faltan columnas VIN/Fecha"
-
-    def clean_date(x):
-        try: return pd.to_datetime(x, dayfirst=True)
-        except: return pd.NaT
-
-    df_v['Fecha_Entrega'] = df_v[col_fec].apply(clean_date)
-    df_v['Año_Venta'] = df_v['Fecha_Entrega'].dt.year
-    df_v['VIN'] = df_v[col_vin].astype(str).str.strip().str.upper()
-    df_v = df_v.dropna(subset=['VIN', 'Fecha_Entrega'])
-
-    df_t, msg_t = leer_csv_inteligente(file_t)
-    if df_t is None: return None, f"Taller: {msg_t}"
-    df_t.columns = [str(c).upper().strip() for c in df_t.columns]
-    
-    col_vin_t = next((c for c in df_t.columns if 'BASTIDOR' in c or 'VIN' in c), None)
-    col_fec_t = next((c for c in df_t.columns if 'CIERRE' in c or 'FEC' in c), None)
-    col_km = next((c for c in df_t.columns if 'KM' in c), None)
-    col_or = next((c for c in df_t.columns if 'TIPO' in c or 'O.R.' in c), None)
-    col_desc = next((c for c in df_t.columns if 'DESCR' in c or 'OPER' in c or 'TRABAJO' in c), None)
-    if not col_vin_t or not col_fec_t: return None, "Taller: Faltan columnas VIN/Fecha"
-
-    df_t['Fecha_Servicio'] = df_t[col_fec_t].apply(clean_date)
-    df_t['VIN'] = df_t[col_vin_t].astype(str).str.strip().str.upper()
-    df_t['Km'] = pd.to_numeric(df_t[col_km], errors='coerce').fillna(0) if col_km else 0
-    df_t['Texto'] = df_t[col_desc].astype(str).str.upper() if col_desc else ""
-
-    if col_or:
-        mask = ~df_t[col_or].astype(str).str.contains('CHAPA|PINTURA|SINIESTRO', case=False, na=False)
-        df_t = df_t[mask]
-
-    def clasif_hibrida(row):
-        k = row['Km']
-        t = row['Texto']
-        if (2500 <= k <= 16500) or any(w in t for w in ["10.000", "10K", "1ER", "PRIMER", "DIEZ MIL"]): return "1er"
-        if (16501 <= k <= 27000) or any(w in t for w in ["20.000", "20K", "2DO", "SEGUNDO", "VEINTE MIL"]): return "2do"
-        if (27001 <= k <= 38000) or any(w in t for w in ["30.000", "30K", "3ER", "TERCER", "TREINTA MIL"]): return "3er"
-        return None
-    
-    df_t['Hito'] = df_t.apply(clasif_hibrida, axis=1)
-    df_validos = df_t.dropna(subset=['Hito'])
-    pivot_dates = df_validos.pivot_table(index='VIN', columns='Hito', values='Fecha_Servicio', aggfunc='min').reset_index()
-    merged = pd.merge(df_v, pivot_dates, on='VIN', how='left')
-    hoy = datetime.now()
-
-    def evaluar(row, actual, anterior=None):
-        if actual == '1er': base = row['Fecha_Entrega']
-        else: base = row.get(anterior, pd.NaT)
-        if pd.isna(base): return np.nan 
-        limite = base + timedelta(days=365)
-        hecho = row.get(actual, pd.NaT)
-        if not pd.isna(hecho): return 1.0 
-        if hoy >= limite: return 0.0 
-        return np.nan 
-
-    merged['R_1er'] = merged.apply(lambda r: evaluar(r, '1er'), axis=1)
-    merged['R_2do'] = merged.apply(lambda r: evaluar(r, '2do', '1er'), axis=1)
-    merged['R_3er'] = merged.apply(lambda r: evaluar(r, '3er', '2do'), axis=1)
-    res = merged.groupby('Año_Venta')[['R_1er', 'R_2do', 'R_3er']].mean()
-    res.columns = ['1er', '2do', '3er']
-    return res, "OK"
-
-# --- TRANSFORMACIÓN DE DATOS WIP DESDE SHEET ---
-def preparar_wip_desde_sheet(df):
-    if df is None or df.empty: return None
-    
-    def col_segura(nombre):
-        if not nombre: return pd.Series([np.nan] * len(df))
-        data = df[nombre]
-        return data.iloc[:, 0] if isinstance(data, pd.DataFrame) else data
-
-    col_saldo = find_col(df, ['TOTAL', 'IM']) or find_col(df, ['SALDO'])
-    if not col_saldo: return None
-    
-    col_matricula = find_col(df, ['MATRICUL'])
-    col_idv = find_col(df, ['IDV'])
-    col_rec = find_col(df, ['REC'])
-    col_tipo = find_col(df, ['TIPO'])
-    col_fecha = find_col(df, ['APER']) 
-    col_modelo = find_col(df, ['MODELO'])
-    col_ref = find_col(df, ['REF'])    
-
-    df['Saldo'] = col_segura(col_saldo) 
-    
-    s_mat = col_segura(col_matricula)
-    s_idv = col_segura(col_idv)
-
-    if col_matricula and col_idv:
-        df['Identificador'] = s_mat.replace('0', np.nan).fillna(s_idv.astype(str))
-    elif col_matricula:
-        df['Identificador'] = s_mat
+        # No se reintenta con los mismos datos: cada rerun lanzaría otro hilo que falla igual
+        with alm["lock"]:
+            alm["cubo_fallido"], alm["error_cubo"] = huella, f"Error precalculando KPIs: {e}"
+    finally:
+        alm["armando_cubo"] = False
+
+def lanzar_cubo(alm):
+    with alm["lock"]:
+        cubo = alm["cubo"]
+        lanzar = (alm["data"] is not None and not alm["armando_cubo"] and alm["cubo_fallido"] != alm["huella"]
+                  and (cubo is None or not cubo.vigente(alm["huella"])))
+        if lanzar: alm["armando_cubo"] = True
+    if lanzar:
+        threading.Thread(target=armar_cubo, args=(alm,), daemon=True).start()
+
+def obtener_datos(fuente):
+    alm = almacen_datos(fuente.clave)
+    with alm["lock"]:
+        if alm["data"] is None:
+            snap = leer_snapshot(fuente.clave)
+            if snap is not None:
+                alm["data"], alm["huellas"], alm["cargado"] = snap
+                alm["indice"], alm["meses"] = armar_indices(alm["data"])
+                alm["huella"] = huella_datos(alm["huellas"])
+
+    if alm["data"] is None:
+        # Primer arranque sin snapshot: no queda otra que esperar a la red
+        with alm["lock_carga"]:
+            if alm["data"] is None: refrescar_almacen(alm, fuente)
     else:
-        df['Identificador'] = "S/D"
-        
-    df['Identificador'] = df['Identificador'].astype(str).str.strip().str.upper()
-
-    def obtener_nombre_asesor(val):
-        try:
-            val_clean = str(val).split('.')[0] 
-            return ASESORES_MAP.get(val_clean, f"Asesor {val_clean}")
-        except:
-            return "Sin Asesor"
-            
-    if col_rec:
-        df['Nombre_Asesor'] = col_segura(col_rec).apply(obtener_nombre_asesor)
-    else:
-        df['Nombre_Asesor'] = "Desconocido"
-
-    def clasificar_taller(texto_tipo):
-        if pd.isna(texto_tipo): return 'Mecánica'
-        codigo = str(texto_tipo).strip().upper()[:2]
-        if codigo in CODIGOS_CYP: return 'Chapa y Pintura'
-        return 'Mecánica'
-
-    s_tipo = col_segura(col_tipo)
-    if col_tipo:
-        df['Tipo_Taller'] = s_tipo.apply(clasificar_taller)
-        df['Tipo'] = s_tipo 
+        with alm["lock"]:
+            lanzar = time.time() - alm["cargado"] > TTL_DATOS_SEG and not alm["actualizando"]
+            if lanzar: alm["actualizando"] = True
+        if lanzar:
+            # Servimos lo que hay (stale) y revalidamos en segundo plano
+            threading.Thread(target=refrescar_almacen, args=(alm, fuente), daemon=True).start()
+
+    # El cubo se rehace al cambiar los datos o el mes calendario; hasta que esté, cada mes se calcula al pedirlo
+    lanzar_cubo(alm)
+
+    with alm["lock"]:
+        errores = alm["errores"] + ([alm["error_cubo"]] if alm["cubo_fallido"] == alm["huella"] else [])
+    for err in errores:
+        st.warning(err)
+    with alm["lock"]:
+        cubo = alm["cubo"] if alm["cubo"] is not None and alm["cubo"].vigente(alm["huella"]) else None
+    # Las hojas se comparten entre sesiones y reruns sin copiarlas: son de sólo lectura
+    return MappingProxyType(alm["data"] or {}), alm["indice"], alm["meses"], alm["huella"], MappingProxyType(alm["huellas"]), cubo
+    
+# --- FRAGMENTOS INTERACTIVOS ---
+# Bloques que se vuelven a ejecutar solos al mover sus controles: reciben los totales ya calculados y no
+# disparan el rerun de toda la página (fechas, KPIs y gráficos de la pestaña).
+
+@st.fragment
+def flujo_compras(compra_real_sheet, costo_venta_total, diferencia_flujo, ratio_reduccion):
+    col_obj_term_in, _ = st.columns([1, 2])
+    with col_obj_term_in:
+        obj_compra_terminal = st.number_input("🎯 Objetivo Compra Stellantis ($)", min_value=0.0, step=1000000.0, value=0.0)
+
+    k_f1, k_f2, k_f3 = st.columns(3)
+    k_f1.metric("Compra Real (Sheet)", f"${compra_real_sheet:,.0f}", help="Dato tomado de Columna AB del Excel")
+    k_f2.metric("Costo de Venta Total", f"${costo_venta_total:,.0f}")
+
+    if diferencia_flujo > 0:
+        k_f3.metric("Flujo de Stock", f"+${diferencia_flujo:,.0f}", "📈 Stock Subiendo", delta_color="inverse")
     else:
-        df['Tipo_Taller'] = 'Mecánica'
-        df['Tipo'] = 'S/D'
+        k_f3.metric("Flujo de Stock", f"-${abs(diferencia_flujo):,.0f}", "📉 Stock Bajando", delta_color="normal")
 
-    if col_fecha:
-        df['Fecha_Alta'] = pd.to_datetime(col_segura(col_fecha), dayfirst=True, errors='coerce')
+    st.markdown("##### 🚦 Semáforo de Reducción")
+    if compra_real_sheet == 0:
+        st.warning("⚠️ No se detectaron compras en la columna del Excel (Busco columnas llamadas 'COMPRA' o 'ENTRADA').")
     else:
-        df['Fecha_Alta'] = pd.NaT
-
-    if col_modelo: df['Modelo'] = col_segura(col_modelo)
-    else: df['Modelo'] = ""
-    
-    if col_ref: df['Ref.OR'] = col_segura(col_ref)
-    else: df['Ref.OR'] = ""
-
-    return df
+        if ratio_reduccion >= RATIO_OBJETIVO_REDUCCION:
+            st.success(f"✅ **OBJETIVO CUMPLIDO:** Estás vendiendo un {((ratio_reduccion-1)*100):.1f}% más de lo que compras (Meta: 20%). El stock baja correctamente.")
+        elif ratio_reduccion > 1.0:
+            st.info(f"⚠️ **ALERTA LEVE:** El stock baja, pero lento. Vendes solo un {((ratio_reduccion-1)*100):.1f}% más de lo que compras (Meta: 20%).")
+        else:
+            st.error(f"❌ **ALERTA CRÍTICA:** Estás comprando más de lo que vendes. El stock está subiendo.")
+
+    piso_scoring = obj_compra_terminal * 0.60
+    if obj_compra_terminal > 0:
+        st.caption(f"Referencia Scoring: Debes comprar al menos ${piso_scoring:,.0f} (60% del obj). Compra actual: ${compra_real_sheet:,.0f}")
+        if compra_real_sheet < piso_scoring:
+            st.error("⚠️ Cuidado: Estás por debajo del piso de compra para el Scoring.")
+
+@st.fragment
+def simulador_operacion(vta_total_neta, util_total_final, mg_total_final):
+    with st.expander("Abrir Simulador", expanded=True):
+        c_sim1, c_sim2 = st.columns(2)
+        with c_sim1: monto_especial = st.number_input("Monto Venta ($)", min_value=0.0, value=50000000.0, step=1000000.0)
+        with c_sim2: margen_especial = st.slider("% Margen Operación", -10.0, 30.0, 10.0, 0.5) / 100
+        nueva_venta_total = vta_total_neta + monto_especial
+        nueva_utilidad_total = util_total_final + (monto_especial * margen_especial)
+        nuevo_margen_global = nueva_utilidad_total / nueva_venta_total if nueva_venta_total > 0 else 0
+        col_res1, col_res2 = st.columns(2)
+        with col_res1:
+            puntos_dif = (nuevo_margen_global - mg_total_final) * 100
+            st.metric("Nuevo Margen Global", f"{nuevo_margen_global:.1%}", delta=f"{puntos_dif:.1f} pts vs actual")
+        with col_res2:
+            dif_objetivo = nueva_utilidad_total - (nueva_venta_total * 0.21)
+            if nuevo_margen_global >= 0.21: st.success(f"✅ **Viable:** Sobran **${dif_objetivo:,.0f}** sobre el 21%.")
+            else: st.error(f"❌ **Riesgoso:** Faltan **${abs(dif_objetivo):,.0f}** para el 21%.")
+
+@st.fragment
+def calculadora_mix(mix_inicial, margen_inicial, obj_rep_total):
+    col_mix_input, col_mix_res = st.columns([3, 2])
+    mix_ideal = {}
+    margin_ideal = {}
+    sum_mix = 0
+    with col_mix_input:
+        for c in CANALES_REPUESTOS:
+            val_def_mix = float(mix_inicial.get(c, 0.0))
+            val_def_marg = float(margen_inicial.get(c, 25.0))
+            c1_s, c2_s = st.columns([2, 1])
+            with c1_s: val_mix = st.slider(f"% Mix {c}", 0.0, 100.0, val_def_mix, 0.5, key=f"mix_{c}")
+            with c2_s: val_marg = st.number_input(f"% Margen {c}", 0.0, 100.0, val_def_marg, 0.5, key=f"marg_{c}")
+            mix_ideal[c] = val_mix / 100
+            margin_ideal[c] = val_marg / 100
+            sum_mix += val_mix
+    with col_mix_res:
+        st.markdown(f"#### Objetivo Mensual: ${obj_rep_total:,.0f}")
+        delta_sum = sum_mix - 100.0
+        color_sum = "off"
+        if abs(delta_sum) < 0.1: color_sum = "normal"
+        else: color_sum = "inverse"
+        st.metric("Suma del Mix Total", f"{sum_mix:.1f}%", f"{delta_sum:.1f}%", delta_color=color_sum)
+        if abs(delta_sum) > 0.1: st.error(f"⚠️ El mix debe sumar 100%")
+        total_profit_ideal = 0
+        for c, share in mix_ideal.items():
+            total_profit_ideal += (obj_rep_total * share) * margin_ideal.get(c, 0)
+        global_margin_ideal = total_profit_ideal / obj_rep_total if obj_rep_total > 0 else 0
+        st.markdown("#### Resultado Estratégico:")
+        st.info(f"Con esta estrategia, tu **Margen Global** sería del **{global_margin_ideal:.1%}**")
 
 # --- MAIN APP ---
 ID_SHEET = "1yJgaMR0nEmbKohbT_8Vj627Ma4dURwcQTQcQLPqrFwk"
 
 try:
-    data = cargar_datos(ID_SHEET)
+    data, indice, meses, huella, huellas, cubo = obtener_datos(fuente_desde_config(ID_SHEET))
     
     if data:
-        for h in ['CALENDARIO', 'SERVICIOS', 'REPUESTOS', 'TALLER', 'CyP JUJUY', 'CyP SALTA']:
-            if h in data:
-                col_f = find_col(data[h], ["FECHA"]) or data[h].columns[0]
-                data[h]['Fecha_dt'] = pd.to_datetime(data[h][col_f], dayfirst=True, errors='coerce')
-                data[h]['Mes'] = data[h]['Fecha_dt'].dt.month
-                data[h]['Año'] = data[h]['Fecha_dt'].dt.year
-
-        canales_repuestos = ['MOSTRADOR', 'TALLER', 'INTERNA', 'GAR', 'CYP', 'MAYORISTA', 'SEGUROS']
+        kpi = indice.kpi
 
         with st.sidebar:
             if os.path.exists("logo.png"):
                 st.image("logo.png", use_container_width=True)
                 
             st.header("1. Filtros Temporales")
-            años_disp = sorted([int(a) for a in data['CALENDARIO']['Año'].unique() if a > 0], reverse=True)
+            años_disp = sorted([a for a in meses['CALENDARIO'].años() if a > 0], reverse=True)
             año_sel = st.selectbox("📅 Año", años_disp)
             
-            meses_nom = {1:"Enero", 2:"Febrero", 3:"Marzo", 4:"Abril", 5:"Mayo", 6:"Junio", 7:"Julio", 8:"Agosto", 9:"Septiembre", 10:"Octubre", 11:"Noviembre", 12:"Diciembre"}
-            df_year = data['CALENDARIO'][data['CALENDARIO']['Año'] == año_sel]
-            meses_disp = sorted(df_year['Mes'].unique(), reverse=True)
+            meses_nom = MESES_NOMBRE
+            meses_disp = sorted(meses['CALENDARIO'].meses_de(año_sel), reverse=True)
             mes_sel = st.selectbox("📅 Mes", meses_disp, format_func=lambda x: meses_nom.get(x, "N/A"))
 
             st.markdown("---")
@@ -360,57 +264,60 @@ try:
             if 'df_irpv_cache' not in st.session_state: st.session_state.df_irpv_cache = None
 
             with st.expander("🔄 Historial IRPV", expanded=False):
-                up_v = st.file_uploader("Entregas 0km", type=["csv"], key="v_uploader")
-                up_t = st.file_uploader("Historial Taller", type=["csv"], key="t_uploader")
-                
-                if up_v and up_t:
-                    if st.session_state.df_irpv_cache is None:
-                        df_irpv, msg_irpv = procesar_irpv(up_v, up_t)
-                        if df_irpv is not None:
-                            st.session_state.df_irpv_cache = df_irpv
-                            st.success("IRPV Procesado OK")
-                        else:
-                            st.error(msg_irpv)
+                modo_irpv = st.radio("Modo", ["Archivos completos", "Novedades del mes"], horizontal=True, key="irpv_modo")
+                if modo_irpv == "Archivos completos":
+                    up_v = st.file_uploader("Entregas 0km", type=["csv"], key="v_uploader")
+                    up_t = st.file_uploader("Historial Taller", type=["csv"], key="t_uploader")
+
+                    if up_v and up_t:
+                        if st.session_state.df_irpv_cache is None:
+                            df_irpv, msg_irpv = procesar_irpv_cache(up_v, up_t)
+                            if df_irpv is not None:
+                                st.session_state.df_irpv_cache = df_irpv
+                                st.success("IRPV Procesado OK")
+                            else:
+                                st.error(msg_irpv)
+                    else:
+                        st.session_state.df_irpv_cache = None
                 else:
-                    st.session_state.df_irpv_cache = None
-
-        def get_row(df):
-            res = df[(df['Año'] == año_sel) & (df['Mes'] == mes_sel)].sort_values('Fecha_dt')
-            return res.iloc[-1] if not res.empty else pd.Series(dtype='object')
-
-        c_r = get_row(data['CALENDARIO'])
-        s_r = get_row(data['SERVICIOS'])
-        r_r = get_row(data['REPUESTOS'])
-        t_r = get_row(data['TALLER'])
-        cj_r = get_row(data['CyP JUJUY'])
-        cs_r = get_row(data['CyP SALTA'])
-
-        col_trans = find_col(data['CALENDARIO'], ["TRANS"]) 
-        col_hab = find_col(data['CALENDARIO'], ["HAB"])
-        d_t = float(c_r.get(col_trans, 0))
-        d_h = float(c_r.get(col_hab, 22))
-        
-        hoy = datetime.now()
-        if (año_sel < hoy.year) or (año_sel == hoy.year and mes_sel < hoy.month):
-             if d_t < d_h: d_t = d_h
-
-        prog_t = d_t / d_h if d_h > 0 else 0
-        prog_t = min(prog_t, 1.0)
+                    # Sólo lo nuevo de cada mes; el historial acumulado queda guardado en el servidor
+                    up_dv = st.file_uploader("Entregas nuevas", type=["csv"], key="v_delta")
+                    up_dt = st.file_uploader("Órdenes de taller nuevas", type=["csv"], key="t_delta")
+                    if st.button("➕ Sumar al historial", disabled=not (up_dv or up_dt)):
+                        _, msg_irpv = sumar_novedades(up_dv, up_dt)
+                        if msg_irpv == "OK": st.success("Historial IRPV actualizado")
+                        else: st.error(msg_irpv)
+                    # Se recalcula sólo después de sumar o reiniciar (o al cambiar el día); si no, sale de memoria
+                    df_irpv, n_entregas = retencion_incremental()
+                    if df_irpv is not None:
+                        st.caption(f"Historial acumulado: {n_entregas:,} entregas")
+                        st.session_state.df_irpv_cache = df_irpv if not df_irpv.empty else None
+                        if st.button("🗑️ Reiniciar historial acumulado"):
+                            borrar_estado_incremental()
+                            st.session_state.df_irpv_cache = None
+                            st.rerun()
+                    else:
+                        st.caption("Para empezar, sumar una vez los archivos completos")
+                        st.session_state.df_irpv_cache = None
+
+                # Las mismas entregas y órdenes, guardadas por VIN para consultarlas en la pestaña Histórico
+                up_hv, up_ht = (up_v, up_t) if modo_irpv == "Archivos completos" else (up_dv, up_dt)
+                if st.button("📇 Guardar en historial por VIN", disabled=not (up_hv or up_ht)):
+                    with st.spinner("Guardando historial por VIN..."):
+                        n_v, n_t, msg_hv = actualizar_historial_vin(up_hv, up_ht)
+                    if msg_hv == "OK": st.success(f"Historial por VIN: {n_v:,} entregas y {n_t:,} órdenes nuevas")
+                    else: st.error(msg_hv)
+
+        # Toda la cuenta del mes sale del motor (kpis.py); las pestañas sólo dibujan
+        k = kpis_mes(data, indice, meses, huella, año_sel, mes_sel, cubo=cubo)
+        d_t, d_h, prog_t = k.avance.d_t, k.avance.d_h, k.avance.prog_t
 
         # DATA HISTORICO
-        def get_hist_data(sheet_name):
-            df = data[sheet_name]
-            df = df[df['Año'] == año_sel].sort_values('Mes')
-            df = df.groupby('Mes').last().reset_index()
-            df['NombreMes'] = df['Mes'].map(meses_nom)
-            return df
-
-        h_cal = get_hist_data('CALENDARIO')
-        h_ser = get_hist_data('SERVICIOS')
-        h_rep = get_hist_data('REPUESTOS')
-        h_tal = get_hist_data('TALLER')
-        h_cyp_j = get_hist_data('CyP JUJUY')
-        h_cyp_s = get_hist_data('CyP SALTA')
+        h_cal = hist_anio(meses, 'CALENDARIO', año_sel)
+        h_rep = hist_anio(meses, 'REPUESTOS', año_sel)
+        h_tal = hist_anio(meses, 'TALLER', año_sel)
+        h_cyp_j = hist_anio(meses, 'CyP JUJUY', año_sel)
+        h_cyp_s = hist_anio(meses, 'CyP SALTA', año_sel)
 
         # --- PORTADA ---
         st.markdown(f'''
@@ -432,304 +339,172 @@ try:
         selected_tab = st.radio("", menu_opts, horizontal=True, label_visibility="collapsed")
 
         # --- HELPERS VISUALES ---
+        # Las tarjetas salen de plantillas (tarjetas.py); cada fila de tarjetas es un solo st.markdown
         def render_kpi_card(title, real, obj_mes, is_currency=True, unit="", show_daily=False):
-            obj_parcial = obj_mes * prog_t
-            proy = (real / d_t) * d_h if d_t > 0 else 0
-            cumpl_proy = proy / obj_mes if obj_mes > 0 else 0
-            fmt = "${:,.0f}" if is_currency else "{:,.0f}"
-            if unit: fmt += f" {unit}"
-            color = "#dc3545" if cumpl_proy < 0.90 else ("#ffc107" if cumpl_proy < 0.98 else "#28a745")
-            icon = "✅" if real >= obj_parcial else "🔻"
-            cumpl_parcial_pct = real / obj_parcial if obj_parcial > 0 else 0
-            daily_html = ""
-            if show_daily:
-                daily_val = real / d_t if d_t > 0 else 0
-                fmt_daily = "${:,.0f}" if is_currency else "{:,.1f}"
-                daily_html = f'<div style="font-size:0.75rem; color:#00235d; background-color:#eef2f7; padding: 1px 6px; border-radius:4px; display:inline-block; margin-bottom:4px;">Prom: <b>{fmt_daily.format(daily_val)}</b> /día</div>'
-
-            html = '<div class="kpi-card">'
-            html += f'<div><p>{title}</p><h2>{fmt.format(real)}</h2>{daily_html}</div>'
-            html += f'<div><div class="kpi-subtext">vs Obj. Parcial: <b>{fmt.format(obj_parcial)}</b> <span style="color:{"#28a745" if real >= obj_parcial else "#dc3545"}">({cumpl_parcial_pct:.1%})</span> {icon}</div>'
-            html += '<hr style="margin:5px 0; border:0; border-top:1px solid #eee;">'
-            html += f'<div style="display:flex; justify-content:space-between; font-size:0.75rem; margin-bottom:2px;"><span>Obj. Mes:</span><b>{fmt.format(obj_mes)}</b></div>'
-            html += f'<div style="display:flex; justify-content:space-between; font-size:0.75rem; color:{color}; font-weight:bold;"><span>Proyección:</span><span>{fmt.format(proy)} ({cumpl_proy:.1%})</span></div>'
-            html += f'<div style="margin-top:5px;"><div style="width:100%; background:#e0e0e0; height:5px; border-radius:10px;"><div style="width:{min(cumpl_proy*100, 100)}%; background:{color}; height:5px; border-radius:10px;"></div></div></div></div></div>'
-            return html
+            return tarjeta_kpi(title, real, obj_mes, k.avance, is_currency, unit, show_daily)
 
         def render_kpi_small(title, val, target=None, target_mensual=None, projection=None, format_str="{:.1%}", label_target="Obj. Parcial"):
-            subtext_html = "<div style='height:15px;'></div>"
-            footer_html = ""
-            if target is not None:
-                delta = val - target
-                color = "#28a745" if delta >= 0 else "#dc3545"
-                icon = "▲" if delta >= 0 else "▼"
-                subtext_html = f"<div style='margin-top:4px; display:flex; justify-content:center; align-items:center; gap:5px; font-size:0.7rem;'><span style='color:#888;'>{label_target}: {format_str.format(target)}</span><span style='color:{color}; font-weight:bold; background-color:{color}15; padding:1px 4px; border-radius:3px;'>{icon} {format_str.format(abs(delta))}</span></div>"
-            if target_mensual is not None and projection is not None:
-                proy_delta = projection - target_mensual
-                color_proy = "#28a745" if proy_delta >= 0 else "#dc3545"
-                footer_html = f'<div class="metric-footer"><div>Obj. Mes: <b>{format_str.format(target_mensual)}</b></div><div style="color:{color_proy}">Proy: <b>{format_str.format(projection)}</b></div></div>'
-            html = f'<div class="metric-card"><div><p style="color:#666; font-size:0.8rem; margin-bottom:2px;">{title}</p><h3 style="color:#00235d; margin:0; font-size:1.3rem;">{format_str.format(val)}</h3>{subtext_html}</div>{footer_html}</div>'
-            return html
-
-        # --- LÓGICA DE COLUMNAS (SERVICIOS) ---
-        c_cli = find_col(data['SERVICIOS'], ["MO", "CLI"], exclude_keywords=["OBJ"])
-        c_gar = find_col(data['SERVICIOS'], ["MO", "GAR"], exclude_keywords=["OBJ"])
-        c_int = find_col(data['SERVICIOS'], ["MO", "INT"], exclude_keywords=["OBJ"])
-        if not c_int: c_int = find_col(data['SERVICIOS'], ["INTERNA"], exclude_keywords=["OBJ", "MO"])
-        c_ter = find_col(data['SERVICIOS'], ["MO", "TERCERO"], exclude_keywords=["OBJ"])
-        if not c_ter: c_ter = find_col(data['SERVICIOS'], ["MO", "TERCEROS"], exclude_keywords=["OBJ"])
-        if not c_ter: c_ter = find_col(data['SERVICIOS'], ["MO", "TER"], exclude_keywords=["OBJ"])
-        if not c_ter: c_ter = find_col(data['SERVICIOS'], ["TERCERO"], exclude_keywords=["OBJ", "MO", "COSTO"])
-
-        val_cli = s_r.get(c_cli, 0) if c_cli else 0
-        val_gar = s_r.get(c_gar, 0) if c_gar else 0
-        val_int = s_r.get(c_int, 0) if c_int else 0
-        val_ter = s_r.get(c_ter, 0) if c_ter else 0
-        real_mo_total = val_cli + val_gar + val_int + val_ter
-        
-        # --- TAB 1: OBJETIVOS ---
-        if selected_tab == "🏠 Objetivos":
-            cols = st.columns(4)
-            real_rep = sum([r_r.get(find_col(data['REPUESTOS'], ["VENTA", c], exclude_keywords=["OBJ"]), 0) for c in canales_repuestos])
-            
-            def get_cyp_total(row, df_nom):
-                c_mo = find_col(data[df_nom], ['MO'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-                c_mo_t = find_col(data[df_nom], ['MO', 'TERCERO'], exclude_keywords=['OBJ']) or find_col(data[df_nom], ['MO', 'TER'], exclude_keywords=['OBJ'])
-                c_rep = find_col(data[df_nom], ['FACT', 'REP'], exclude_keywords=['OBJ', 'COSTO']) or find_col(data[df_nom], ['REP'], exclude_keywords=['OBJ', 'COSTO'])
-                
-                mo_p = float(row.get(c_mo, 0)) if c_mo else 0
-                mo_t = float(row.get(c_mo_t, 0)) if c_mo_t else 0
-                rep = float(row.get(c_rep, 0)) if c_rep else 0
-                
-                return mo_p + mo_t + rep
+            return tarjeta_kpi_chica(title, val, target, target_mensual, projection, format_str, label_target)
 
-            # 1. Extraemos y aseguramos que los objetivos sean números (float)
-            obj_mo = float(s_r.get(find_col(data['SERVICIOS'], ["OBJ", "MO"]), 1))
-            obj_rep = float(r_r.get(find_col(data['REPUESTOS'], ["OBJ", "FACT"]), 1))
-            
-            real_cj = get_cyp_total(cj_r, 'CyP JUJUY')
-            obj_cj = float(cj_r.get(find_col(data['CyP JUJUY'], ["OBJ", "FACT"]), 1))
-            
-            real_cs = get_cyp_total(cs_r, 'CyP SALTA')
-            obj_cs = float(cs_r.get(find_col(data['CyP SALTA'], ["OBJ", "FACT"]), 1))
+        def render_fila(celdas, anchos=None): st.markdown(fila_tarjetas(celdas, anchos), unsafe_allow_html=True)
 
+        # --- TAB 1: OBJETIVOS ---
+        if selected_tab == "🏠 Objetivos":
+            o = k.objetivos
             # 2. Imprimimos las 4 tarjetas originales arriba
             metas = [
-                ("M.O. Servicios", real_mo_total, obj_mo),
-                ("Repuestos", real_rep, obj_rep),
-                ("CyP Jujuy", real_cj, obj_cj),
-                ("CyP Salta", real_cs, obj_cs)
+                ("M.O. Servicios", o.real_mo_total, o.obj_mo),
+                ("Repuestos", o.real_rep, o.obj_rep),
+                ("CyP Jujuy", o.real_cj, o.obj_cj),
+                ("CyP Salta", o.real_cs, o.obj_cs)
             ]
-            for i, (tit, real, obj) in enumerate(metas):
-                with cols[i]: st.markdown(render_kpi_card(tit, real, obj, True), unsafe_allow_html=True)
+            render_fila([render_kpi_card(tit, real, obj, True) for tit, real, obj in metas])
 
             # --- NUEVA SECCIÓN: CONSOLIDADOS ---
             st.markdown("---")
             st.markdown("### 🎯 Resumen Consolidado")
             
-            # 3. Calculamos los Totales Autociel y Globales sumando las variables de arriba
-            real_autociel = real_mo_total + real_rep + real_cj
-            obj_autociel = obj_mo + obj_rep + obj_cj
-            
-            real_total_general = real_autociel + real_cs
-            obj_total_general = obj_autociel + obj_cs
-            
             # 4. Imprimimos las dos tarjetas grandes abajo
-            col_tot1, col_tot2 = st.columns(2)
-            
-            with col_tot1:
-                st.markdown(
-                    render_kpi_card("Total Autociel (MO + Repuestos + CyP Jujuy)", real_autociel, obj_autociel, True), 
-                    unsafe_allow_html=True
-                )
-                
-            with col_tot2:
-                st.markdown(
-                    render_kpi_card("Total General (Autociel + CyP Salta)", real_total_general, obj_total_general, True), 
-                    unsafe_allow_html=True
-                )
+            render_fila([
+                render_kpi_card("Total Autociel (MO + Repuestos + CyP Jujuy)", o.real_autociel, o.obj_autociel, True),
+                render_kpi_card("Total General (Autociel + CyP Salta)", o.real_total_general, o.obj_total_general, True)
+            ])
 
         elif selected_tab == "🛠️ Servicios y Taller":
             col_main, col_breakdown = st.columns([1, 2])
-            obj_mo_total = s_r.get(find_col(data['SERVICIOS'], ["OBJ", "MO"]), 1)
-            with col_main: st.markdown(render_kpi_card("Facturación M.O.", real_mo_total, obj_mo_total, show_daily=True), unsafe_allow_html=True)
+            sv, ta = k.servicios, k.taller
+            with col_main: st.markdown(render_kpi_card("Facturación M.O.", sv.real_mo_total, sv.obj_mo_total, show_daily=True), unsafe_allow_html=True)
             with col_breakdown:
-                df_mo = pd.DataFrame({"Cargo": ["Cliente", "Garantía", "Interno", "Terceros"], "Facturación": [val_cli, val_gar, val_int, val_ter]})
-                fig_mo = px.bar(df_mo, x="Facturación", y="Cargo", orientation='h', text_auto='.2s', title="", color="Cargo", color_discrete_sequence=["#00235d", "#28a745", "#ffc107", "#17a2b8"])
-                fig_mo.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=160) 
-                st.plotly_chart(fig_mo, use_container_width=True)
-
-            k1, k2, k3, k4, k5 = st.columns(5)
-            c_cpus = find_col(data['SERVICIOS'], ["CPUS"], exclude_keywords=["OBJ"])
-            c_tus_others = find_col(data['SERVICIOS'], ["OTROS", "CARGOS"], exclude_keywords=["OBJ"])
-            real_cpus = s_r.get(c_cpus, 0)
-            real_tus = real_cpus + s_r.get(c_tus_others, 0)
-            obj_cpus = s_r.get(find_col(data['SERVICIOS'], ['OBJ', 'CPUS']), 1)
-            obj_tus = s_r.get(find_col(data['SERVICIOS'], ['OBJ', 'TUS']), 1)
-            div = real_cpus if real_cpus > 0 else 1
-            tp_mo = real_mo_total / div
-            tgt_tp_mo = obj_mo_total / obj_cpus if obj_cpus > 0 else 0
-            
-            hf_cc = t_r.get(find_col(data['TALLER'], ["FACT", "CC"]), 0)
-            hf_cg = t_r.get(find_col(data['TALLER'], ["FACT", "CG"]), 0)
-            hf_ci = t_r.get(find_col(data['TALLER'], ["FACT", "CI"]), 0)
-            tp_hs = (hf_cc+hf_cg+hf_ci) / div
-            
-            v_rep_taller = r_r.get(find_col(data['REPUESTOS'], ["VENTA", "TALLER"], exclude_keywords=["OBJ"]), 0)
-            v_rep_gar = r_r.get(find_col(data['REPUESTOS'], ["VENTA", "GAR"], exclude_keywords=["OBJ"]), 0)
-            v_rep_int = r_r.get(find_col(data['REPUESTOS'], ["VENTA", "INT"], exclude_keywords=["OBJ"]), 0)
-            tp_rep = (v_rep_taller + v_rep_gar + v_rep_int) / div
-
-            with k1: st.markdown(render_kpi_card("TUS Total", real_tus, obj_tus, is_currency=False, show_daily=True), unsafe_allow_html=True)
-            with k2: st.markdown(render_kpi_card("CPUS (Entradas)", real_cpus, obj_cpus, is_currency=False, show_daily=True), unsafe_allow_html=True)
-            with k3: st.markdown(render_kpi_small("Ticket Prom. (Hs)", tp_hs, None, None, None, "{:.2f} hs"), unsafe_allow_html=True)
-            with k4: st.markdown(render_kpi_small("Ticket Prom. MO", tp_mo, tgt_tp_mo, None, None, "${:,.0f}"), unsafe_allow_html=True)
-            with k5: st.markdown(render_kpi_small("Ticket Prom. Rep", tp_rep, None, None, None, "${:,.0f}"), unsafe_allow_html=True)
+                def armar_fig_mo():
+                    df_mo = pd.DataFrame({"Cargo": ["Cliente", "Garantía", "Interno", "Terceros"], "Facturación": [sv.val_cli, sv.val_gar, sv.val_int, sv.val_ter]})
+                    fig_mo = px.bar(df_mo, x="Facturación", y="Cargo", orientation='h', text_auto='.2s', title="", color="Cargo", color_discrete_sequence=["#00235d", "#28a745", "#ffc107", "#17a2b8"])
+                    return fig_mo.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=160)
+                st.plotly_chart(figura("mo_por_cargo", huella, (año_sel, mes_sel), armar_fig_mo), use_container_width=True)
+
+            render_fila([
+                render_kpi_card("TUS Total", sv.real_tus, sv.obj_tus, is_currency=False, show_daily=True),
+                render_kpi_card("CPUS (Entradas)", sv.real_cpus, sv.obj_cpus, is_currency=False, show_daily=True),
+                render_kpi_small("Ticket Prom. (Hs)", sv.tp_hs, None, None, None, "{:.2f} hs"),
+                render_kpi_small("Ticket Prom. MO", sv.tp_mo, sv.tgt_tp_mo, None, None, "${:,.0f}"),
+                render_kpi_small("Ticket Prom. Rep", sv.tp_rep, None, None, None, "${:,.0f}")
+            ])
 
             st.markdown("---")
             st.markdown("### 🏆 Calidad e Incentivos de Marca")
-            val_prima_p = s_r.get(find_col(data['SERVICIOS'], ["PRIMA", "PEUGEOT"], exclude_keywords=["OBJ"]), 0)
-            val_prima_c = s_r.get(find_col(data['SERVICIOS'], ["PRIMA", "CITROEN"], exclude_keywords=["OBJ"]), 0)
-            obj_prima_p = s_r.get(find_col(data['SERVICIOS'], ["OBJ", "PRIMA", "PEUGEOT"]), 0)
-            obj_prima_c = s_r.get(find_col(data['SERVICIOS'], ["OBJ", "PRIMA", "CITROEN"]), 0)
-
-            def get_calidad_data(keyword_main, brand, is_percent=False, prorate_target=False):
-                c_real = find_col(data['SERVICIOS'], [keyword_main, brand], exclude_keywords=["OBJ"])
-                c_obj = find_col(data['SERVICIOS'], ["OBJ", keyword_main, brand])
-                if not c_obj: c_obj = find_col(data['SERVICIOS'], ["OBJ", keyword_main])
-                val_real = s_r.get(c_real, 0)
-                df_mes = data['SERVICIOS'][(data['SERVICIOS']['Año'] == año_sel) & (data['SERVICIOS']['Mes'] == mes_sel)]
-                if not df_mes.empty and c_obj: val_obj_mensual = df_mes[c_obj].max() 
-                else: val_obj_mensual = 0
-                val_proyeccion = val_real / prog_t if prog_t > 0 else 0
-                if prorate_target: val_obj_parcial = val_obj_mensual * prog_t
-                else: val_obj_parcial = val_obj_mensual; val_proyeccion = val_real 
-                if is_percent:
-                    if val_real > 1.0: val_real /= 100
-                    if val_obj_parcial > 1.0: val_obj_parcial /= 100
-                    if val_obj_mensual > 1.0: val_obj_mensual /= 100
-                    if val_proyeccion > 1.0: val_proyeccion /= 100
-                    fmt = "{:.1%}"
-                else: fmt = "{:,.0f}" if not prorate_target else "{:,.1f}" 
-                return val_real, val_obj_parcial, val_obj_mensual, val_proyeccion, fmt
-
-            nps_p_r, nps_p_p, nps_p_m, nps_p_proy, fmt_nps = get_calidad_data("NPS", "PEUGEOT", is_percent=False, prorate_target=False)
-            nps_c_r, nps_c_p, nps_c_m, nps_c_proy, _ = get_calidad_data("NPS", "CITROEN", is_percent=False, prorate_target=False)
-            vc_p_r, vc_p_p, vc_p_m, vc_p_proy, fmt_vc = get_calidad_data("VIDEO", "PEUGEOT", is_percent=False, prorate_target=True)
-            vc_c_r, vc_c_p, vc_c_m, vc_c_proy, _ = get_calidad_data("VIDEO", "CITROEN", is_percent=False, prorate_target=True)
-            ff_p_r, ff_p_p, ff_p_m, ff_p_proy, fmt_ff = get_calidad_data("FORFAIT", "PEUGEOT", is_percent=False, prorate_target=True)
-            ff_c_r, ff_c_p, ff_c_m, ff_c_proy, _ = get_calidad_data("FORFAIT", "CITROEN", is_percent=False, prorate_target=True)
+            # Formato de cada indicador de calidad: NPS en puntos, Videocheck y Forfait con un decimal
+            fmt_nps, fmt_vc, fmt_ff = "{:,.0f}", "{:,.1f}", "{:,.1f}"
 
             c_peugeot, c_citroen = st.columns(2)
             with c_peugeot:
                 st.markdown("#### 🦁 Peugeot")
-                st.markdown(render_kpi_small("NPS", nps_p_r, nps_p_p, None, None, fmt_nps, label_target="Obj"), unsafe_allow_html=True)
-                p_row = st.columns(2)
-                with p_row[0]: st.markdown(render_kpi_small("Videocheck", vc_p_r, vc_p_p, vc_p_m, vc_p_proy, fmt_vc), unsafe_allow_html=True)
-                with p_row[1]: st.markdown(render_kpi_small("Forfait", ff_p_r, ff_p_p, ff_p_m, ff_p_proy, fmt_ff), unsafe_allow_html=True)
-                
-                pct_prima_p = (val_prima_p / obj_prima_p * 100) if obj_prima_p > 0 else 0
-                color_pct_p = "#28a745" if pct_prima_p >= 90 else ("#ffc107" if pct_prima_p >= 50 else "#dc3545")
-                st.markdown(f'<div style="background-color: #f8f9fa; border: 1px solid #dee2e6; border-radius: 5px; padding: 10px; margin-top: 10px; text-align: center;"><p style="margin: 0; color: #666; font-size: 0.75rem; font-weight: bold; text-transform: uppercase;">Posible Cobro Peugeot</p><p style="margin: 0; color: #00235d; font-size: 1.2rem; font-weight: bold;">${val_prima_p:,.0f}</p><div style="display:flex; justify-content:center; align-items:center; gap: 10px; margin-top: 4px;"><span style="color: #999; font-size: 0.75rem;">Potencial: ${obj_prima_p:,.0f}</span><span style="background-color: {color_pct_p}20; color: {color_pct_p}; padding: 2px 6px; border-radius: 4px; font-weight: bold; font-size: 0.8rem;">{pct_prima_p:.1f}% Alcanzado</span></div></div>', unsafe_allow_html=True)
+                # NPS, Videocheck/Forfait y la prima de la marca: una sola sección
+                st.markdown(pila_tarjetas([
+                    render_kpi_small("NPS", sv.nps_p.real, sv.nps_p.obj_parcial, None, None, fmt_nps, label_target="Obj"),
+                    fila_tarjetas([
+                        render_kpi_small("Videocheck", sv.vc_p.real, sv.vc_p.obj_parcial, sv.vc_p.obj_mes, sv.vc_p.proyeccion, fmt_vc),
+                        render_kpi_small("Forfait", sv.ff_p.real, sv.ff_p.obj_parcial, sv.ff_p.obj_mes, sv.ff_p.proyeccion, fmt_ff)
+                    ]),
+                    tarjeta_prima("Peugeot", sv.val_prima_p, sv.obj_prima_p, sv.pct_prima_p)
+                ]), unsafe_allow_html=True)
 
             with c_citroen:
                 st.markdown("#### 🔴 Citroën")
-                st.markdown(render_kpi_small("NPS", nps_c_r, nps_c_p, None, None, fmt_nps, label_target="Obj"), unsafe_allow_html=True)
-                c_row = st.columns(2)
-                with c_row[0]: st.markdown(render_kpi_small("Videocheck", vc_c_r, vc_c_p, vc_c_m, vc_c_proy, fmt_vc), unsafe_allow_html=True)
-                with c_row[1]: st.markdown(render_kpi_small("Forfait", ff_c_r, ff_c_p, ff_c_m, ff_c_proy, fmt_ff), unsafe_allow_html=True)
-                
-                pct_prima_c = (val_prima_c / obj_prima_c * 100) if obj_prima_c > 0 else 0
-                color_pct_c = "#28a745" if pct_prima_c >= 90 else ("#ffc107" if pct_prima_c >= 50 else "#dc3545")
-                st.markdown(f'<div style="background-color: #f8f9fa; border: 1px solid #dee2e6; border-radius: 5px; padding: 10px; margin-top: 10px; text-align: center;"><p style="margin: 0; color: #666; font-size: 0.75rem; font-weight: bold; text-transform: uppercase;">Posible Cobro Citroën</p><p style="margin: 0; color: #00235d; font-size: 1.2rem; font-weight: bold;">${val_prima_c:,.0f}</p><div style="display:flex; justify-content:center; align-items:center; gap: 10px; margin-top: 4px;"><span style="color: #999; font-size: 0.75rem;">Potencial: ${obj_prima_c:,.0f}</span><span style="background-color: {color_pct_c}20; color: {color_pct_c}; padding: 2px 6px; border-radius: 4px; font-weight: bold; font-size: 0.8rem;">{pct_prima_c:.1f}% Alcanzado</span></div></div>', unsafe_allow_html=True)
+                # NPS, Videocheck/Forfait y la prima de la marca: una sola sección
+                st.markdown(pila_tarjetas([
+                    render_kpi_small("NPS", sv.nps_c.real, sv.nps_c.obj_parcial, None, None, fmt_nps, label_target="Obj"),
+                    fila_tarjetas([
+                        render_kpi_small("Videocheck", sv.vc_c.real, sv.vc_c.obj_parcial, sv.vc_c.obj_mes, sv.vc_c.proyeccion, fmt_vc),
+                        render_kpi_small("Forfait", sv.ff_c.real, sv.ff_c.obj_parcial, sv.ff_c.obj_mes, sv.ff_c.proyeccion, fmt_ff)
+                    ]),
+                    tarjeta_prima("Citroën", sv.val_prima_c, sv.obj_prima_c, sv.pct_prima_c)
+                ]), unsafe_allow_html=True)
             
             st.markdown("---")
             st.markdown("### ⚙️ Taller")
-            col_tecs = find_col(data['TALLER'], ["TECNICOS"], exclude_keywords=["PROD"])
-            if not col_tecs: col_tecs = find_col(data['TALLER'], ["DOTACION"])
-            cant_tecs = t_r.get(col_tecs, 6) 
-            if cant_tecs == 0: cant_tecs = 6
-            ht_cc = t_r.get(find_col(data['TALLER'], ["TRAB", "CC"]), 0)
-            ht_cg = t_r.get(find_col(data['TALLER'], ["TRAB", "CG"]), 0)
-            ht_ci = t_r.get(find_col(data['TALLER'], ["TRAB", "CI"]), 0)
-            ef_cc = hf_cc / ht_cc if ht_cc > 0 else 0
-            ef_cg = hf_cg / ht_cg if ht_cg > 0 else 0
-            ef_ci = hf_ci / ht_ci if ht_ci > 0 else 0
-            ef_gl = (hf_cc+hf_cg+hf_ci) / (ht_cc+ht_cg+ht_ci) if (ht_cc+ht_cg+ht_ci) > 0 else 0
-            hs_disp = t_r.get(find_col(data['TALLER'], ["DISPONIBLES", "REAL"]), 0)
-            hs_teoricas = cant_tecs * 8 * d_t 
-            presencia = hs_disp / hs_teoricas if hs_teoricas > 0 else 0
-            ocup = (ht_cc+ht_cg+ht_ci) / hs_disp if hs_disp > 0 else 0
-            prod = t_r.get(find_col(data['TALLER'], ["PRODUCTIVIDAD", "TALLER"]), 0)
-            if prod > 2: prod /= 100
-
-            e1, e2, e3, e4 = st.columns(4)
-            with e1: st.markdown(render_kpi_small("Eficiencia CC", ef_cc, 1.0), unsafe_allow_html=True)
-            with e2: st.markdown(render_kpi_small("Eficiencia Gar.", ef_cg, 1.0), unsafe_allow_html=True)
-            with e3: st.markdown(render_kpi_small("Eficiencia Int.", ef_ci, 0.20), unsafe_allow_html=True)
-            with e4: st.markdown(render_kpi_small("Eficiencia Global", ef_gl, 0.85), unsafe_allow_html=True)
-
-            u1, u2, u3 = st.columns(3)
-            with u1: st.markdown(render_kpi_small("Presencia", presencia, 0.95), unsafe_allow_html=True)
-            with u2: st.markdown(render_kpi_small("Ocupación", ocup, 0.95), unsafe_allow_html=True)
-            with u3: st.markdown(render_kpi_small("Productividad", prod, 0.95), unsafe_allow_html=True)
+            render_fila([
+                render_kpi_small("Eficiencia CC", ta.ef_cc, 1.0),
+                render_kpi_small("Eficiencia Gar.", ta.ef_cg, 1.0),
+                render_kpi_small("Eficiencia Int.", ta.ef_ci, 0.20),
+                render_kpi_small("Eficiencia Global", ta.ef_gl, 0.85)
+            ])
+
+            render_fila([
+                render_kpi_small("Presencia", ta.presencia, 0.95),
+                render_kpi_small("Ocupación", ta.ocup, 0.95),
+                render_kpi_small("Productividad", ta.prod, 0.95)
+            ])
 
             g1, g2 = st.columns(2)
-            with g1: st.plotly_chart(px.pie(values=[ht_cc, ht_cg, ht_ci], names=["CC", "CG", "CI"], hole=0.4, title="Hs Trabajadas"), use_container_width=True)
-            with g2: st.plotly_chart(px.pie(values=[hf_cc, hf_cg, hf_ci], names=["CC", "CG", "CI"], hole=0.4, title="Hs Facturadas"), use_container_width=True)
+            with g1: st.plotly_chart(figura("hs_trabajadas", huella, (año_sel, mes_sel), lambda: px.pie(values=[ta.ht_cc, ta.ht_cg, ta.ht_ci], names=["CC", "CG", "CI"], hole=0.4, title="Hs Trabajadas")), use_container_width=True)
+            with g2: st.plotly_chart(figura("hs_facturadas", huella, (año_sel, mes_sel), lambda: px.pie(values=[ta.hf_cc, ta.hf_cg, ta.hf_ci], names=["CC", "CG", "CI"], hole=0.4, title="Hs Facturadas")), use_container_width=True)
 
             # --- MÓDULO WIP ---
             st.markdown("---")
             st.markdown("### 📂 Gestión de Órdenes Abiertas (WIP)")
             
             if 'WIP' in data and not data['WIP'].empty:
-                df_w = preparar_wip_desde_sheet(data['WIP'])
-                
-                if df_w is not None and not df_w.empty:
-                    lista_asesores = sorted(df_w['Nombre_Asesor'].unique().tolist())
+                # Cubo armado una vez por versión de la hoja (y día): cambiar de asesor son consultas
+                cw = cubo_wip(data['WIP'], indice, huellas.get('WIP'))
+
+                if cw is not None:
+                    def volver_a_pagina_1(): st.session_state.wip_pagina = 1  # Cambió el filtro o el orden de la tabla de detalle
                     col_filtro, col_metricas_mini = st.columns([1, 3])
                     with col_filtro:
-                        asesor_seleccionado = st.selectbox("👤 Filtrar por Asesor:", ["Todos"] + lista_asesores)
-                    
-                    df_filtrado = df_w[df_w['Nombre_Asesor'] == asesor_seleccionado] if asesor_seleccionado != "Todos" else df_w
-
-                    f_plata = df_filtrado['Saldo'].sum()
-                    f_autos = df_filtrado['Identificador'].nunique()
-                    f_mec = df_filtrado[df_filtrado['Tipo_Taller'] == 'Mecánica']
-                    f_cyp = df_filtrado[df_filtrado['Tipo_Taller'] == 'Chapa y Pintura']
-                    f_plata_mec = f_mec['Saldo'].sum()
-                    f_autos_mec = f_mec['Identificador'].nunique()
-                    f_plata_cyp = f_cyp['Saldo'].sum()
-                    f_autos_cyp = f_cyp['Identificador'].nunique()
-
-                    kw1, kw2, kw3, kw4 = st.columns(4)
-                    with kw1: st.markdown(f'<div class="metric-card"><div style="font-size:0.85rem; color:#666; font-weight:600;">Dinero Abierto ({asesor_seleccionado})</div><div style="font-size:1.5rem; color:#00235d; font-weight:bold; margin-top:5px;">${f_plata:,.0f}</div><div style="font-size:0.75rem; color:#888;">Saldo pendiente</div></div>', unsafe_allow_html=True)
-                    with kw2: st.markdown(f'<div class="metric-card"><div style="font-size:0.85rem; color:#666; font-weight:600;">Autos en Taller ({asesor_seleccionado})</div><div style="font-size:1.8rem; color:#00235d; font-weight:bold; margin-top:5px;">{f_autos}</div><div style="font-size:0.75rem; color:#888;">Vehículos físicos</div></div>', unsafe_allow_html=True)
-                    with kw3: st.markdown(f'<div class="metric-card"><div style="font-size:0.85rem; color:#666; font-weight:600;">Mecánica</div><div style="font-size:1.2rem; color:#00235d; font-weight:bold; margin-top:5px;">${f_plata_mec:,.0f}</div><div style="font-size:0.8rem; color:#28a745; font-weight:bold; margin-top:2px;">🚗 {f_autos_mec} autos</div></div>', unsafe_allow_html=True)
-                    with kw4: st.markdown(f'<div class="metric-card"><div style="font-size:0.85rem; color:#666; font-weight:600;">Chapa y Pintura</div><div style="font-size:1.2rem; color:#00235d; font-weight:bold; margin-top:5px;">${f_plata_cyp:,.0f}</div><div style="font-size:0.8rem; color:#17a2b8; font-weight:bold; margin-top:2px;">🚙 {f_autos_cyp} autos</div></div>', unsafe_allow_html=True)
+                        asesor_seleccionado = st.selectbox("👤 Filtrar por Asesor:", ["Todos"] + cw.asesores, on_change=volver_a_pagina_1)
+
+                    rw = cw.resumen(asesor_seleccionado)
+
+                    render_fila([
+                        tarjeta_dato(f"Dinero Abierto ({asesor_seleccionado})", f"${rw.total.saldo:,.0f}", "Saldo pendiente"),
+                        tarjeta_dato(f"Autos en Taller ({asesor_seleccionado})", rw.total.autos, "Vehículos físicos", tamaño="1.8rem"),
+                        tarjeta_dato("Mecánica", f"${rw.mecanica.saldo:,.0f}", f"🚗 {rw.mecanica.autos} autos", tamaño="1.2rem",
+                                     estilo_pie="font-size:0.8rem; color:#28a745; font-weight:bold; margin-top:2px;"),
+                        tarjeta_dato("Chapa y Pintura", f"${rw.cyp.saldo:,.0f}", f"🚙 {rw.cyp.autos} autos", tamaño="1.2rem",
+                                     estilo_pie="font-size:0.8rem; color:#17a2b8; font-weight:bold; margin-top:2px;")
+                    ])
                     
                     col_graf_asesor, col_graf_cargo = st.columns([2, 1])
                     with col_graf_asesor:
                         st.markdown("##### 👥 Saldo Abierto por Asesor (Ranking Global)")
-                        df_asesor = df_w.groupby('Nombre_Asesor').agg(Dinero=('Saldo', 'sum'), Autos=('Identificador', 'nunique')).reset_index().sort_values('Dinero', ascending=True)
-                        df_asesor['Etiqueta'] = df_asesor.apply(lambda x: f"{x['Autos']} autos (${x['Dinero']/1000:.0f}k)", axis=1)
-                        fig_wip = px.bar(df_asesor, x='Dinero', y='Nombre_Asesor', text='Etiqueta', orientation='h', title="", color='Dinero', color_continuous_scale='Blues')
-                        fig_wip.update_traces(textposition='outside')
-                        fig_wip.update_layout(height=500, xaxis_title="Monto ($)", yaxis_title="")
-                        st.plotly_chart(fig_wip, use_container_width=True)
+                        def armar_fig_wip():
+                            fig_wip = px.bar(cw.ranking, x='Dinero', y='Nombre_Asesor', text='Etiqueta', orientation='h', title="", color='Dinero', color_continuous_scale='Blues')
+                            fig_wip.update_traces(textposition='outside')
+                            return fig_wip.update_layout(height=500, xaxis_title="Monto ($)", yaxis_title="")
+                        st.plotly_chart(figura("wip_ranking", huellas.get('WIP'), (), armar_fig_wip), use_container_width=True)
 
                     with col_graf_cargo:
                         st.markdown(f"##### 📊 Cantidad por Cargo ({asesor_seleccionado})")
-                        df_filtrado['Codigo_Cargo'] = df_filtrado['Tipo'].astype(str).str.split().str[0]
-                        df_cargos = df_filtrado.groupby('Codigo_Cargo').agg(Cantidad=('Identificador', 'count'), Dinero=('Saldo', 'sum')).reset_index().sort_values('Cantidad', ascending=True)
-                        fig_cargos = px.bar(df_cargos, x='Cantidad', y='Codigo_Cargo', text='Cantidad', orientation='h', title="", hover_data={'Dinero':':$,.0f'}, color='Cantidad', color_continuous_scale='Reds')
-                        fig_cargos.update_layout(height=500, xaxis_title="Cant. Órdenes", yaxis_title="", showlegend=False)
-                        st.plotly_chart(fig_cargos, use_container_width=True)
+                        def armar_fig_cargos():
+                            fig_cargos = px.bar(cw.cargos(asesor_seleccionado), x='Cantidad', y='Codigo_Cargo', text='Cantidad', orientation='h', title="", hover_data={'Dinero':':$,.0f'}, color='Cantidad', color_continuous_scale='Reds')
+                            return fig_cargos.update_layout(height=500, xaxis_title="Cant. Órdenes", yaxis_title="", showlegend=False)
+                        st.plotly_chart(figura("wip_cargos", huellas.get('WIP'), (asesor_seleccionado,), armar_fig_cargos), use_container_width=True)
                     
                     st.markdown(f"##### 📋 Detalle de Autos: {asesor_seleccionado}")
-                    cols_ver = ['Ref.OR', 'Fecha_Alta', 'Tipo', 'Nombre_Asesor', 'Identificador', 'Modelo', 'Saldo']
-                    cols_finales = [c for c in cols_ver if c in df_filtrado.columns]
-                    st.dataframe(df_filtrado[cols_finales].style.format({'Saldo': "${:,.2f}", 'Fecha_Alta': '{:%d-%m-%Y}'}), use_container_width=True)
+                    # Filtros, orden y paginado del lado del servidor: al navegador sólo viaja la página visible
+                    d1, d2, d3, d4 = st.columns([2, 2, 2, 1])
+                    with d1: texto_wip = st.text_input("🔎 Matrícula / VIN", key="wip_texto", on_change=volver_a_pagina_1)
+                    with d2: cargos_wip = st.multiselect("Código de cargo", cw.codigos_cargo, key="wip_cargos", on_change=volver_a_pagina_1)
+                    with d3:
+                        dias_wip = st.slider("Días abierta", 0, max(cw.max_dias, 1), (0, max(cw.max_dias, 1)), on_change=volver_a_pagina_1)
+                    with d4:
+                        orden_wip = st.selectbox("Ordenar por", ["Orden de la hoja", "Saldo", "Dias_Abierta", "Fecha_Alta", "Identificador", "Nombre_Asesor", "Ref.OR"], key="wip_orden", on_change=volver_a_pagina_1)
+                        desc_wip = st.checkbox("Descendente", value=True, key="wip_desc", on_change=volver_a_pagina_1)
+                    filtro_dias = None if dias_wip == (0, max(cw.max_dias, 1)) else dias_wip
+                    filtradas_wip = cw.filtrar(asesor_seleccionado, texto_wip, filtro_dias, cargos_wip)
+                    # La página vive sólo en el estado (los filtros la vuelven a 1) y se acota antes de crear el widget:
+                    # el número, el pie y las filas muestran siempre la misma página
+                    paginas_wip = contar_paginas(len(filtradas_wip))
+                    st.session_state.setdefault("wip_pagina", 1)
+                    st.session_state.wip_pagina = min(max(1, int(st.session_state.wip_pagina)), paginas_wip)
+                    p1, p2 = st.columns([1, 5])
+                    with p1: pagina_wip = st.number_input("Página", min_value=1, max_value=paginas_wip, key="wip_pagina")
+                    filas_wip, pagina_wip, paginas_wip = paginar(filtradas_wip, orden_wip if orden_wip != "Orden de la hoja" else None, desc_wip, int(pagina_wip))
+                    with p2: st.caption(f"{len(filtradas_wip):,} órdenes · página {pagina_wip} de {paginas_wip}")
+                    st.dataframe(filas_wip, use_container_width=True, hide_index=True, column_config={
+                        'Saldo': st.column_config.NumberColumn(format="dollar"),
+                        'Fecha_Alta': st.column_config.DateColumn(format="DD-MM-YYYY"),
+                        'Dias_Abierta': st.column_config.NumberColumn("Días", format="%d"),
+                    })
                 else:
                     st.warning("⚠️ La hoja 'WIP' está vacía o no tiene las columnas correctas.")
             else:
@@ -738,132 +513,36 @@ try:
         elif selected_tab == "📦 Repuestos":
             st.markdown("### 📦 Repuestos")
             
-            c_primas = find_col(data['REPUESTOS'], ['PRIMA']) or find_col(data['REPUESTOS'], ['RAPPEL'])
-            primas_input = float(r_r.get(c_primas, 0.0)) if c_primas else 0.0
+            rp = k.repuestos
+            primas_input, df_r = rp.primas_input, rp.df_r
+            vta_total_bruta, vta_total_neta, obj_rep_total = rp.vta_total_bruta, rp.vta_total_neta, rp.obj_rep_total
+            util_total_final, mg_total_final, val_stock = rp.util_total_final, rp.mg_total_final, rp.val_stock
             
             st.markdown(f'<div style="background-color: #eef2f7; padding: 10px; border-radius: 5px; border-left: 4px solid #6f42c1; margin-bottom: 15px;"><span style="color:#00235d; font-weight:bold;">💰 Primas/Rappels del Mes:</span> <span style="color:#28a745; font-weight:bold; font-size:1.1rem;">${primas_input:,.0f}</span> <span style="color:#666; font-size:0.8rem;">(Dato leído automáticamente de la planilla)</span></div>', unsafe_allow_html=True)
-            detalles = []
-            for c in canales_repuestos:
-                v_col = find_col(data['REPUESTOS'], ["VENTA", c], exclude_keywords=["OBJ"])
-                if v_col:
-                    vb = r_r.get(v_col, 0)
-                    d = r_r.get(find_col(data['REPUESTOS'], ["DESC", c]), 0)
-                    cost = r_r.get(find_col(data['REPUESTOS'], ["COSTO", c]), 0)
-                    vn = vb - d
-                    ut = vn - cost
-                    detalles.append({"Canal": c, "Venta Bruta": vb, "Desc.": d, "Venta Neta": vn, "Costo": cost, "Utilidad $": ut, "Margen %": (ut/vn if vn>0 else 0)})
-            df_r = pd.DataFrame(detalles)
-            
-            vta_total_bruta = df_r['Venta Bruta'].sum() if not df_r.empty else 0
-            vta_total_neta = df_r['Venta Neta'].sum() if not df_r.empty else 0
-            
-            if vta_total_neta > 0:
-                df_r['% Part.'] = df_r['Venta Neta'] / vta_total_neta
-            else:
-                df_r['% Part.'] = 0.0
-
-            util_total_operativa = df_r['Utilidad $'].sum() if not df_r.empty else 0
-            util_total_final = util_total_operativa + primas_input
-            mg_total_final = util_total_final / vta_total_neta if vta_total_neta > 0 else 0
-            obj_rep_total = r_r.get(find_col(data['REPUESTOS'], ["OBJ", "FACT"]), 1)
-            
-            costo_total_mes_actual_real = df_r['Costo'].sum() if not df_r.empty else 0
-            
-            val_stock = float(r_r.get(find_col(data['REPUESTOS'], ["VALOR", "STOCK"]), 0))
-            
-            desc_total = df_r['Desc.'].sum() if not df_r.empty else 0
-            ganancia_primaria = vta_total_neta - costo_total_mes_actual_real
-            pct_margen_primario = (ganancia_primaria / vta_total_bruta) * 100 if vta_total_bruta > 0 else 0.0
-            
-            ganancia_secundaria = ganancia_primaria + primas_input
-            pct_margen_secundario = (ganancia_secundaria / vta_total_bruta) * 100 if vta_total_bruta > 0 else 0.0
-
             st.markdown("#### 📊 Análisis Financiero y Márgenes")
             
-            c_r1, c_r2, c_r3, c_r4 = st.columns(4)
             def formato_p(val): return "${:,.0f}".format(val).replace(",", ".")
             
-            c_r1.markdown(f'<div class="metric-card"><div class="metric-title">Venta Bruta</div><div class="metric-value-money" style="color:#00235d;">{formato_p(vta_total_bruta)}</div></div>', unsafe_allow_html=True)
-            c_r2.markdown(f'<div class="metric-card"><div class="metric-title">Costo Repuestos</div><div class="metric-value-money" style="color:#dc3545;">{formato_p(costo_total_mes_actual_real)}</div></div>', unsafe_allow_html=True)
-            c_r3.markdown(f'<div class="metric-card"><div class="metric-title">Margen Bruto Primario</div><div class="metric-value-money" style="color:#28a745;">{formato_p(ganancia_primaria)}</div></div>', unsafe_allow_html=True)
-            c_r4.markdown(f'<div class="metric-card"><div class="metric-title">% Margen Primario</div><div class="metric-value-number" style="color:#17a2b8;">{pct_margen_primario:.2f}%</div><div class="metric-subtitle-gray">Sobre Venta Bruta</div></div>', unsafe_allow_html=True)
+            render_fila([
+                tarjeta_metrica("Venta Bruta", formato_p(rp.vta_total_bruta), "#00235d"),
+                tarjeta_metrica("Costo Repuestos", formato_p(rp.costo_total_mes_actual_real), "#dc3545"),
+                tarjeta_metrica("Margen Bruto Primario", formato_p(rp.ganancia_primaria), "#28a745"),
+                tarjeta_metrica("% Margen Primario", f"{rp.pct_margen_primario:.2f}%", "#17a2b8", clase="number", subtitulo="Sobre Venta Bruta")
+            ])
             
             st.markdown("<br>", unsafe_allow_html=True)
 
-            c_s1, c_s2, c_s3, c_s4 = st.columns(4)
-            c_s1.markdown(f'<div class="metric-card"><div class="metric-title">Descuentos Otorgados</div><div class="metric-value-money" style="color:#fd7e14;">{formato_p(desc_total)}</div></div>', unsafe_allow_html=True)
-            c_s2.markdown(f'<div class="metric-card"><div class="metric-title">Incentivos / Primas</div><div class="metric-value-money" style="color:#6f42c1;">{formato_p(primas_input)}</div></div>', unsafe_allow_html=True)
-            c_s3.markdown(f'<div class="metric-card" style="border: 2px solid #28a745; background-color: #f8f9fa;"><div class="metric-title">Margen Bruto Secundario</div><div class="metric-value-money" style="color:#28a745;">{formato_p(ganancia_secundaria)}</div></div>', unsafe_allow_html=True)
-            c_s4.markdown(f'<div class="metric-card" style="border: 2px solid #17a2b8; background-color: #f8f9fa;"><div class="metric-title">% Margen Secundario</div><div class="metric-value-number" style="color:#17a2b8;">{pct_margen_secundario:.2f}%</div><div class="metric-subtitle-gray">Flujo Real (S/ Bruta)</div></div>', unsafe_allow_html=True)
+            render_fila([
+                tarjeta_metrica("Descuentos Otorgados", formato_p(rp.desc_total), "#fd7e14"),
+                tarjeta_metrica("Incentivos / Primas", formato_p(primas_input), "#6f42c1"),
+                tarjeta_metrica("Margen Bruto Secundario", formato_p(rp.ganancia_secundaria), "#28a745", borde="#28a745"),
+                tarjeta_metrica("% Margen Secundario", f"{rp.pct_margen_secundario:.2f}%", "#17a2b8", clase="number", subtitulo="Flujo Real (S/ Bruta)", borde="#17a2b8")
+            ])
             
             st.markdown("---")
             
             st.markdown("#### 📦 Gestión de Stock y Objetivos")
-            c_obj, c_stk = st.columns(2)
-            with c_obj:
-                st.markdown(render_kpi_card("Cumplimiento Objetivo Ventas", vta_total_bruta, obj_rep_total), unsafe_allow_html=True)
-            
-            with c_stk:
-                def obtener_costo_mes_historico(d_target):
-                    df_h = data['REPUESTOS']
-                    rows = df_h[(df_h['Año'] == d_target.year) & (df_h['Mes'] == d_target.month)]
-                    if rows.empty: return 0.0
-                    last_row = rows.iloc[-1]
-                    total_c = 0
-                    for ch in canales_repuestos:
-                        col_c = find_col(df_h, ["COSTO", ch], exclude_keywords=["OBJ"])
-                        if col_c: 
-                            try: total_c += float(last_row[col_c])
-                            except: pass
-                    return total_c
-
-                date_curr = datetime(año_sel, mes_sel, 1) 
-                date_prev1 = (date_curr - timedelta(days=1)).replace(day=1) 
-                date_prev2 = (date_prev1 - timedelta(days=1)).replace(day=1) 
-                
-                costo_mes_minus_1 = obtener_costo_mes_historico(date_prev1) 
-                costo_mes_minus_2 = obtener_costo_mes_historico(date_prev2)
-                
-                if prog_t > 0:
-                    costo_mes_actual_proy = costo_total_mes_actual_real / prog_t
-                else:
-                    costo_mes_actual_proy = costo_total_mes_actual_real 
-
-                suma_trimestral = costo_mes_minus_2 + costo_mes_minus_1 + costo_mes_actual_proy
-                promedio_costo_3m = suma_trimestral / 3 if suma_trimestral > 0 else 0
-
-                if promedio_costo_3m > 0:
-                    meses_stock = val_stock / promedio_costo_3m
-                else:
-                    meses_stock = 0
-                
-                color_stk = "#dc3545" 
-                icon_stk = "🛑"
-                estado_txt = "Crítico"
-                
-                if meses_stock <= 3.0:
-                    color_stk = "#28a745"
-                    icon_stk = "✅"
-                    estado_txt = "Óptimo"
-                elif meses_stock <= 5.0:
-                    color_stk = "#ffc107"
-                    icon_stk = "⚠️"
-                    estado_txt = "Medio"
-                
-                html_stock = f'''
-                <div class="metric-card" style="padding: 18px;">
-                    <div>
-                        <p style="color:#666; font-size:0.9rem; margin-bottom:5px; font-weight: bold;">Meses Stock (Prom 3M)</p>
-                        <h3 style="color:{color_stk}; margin:0; font-size:1.8rem;">{meses_stock:.2f}</h3>
-                        <div style="height:10px;"></div>
-                    </div>
-                    <div class="metric-footer" style="font-size: 0.85rem;">
-                        <div>Obj: <b>3.0</b></div>
-                        <div style="color:{color_stk}">{icon_stk} Est: <b>{estado_txt}</b></div>
-                    </div>
-                </div>
-                '''
-                st.markdown(html_stock, unsafe_allow_html=True)
+            render_fila([render_kpi_card("Cumplimiento Objetivo Ventas", vta_total_bruta, obj_rep_total), tarjeta_meses_stock(rp.meses_stock)])
 
             if not df_r.empty:
                 st.markdown("##### 📊 Rentabilidad y Costos por Canal")
@@ -912,72 +591,22 @@ try:
             
             c1, c2 = st.columns(2)
             with c1: 
-                if not df_r.empty: st.plotly_chart(px.pie(df_r, values="Venta Bruta", names="Canal", hole=0.4, title="Participación (Venta Bruta)"), use_container_width=True)
+                if not df_r.empty: st.plotly_chart(figura("rep_participacion", huella, (año_sel, mes_sel), lambda: px.pie(df_r, values="Venta Bruta", names="Canal", hole=0.4, title="Participación (Venta Bruta)")), use_container_width=True)
             with c2:
-                p_vivo = float(r_r.get(find_col(data['REPUESTOS'], ["VIVO"]), 0))
-                p_obs = float(r_r.get(find_col(data['REPUESTOS'], ["OBSOLETO"]), 0))
-                p_muerto = float(r_r.get(find_col(data['REPUESTOS'], ["MUERTO"]), 0))
+                p_vivo, p_obs, p_muerto = rp.p_vivo, rp.p_obs, rp.p_muerto
                 f = 1 if p_vivo <= 1 else 100
                 df_s = pd.DataFrame({"Estado": ["Vivo", "Obsoleto", "Muerto"], "Valor": [val_stock*(p_vivo/f), val_stock*(p_obs/f), val_stock*(p_muerto/f)]})
-                st.plotly_chart(px.pie(df_s, values="Valor", names="Estado", hole=0.4, title="Salud del Stock", color="Estado", color_discrete_map={"Vivo": "#28a745", "Obsoleto": "#ffc107", "Muerto": "#dc3545"}), use_container_width=True)
+                st.plotly_chart(figura("rep_salud_stock", huella, (año_sel, mes_sel), lambda: px.pie(df_s, values="Valor", names="Estado", hole=0.4, title="Salud del Stock", color="Estado", color_discrete_map={"Vivo": "#28a745", "Obsoleto": "#ffc107", "Muerto": "#dc3545"})), use_container_width=True)
                 st.markdown(f'<div style="border: 1px solid #e6e9ef; border-radius: 5px; padding: 10px; text-align: center; background-color: #ffffff; margin-top: 10px;"><p style="margin: 0; color: #666; font-size: 0.8rem; text-transform: uppercase; font-weight: bold;">Valoración Total Stock</p><p style="margin: 0; color: #00235d; font-size: 1.2rem; font-weight: bold;">${val_stock:,.0f}</p></div>', unsafe_allow_html=True)
             
             st.markdown("---")
             st.markdown("#### 📉 Control de Flujo: Compras vs Costo de Venta")
             
-            col_compra_sheet = find_col(data['REPUESTOS'], ["COMPRA"], exclude_keywords=["OBJ", "COSTO", "VENTA"])
-            if not col_compra_sheet:
-                col_compra_sheet = find_col(data['REPUESTOS'], ["ENTRADA"], exclude_keywords=["OBJ", "COSTO", "VENTA"])
-            if not col_compra_sheet:
-                col_compra_sheet = find_col(data['REPUESTOS'], ["COMPRAS"], exclude_keywords=["OBJ", "COSTO", "VENTA"])
-
-            compra_real_sheet = float(r_r.get(col_compra_sheet, 0)) if col_compra_sheet else 0.0
-
-            col_obj_term_in, _ = st.columns([1, 2])
-            with col_obj_term_in:
-                obj_compra_terminal = st.number_input("🎯 Objetivo Compra Stellantis ($)", min_value=0.0, step=1000000.0, value=0.0)
-
-            costo_venta_total = df_r['Costo'].sum() if not df_r.empty else 0
-            diferencia_flujo = compra_real_sheet - costo_venta_total
-            
-            ratio_reduccion = costo_venta_total / compra_real_sheet if compra_real_sheet > 0 else 0
-            objetivo_ratio = 1.20 
-
-            k_f1, k_f2, k_f3 = st.columns(3)
-            k_f1.metric("Compra Real (Sheet)", f"${compra_real_sheet:,.0f}", help="Dato tomado de Columna AB del Excel")
-            k_f2.metric("Costo de Venta Total", f"${costo_venta_total:,.0f}")
-            
-            if diferencia_flujo > 0:
-                k_f3.metric("Flujo de Stock", f"+${diferencia_flujo:,.0f}", "📈 Stock Subiendo", delta_color="inverse")
-            else:
-                k_f3.metric("Flujo de Stock", f"-${abs(diferencia_flujo):,.0f}", "📉 Stock Bajando", delta_color="normal")
-
-            st.markdown("##### 🚦 Semáforo de Reducción")
-            if compra_real_sheet == 0:
-                st.warning("⚠️ No se detectaron compras en la columna del Excel (Busco columnas llamadas 'COMPRA' o 'ENTRADA').")
-            else:
-                if ratio_reduccion >= objetivo_ratio:
-                    st.success(f"✅ **OBJETIVO CUMPLIDO:** Estás vendiendo un {((ratio_reduccion-1)*100):.1f}% más de lo que compras (Meta: 20%). El stock baja correctamente.")
-                elif ratio_reduccion > 1.0:
-                    st.info(f"⚠️ **ALERTA LEVE:** El stock baja, pero lento. Vendes solo un {((ratio_reduccion-1)*100):.1f}% más de lo que compras (Meta: 20%).")
-                else:
-                    st.error(f"❌ **ALERTA CRÍTICA:** Estás comprando más de lo que vendes. El stock está subiendo.")
-
-            piso_scoring = obj_compra_terminal * 0.60
-            if obj_compra_terminal > 0:
-                st.caption(f"Referencia Scoring: Debes comprar al menos ${piso_scoring:,.0f} (60% del obj). Compra actual: ${compra_real_sheet:,.0f}")
-                if compra_real_sheet < piso_scoring:
-                    st.error("⚠️ Cuidado: Estás por debajo del piso de compra para el Scoring.")
+            flujo_compras(rp.compra_real_sheet, rp.costo_total_mes_actual_real, rp.diferencia_flujo, rp.ratio_reduccion)
 
             st.markdown("---")
             st.subheader("🏁 Asistente de Equilibrio y Simulador")
-            canales_premium = ['TALLER', 'MOSTRADOR', 'INTERNA']
-            vta_premium = df_r[df_r['Canal'].isin(canales_premium)]['Venta Neta'].sum()
-            util_premium = df_r[df_r['Canal'].isin(canales_premium)]['Utilidad $'].sum()
-            utilidad_objetivo_total = vta_total_neta * 0.21
-            margen_necesario_volumen = utilidad_objetivo_total - util_premium - primas_input
-            vta_volumen = df_r[df_r['Canal'].str.contains('MAYORISTA|SEGUROS|GAR', na=False)]['Venta Neta'].sum()
-            margen_critico = (margen_necesario_volumen / vta_volumen) if vta_volumen > 0 else 0
+            margen_critico = rp.margen_critico
             
             col_asist1, col_asist2 = st.columns([2, 1])
             with col_asist1:
@@ -985,197 +614,68 @@ try:
                 else: st.success(f"🟢 **OK:** Mix actual {mg_total_final:.1%}. Margen crítico volumen: **{max(0, margen_critico):.1%}**.")
 
             st.markdown("#### 📈 Simulador de Operación Especial")
-            with st.expander("Abrir Simulador", expanded=True):
-                c_sim1, c_sim2 = st.columns(2)
-                with c_sim1: monto_especial = st.number_input("Monto Venta ($)", min_value=0.0, value=50000000.0, step=1000000.0)
-                with c_sim2: margen_especial = st.slider("% Margen Operación", -10.0, 30.0, 10.0, 0.5) / 100
-                nueva_venta_total = vta_total_neta + monto_especial
-                nueva_utilidad_total = util_total_final + (monto_especial * margen_especial)
-                nuevo_margen_global = nueva_utilidad_total / nueva_venta_total if nueva_venta_total > 0 else 0
-                col_res1, col_res2 = st.columns(2)
-                with col_res1:
-                    puntos_dif = (nuevo_margen_global - mg_total_final) * 100
-                    st.metric("Nuevo Margen Global", f"{nuevo_margen_global:.1%}", delta=f"{puntos_dif:.1f} pts vs actual")
-                with col_res2:
-                    dif_objetivo = nueva_utilidad_total - (nueva_venta_total * 0.21)
-                    if nuevo_margen_global >= 0.21: st.success(f"✅ **Viable:** Sobran **${dif_objetivo:,.0f}** sobre el 21%.")
-                    else: st.error(f"❌ **Riesgoso:** Faltan **${abs(dif_objetivo):,.0f}** para el 21%.")
+            simulador_operacion(vta_total_neta, util_total_final, mg_total_final)
 
             st.markdown("### 🎯 Calculadora de Mix y Estrategia Ideal")
             st.info("Define tu participación ideal por canal y el margen al que aspiras vender.")
-            col_mix_input, col_mix_res = st.columns([3, 2])
-            default_mix = {}
-            default_margin = {}
+            # Valores iniciales del mix: la participación y el margen reales de cada canal
             if vta_total_neta > 0:
-                for idx, row in df_r.iterrows():
-                    default_mix[row['Canal']] = (row['Venta Neta'] / vta_total_neta) * 100
-                    default_margin[row['Canal']] = row['Margen %'] * 100
-            mix_ideal = {}
-            margin_ideal = {}
-            sum_mix = 0
-            with col_mix_input:
-                for c in canales_repuestos:
-                    val_def_mix = float(default_mix.get(c, 0.0))
-                    val_def_marg = float(default_margin.get(c, 25.0))
-                    c1_s, c2_s = st.columns([2, 1])
-                    with c1_s: val_mix = st.slider(f"% Mix {c}", 0.0, 100.0, val_def_mix, 0.5, key=f"mix_{c}")
-                    with c2_s: val_marg = st.number_input(f"% Margen {c}", 0.0, 100.0, val_def_marg, 0.5, key=f"marg_{c}")
-                    mix_ideal[c] = val_mix / 100
-                    margin_ideal[c] = val_marg / 100
-                    sum_mix += val_mix
-            with col_mix_res:
-                st.markdown(f"#### Objetivo Mensual: ${obj_rep_total:,.0f}")
-                delta_sum = sum_mix - 100.0
-                color_sum = "off"
-                if abs(delta_sum) < 0.1: color_sum = "normal"
-                else: color_sum = "inverse"
-                st.metric("Suma del Mix Total", f"{sum_mix:.1f}%", f"{delta_sum:.1f}%", delta_color=color_sum)
-                if abs(delta_sum) > 0.1: st.error(f"⚠️ El mix debe sumar 100%")
-                total_profit_ideal = 0
-                for c, share in mix_ideal.items():
-                    total_profit_ideal += (obj_rep_total * share) * margin_ideal.get(c, 0)
-                global_margin_ideal = total_profit_ideal / obj_rep_total if obj_rep_total > 0 else 0
-                st.markdown("#### Resultado Estratégico:")
-                st.info(f"Con esta estrategia, tu **Margen Global** sería del **{global_margin_ideal:.1%}**")
+                mix_inicial = dict(zip(df_r['Canal'], df_r['Venta Neta'] / vta_total_neta * 100))
+                margen_inicial = dict(zip(df_r['Canal'], df_r['Margen %'] * 100))
+            else:
+                mix_inicial, margen_inicial = {}, {}
+            calculadora_mix(mix_inicial, margen_inicial, obj_rep_total)
 
         elif selected_tab == "🎨 Chapa y Pintura":
             st.markdown("### 🎨 Chapa y Pintura")
             
-            c_mo_j = find_col(data['CyP JUJUY'], ['MO'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            c_mo_t_j = find_col(data['CyP JUJUY'], ['MO', 'TERCERO'], exclude_keywords=['OBJ'])
-            if not c_mo_t_j: c_mo_t_j = find_col(data['CyP JUJUY'], ['MO', 'TER'], exclude_keywords=['OBJ'])
-            j_f_p = cj_r.get(c_mo_j, 0)
-            j_f_t = cj_r.get(c_mo_t_j, 0)
-            j_total_fact = j_f_p + j_f_t
-            j_obj_fact = cj_r.get(find_col(data['CyP JUJUY'], ["OBJ", "FACT"]), 1)
-            
-            c_panos_j = find_col(data['CyP JUJUY'], ['PANOS'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            if not c_panos_j: c_panos_j = find_col(data['CyP JUJUY'], ['PAÑOS'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            j_panos_prop = cj_r.get(c_panos_j, 0)
-            j_obj_panos = cj_r.get(find_col(data['CyP JUJUY'], ['OBJ', 'PANOS']), 1)
-            
-            c_tec_j = find_col(data['CyP JUJUY'], ['TECNICO'], exclude_keywords=['PRODUCTIVIDAD'])
-            if not c_tec_j: c_tec_j = find_col(data['CyP JUJUY'], ['DOTACION'])
-            j_cant_tec = cj_r.get(c_tec_j, 1)
-            j_ratio = j_panos_prop / j_cant_tec if j_cant_tec > 0 else 0
-            
-            j_panos_ter = cj_r.get(find_col(data['CyP JUJUY'], ['PANOS', 'TER']), 0)
-            j_c_ter = cj_r.get(find_col(data['CyP JUJUY'], ['COSTO', 'TER']), 0)
-            j_m_ter = j_f_t - j_c_ter
-            j_mg_ter_pct = j_m_ter/j_f_t if j_f_t > 0 else 0
-            
-            c_mo_s = find_col(data['CyP SALTA'], ['MO'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            c_mo_t_s = find_col(data['CyP SALTA'], ['MO', 'TER'], exclude_keywords=['OBJ', 'PRE'])
-            if not c_mo_t_s: c_mo_t_s = find_col(data['CyP SALTA'], ['MO', 'TERCERO'], exclude_keywords=['OBJ', 'PRE'])
-            s_f_p = cs_r.get(c_mo_s, 0)
-            s_f_t = cs_r.get(c_mo_t_s, 0)
-            
-            c_fact_rep_s = find_col(data['CyP SALTA'], ['FACT', 'REP'], exclude_keywords=['OBJ', 'COSTO'])
-            if not c_fact_rep_s: c_fact_rep_s = find_col(data['CyP SALTA'], ['REP'], exclude_keywords=['OBJ', 'COSTO'])
-            s_f_r = cs_r.get(c_fact_rep_s, 0)
-            
-            s_total_fact = s_f_p + s_f_t + s_f_r
-            
-            s_obj_mo = float(cs_r.get(find_col(data['CyP SALTA'], ['OBJ', 'MO']), 0))
-            s_obj_rep = float(cs_r.get(find_col(data['CyP SALTA'], ['OBJ', 'REP']), 0))
-            s_obj_fact = float(cs_r.get(find_col(data['CyP SALTA'], ["OBJ", "FACT"], exclude_keywords=["MO", "REP", "PRE"]), 1))
-            
-            c_panos_s = find_col(data['CyP SALTA'], ['PANOS'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            if not c_panos_s: c_panos_s = find_col(data['CyP SALTA'], ['PAÑOS'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-            s_panos_prop = cs_r.get(c_panos_s, 0)
-            s_obj_panos = cs_r.get(find_col(data['CyP SALTA'], ['OBJ', 'PANOS']), 1)
-            
-            c_tec_s = find_col(data['CyP SALTA'], ['TECNICO'], exclude_keywords=['PRODUCTIVIDAD'])
-            if not c_tec_s: c_tec_s = find_col(data['CyP SALTA'], ['DOTACION'])
-            s_cant_tec = cs_r.get(c_tec_s, 1)
-            s_ratio = s_panos_prop / s_cant_tec if s_cant_tec > 0 else 0
-            
-            s_panos_ter = cs_r.get(find_col(data['CyP SALTA'], ['PANOS', 'TER']), 0)
-            s_c_ter = cs_r.get(find_col(data['CyP SALTA'], ['COSTO', 'TER'], exclude_keywords=['OBJ']), 0)
-            s_m_ter = s_f_t - s_c_ter
-            s_mg_ter_pct = s_m_ter/s_f_t if s_f_t > 0 else 0
-            
-            s_c_rep = cs_r.get(find_col(data['CyP SALTA'], ['COSTO', 'REP'], exclude_keywords=['OBJ']), 0)
-            s_m_rep = s_f_r - s_c_rep
-            s_mg_rep_pct = s_m_rep/s_f_r if s_f_r > 0 else 0
-
-            j_obj_mo_raw = float(cj_r.get(find_col(data['CyP JUJUY'], ['OBJ', 'MO']), 0))
-            j_obj_mo = j_obj_mo_raw if j_obj_mo_raw > 0 else j_obj_fact
+            cp = k.cyp
 
             def render_mini_kpi(title, real, obj_mes, color_title="#00235d"):
-                fmt = "${:,.0f}"
-                if obj_mes and obj_mes > 0:
-                    obj_parcial = obj_mes * prog_t
-                    proy = (real / d_t) * d_h if d_t > 0 else 0
-                    cumpl_proy = proy / obj_mes if obj_mes > 0 else 0
-                    color = "#dc3545" if cumpl_proy < 0.90 else ("#ffc107" if cumpl_proy < 0.98 else "#28a745")
-                    icon = "✅" if real >= obj_parcial else "🔻"
-                    cumpl_parcial_pct = real / obj_parcial if obj_parcial > 0 else 0
-                    
-                    html = '<div class="kpi-card" style="min-height: 145px;">'
-                    html += f'<div><p style="font-size: 0.8rem; margin-bottom: 2px;">{title}</p><h2 style="font-size: 1.45rem; margin: 0; color: {color_title};">{fmt.format(real)}</h2></div>'
-                    html += '<div style="margin-top: auto;">'
-                    html += f'<div class="kpi-subtext" style="font-size:0.7rem;">vs Obj: <b>{fmt.format(obj_parcial)}</b> <span style="color:{"#28a745" if real >= obj_parcial else "#dc3545"}">({cumpl_parcial_pct:.1%})</span> {icon}</div>'
-                    html += '<hr style="margin:4px 0; border:0; border-top:1px solid #eee;">'
-                    html += f'<div style="display:flex; justify-content:space-between; font-size:0.7rem; margin-bottom:2px;"><span>Obj. Mes:</span><b>{fmt.format(obj_mes)}</b></div>'
-                    html += f'<div style="display:flex; justify-content:space-between; font-size:0.7rem; color:{color}; font-weight:bold;"><span>Proy:</span><span>{fmt.format(proy)} ({cumpl_proy:.1%})</span></div>'
-                    html += f'<div style="margin-top:2px;"><div style="width:100%; background:#e0e0e0; height:4px; border-radius:10px;"><div style="width:{min(cumpl_proy*100, 100)}%; background:{color}; height:4px; border-radius:10px;"></div></div></div>'
-                    html += '</div></div>'
-                else:
-                    html = '<div class="kpi-card" style="min-height: 145px;">'
-                    html += f'<div><p style="font-size: 0.8rem; margin-bottom: 2px;">{title}</p><h2 style="font-size: 1.45rem; margin: 0; color: {color_title};">{fmt.format(real)}</h2></div>'
-                    html += '<div style="margin-top: auto;">'
-                    html += '<div class="kpi-subtext" style="color:transparent; user-select:none; font-size:0.7rem;">vs Obj: $0 (0%) ✅</div>'
-                    html += '<hr style="margin:4px 0; border:0; border-top:1px solid transparent;">'
-                    html += '<div style="display:flex; justify-content:space-between; font-size:0.7rem; margin-bottom:2px; color:transparent; user-select:none;"><span>Obj. Mes:</span><b>$0</b></div>'
-                    html += '<div style="display:flex; justify-content:space-between; font-size:0.7rem; color:transparent; user-select:none;"><span>Proy:</span><span>$0 (0%)</span></div>'
-                    html += '<div style="margin-top:2px;"><div style="width:100%; background:transparent; height:4px;"></div></div>'
-                    html += '</div></div>'
-                return html
+                return tarjeta_mini_kpi(title, real, obj_mes, k.avance, color_title)
 
             t_jujuy, t_salta = st.columns([2, 3])
             with t_jujuy: st.subheader("Sede Jujuy")
             with t_salta: st.subheader("Sede Salta")
 
-            c1, c2, c3, c4, c5 = st.columns(5)
-            with c1: st.markdown(render_mini_kpi("Fact. MO Propia", j_f_p, j_obj_mo), unsafe_allow_html=True)
-            with c2: st.markdown(render_mini_kpi("Fact. Terceros", j_f_t, 0, color_title="#17a2b8"), unsafe_allow_html=True)
-            with c3: st.markdown(render_mini_kpi("Fact. MO Propia", s_f_p, s_obj_mo), unsafe_allow_html=True)
-            with c4: st.markdown(render_mini_kpi("Fact. Terceros", s_f_t, 0, color_title="#17a2b8"), unsafe_allow_html=True)
-            with c5: st.markdown(render_mini_kpi("Fact. Repuestos", s_f_r, s_obj_rep), unsafe_allow_html=True)
+            render_fila([
+                render_mini_kpi("Fact. MO Propia", cp.j_f_p, cp.j_obj_mo),
+                render_mini_kpi("Fact. Terceros", cp.j_f_t, 0, color_title="#17a2b8"),
+                render_mini_kpi("Fact. MO Propia", cp.s_f_p, cp.s_obj_mo),
+                render_mini_kpi("Fact. Terceros", cp.s_f_t, 0, color_title="#17a2b8"),
+                render_mini_kpi("Fact. Repuestos", cp.s_f_r, cp.s_obj_rep)
+            ])
 
             st.markdown("<div style='margin-top: 5px;'></div>", unsafe_allow_html=True)
             
-            tot_jujuy, tot_salta = st.columns([2, 3])
-            with tot_jujuy: st.markdown(render_kpi_card("Facturación Total Jujuy", j_total_fact, j_obj_fact if j_obj_fact > 0 else 1), unsafe_allow_html=True)
-            with tot_salta: st.markdown(render_kpi_card("Facturación Total Salta", s_total_fact, s_obj_fact if s_obj_fact > 0 else 1), unsafe_allow_html=True)
+            render_fila([
+                render_kpi_card("Facturación Total Jujuy", cp.j_total_fact, cp.j_obj_fact if cp.j_obj_fact > 0 else 1),
+                render_kpi_card("Facturación Total Salta", cp.s_total_fact, cp.s_obj_fact if cp.s_obj_fact > 0 else 1)
+            ], anchos=[2, 3])
                 
-            c_p_j, c_p_s = st.columns(2)
-            with c_p_j: st.markdown(render_kpi_card("Paños Propios", j_panos_prop, j_obj_panos, is_currency=False, unit="u"), unsafe_allow_html=True)
-            with c_p_s: st.markdown(render_kpi_card("Paños Propios", s_panos_prop, s_obj_panos, is_currency=False, unit="u"), unsafe_allow_html=True)
-
-            c_pt_j, c_pt_s = st.columns(2)
-            with c_pt_j: st.markdown(render_kpi_small("Paños/Técnico", j_ratio, None, None, None, "{:.1f}"), unsafe_allow_html=True)
-            with c_pt_s: st.markdown(render_kpi_small("Paños/Técnico", s_ratio, None, None, None, "{:.1f}"), unsafe_allow_html=True)
-
-            c_det_j, c_det_s = st.columns(2)
-            with c_det_j:
-                html_ter_j = f'<div class="cyp-detail"><span class="cyp-header">👨‍🔧 Gestión Terceros</span>Cant: <b>{j_panos_ter:,.0f}</b> | Fact: ${j_f_t:,.0f}<br>Mg: <b>${j_m_ter:,.0f}</b> ({j_mg_ter_pct:.1%})</div>'
-                st.markdown(html_ter_j, unsafe_allow_html=True)
-            with c_det_s:
-                html_ter_s = f'<div class="cyp-detail"><span class="cyp-header">👨‍🔧 Gestión Terceros</span>Cant: <b>{s_panos_ter:,.0f}</b> | Fact: ${s_f_t:,.0f}<br>Mg: <b>${s_m_ter:,.0f}</b> ({s_mg_ter_pct:.1%})</div>'
-                st.markdown(html_ter_s, unsafe_allow_html=True)
-                if s_f_r > 0:
-                    margen_rep_pesos = s_f_r - s_c_rep
-                    html_rep_s = f'<div class="cyp-detail" style="border-left-color: #28a745; margin-top:5px;"><span class="cyp-header" style="color:#28a745">📦 Repuestos</span>Fact: ${s_f_r:,.0f} | Costo: <span style="color:#666;">${s_c_rep:,.0f}</span><br>Mg: <b style="color:#28a745;">${margen_rep_pesos:,.0f}</b> ({s_mg_rep_pct:.1%})</div>'
-                    st.markdown(html_rep_s, unsafe_allow_html=True)
+            render_fila([
+                render_kpi_card("Paños Propios", cp.j_panos_prop, cp.j_obj_panos, is_currency=False, unit="u"),
+                render_kpi_card("Paños Propios", cp.s_panos_prop, cp.s_obj_panos, is_currency=False, unit="u")
+            ])
+
+            render_fila([
+                render_kpi_small("Paños/Técnico", cp.j_ratio, None, None, None, "{:.1f}"),
+                render_kpi_small("Paños/Técnico", cp.s_ratio, None, None, None, "{:.1f}")
+            ])
+
+            html_ter_j = f'<div class="cyp-detail"><span class="cyp-header">👨‍🔧 Gestión Terceros</span>Cant: <b>{cp.j_panos_ter:,.0f}</b> | Fact: ${cp.j_f_t:,.0f}<br>Mg: <b>${cp.j_m_ter:,.0f}</b> ({cp.j_mg_ter_pct:.1%})</div>'
+            det_s = [f'<div class="cyp-detail"><span class="cyp-header">👨‍🔧 Gestión Terceros</span>Cant: <b>{cp.s_panos_ter:,.0f}</b> | Fact: ${cp.s_f_t:,.0f}<br>Mg: <b>${cp.s_m_ter:,.0f}</b> ({cp.s_mg_ter_pct:.1%})</div>']
+            if cp.s_f_r > 0:
+                margen_rep_pesos = cp.s_f_r - cp.s_c_rep
+                det_s.append(f'<div class="cyp-detail" style="border-left-color: #28a745; margin-top:5px;"><span class="cyp-header" style="color:#28a745">📦 Repuestos</span>Fact: ${cp.s_f_r:,.0f} | Costo: <span style="color:#666;">${cp.s_c_rep:,.0f}</span><br>Mg: <b style="color:#28a745;">${margen_rep_pesos:,.0f}</b> ({cp.s_mg_rep_pct:.1%})</div>')
+            render_fila([[html_ter_j], det_s])  # Apiladas: cada recuadro con su alto
 
             g_jujuy, g_salta = st.columns(2)
-            with g_jujuy: st.plotly_chart(px.pie(values=[j_f_p, j_f_t], names=["MO Pura", "Terceros"], hole=0.4, title="Facturación Jujuy", color_discrete_sequence=["#00235d", "#00A8E8"]), use_container_width=True)
+            with g_jujuy: st.plotly_chart(figura("cyp_fact_jujuy", huella, (año_sel, mes_sel), lambda: px.pie(values=[cp.j_f_p, cp.j_f_t], names=["MO Pura", "Terceros"], hole=0.4, title="Facturación Jujuy", color_discrete_sequence=["#00235d", "#00A8E8"])), use_container_width=True)
             with g_salta: 
-                vals_s, nams_s = [s_f_p, s_f_t], ["MO Pura", "Terceros"]
-                if s_f_r > 0: vals_s.append(s_f_r); nams_s.append("Repuestos")
-                st.plotly_chart(px.pie(values=vals_s, names=nams_s, hole=0.4, title="Facturación Salta", color_discrete_sequence=["#00235d", "#00A8E8", "#28a745"]), use_container_width=True)
+                vals_s, nams_s = [cp.s_f_p, cp.s_f_t], ["MO Pura", "Terceros"]
+                if cp.s_f_r > 0: vals_s.append(cp.s_f_r); nams_s.append("Repuestos")
+                st.plotly_chart(figura("cyp_fact_salta", huella, (año_sel, mes_sel), lambda: px.pie(values=vals_s, names=nams_s, hole=0.4, title="Facturación Salta", color_discrete_sequence=["#00235d", "#00A8E8", "#28a745"])), use_container_width=True)
                 
        # --- PESTAÑA: COSTOS ---
         elif selected_tab == "💸 Costos":
@@ -1193,10 +693,12 @@ try:
             }
             
             nombres_unidades = ["Cta Res Taller", "Cta Res Repuestos", "Cta Res Chapa Jujuy", "Cta Res Chapa Salta"]
-            tabs_costos = st.tabs(["Taller", "Repuestos", "Chapa Jujuy", "Chapa Salta"])
+            etiquetas_costos = ["Taller", "Repuestos", "Chapa Jujuy", "Chapa Salta"]
+            sub_costos = st.radio("Unidad", etiquetas_costos, horizontal=True, label_visibility="collapsed", key="sub_costos")
 
             for i, unidad in enumerate(nombres_unidades):
-                with tabs_costos[i]:
+                if etiquetas_costos[i] != sub_costos: continue  # Sólo se calcula la unidad elegida
+                with st.container():
                     if unidad in data and not data[unidad].empty:
                         df_c = data[unidad].copy()
                         
@@ -1224,34 +726,37 @@ try:
                         
                         with col_g1:
                             # 1. Evolución mensual acumulada (Barras apiladas)
-                            fig_evol_costos = px.bar(
-                                df_melt_costos_6, 
-                                x='Mes', 
-                                y='Monto', 
-                                color='Grupo', 
-                                title="Evolución Mensual de Costos (Últimos 6 meses)",
-                                text_auto='$.2s',
-                                color_discrete_sequence=['#00235d', '#00A8E8', '#28a745', '#ffc107']
-                            )
-                            fig_evol_costos.update_layout(barmode='stack', height=380, yaxis_title="Monto ($)", xaxis_title="")
-                            st.plotly_chart(fig_evol_costos, use_container_width=True)
+                            def armar_fig_evol_costos():
+                                fig_evol_costos = px.bar(
+                                    df_melt_costos_6, 
+                                    x='Mes', 
+                                    y='Monto', 
+                                    color='Grupo', 
+                                    title="Evolución Mensual de Costos (Últimos 6 meses)",
+                                    text_auto='$.2s',
+                                    color_discrete_sequence=['#00235d', '#00A8E8', '#28a745', '#ffc107']
+                                )
+                                return fig_evol_costos.update_layout(barmode='stack', height=380, yaxis_title="Monto ($)", xaxis_title="")
+                            # La hoja de la unidad es todo el dato: alcanza con su huella
+                            st.plotly_chart(figura("costos_evolucion", huellas.get(unidad), (unidad,), armar_fig_evol_costos), use_container_width=True)
                             
                         with col_g2:
                             # 2. Participación del total de costos del último mes
                             ultimo_mes = ultimos_6[-1] if ultimos_6 else None
                             if ultimo_mes:
-                                df_ultimo_mes = df_melt_costos_6[df_melt_costos_6['Mes'] == ultimo_mes]
-                                fig_part_costos = px.pie(
-                                    df_ultimo_mes, 
-                                    values='Monto', 
-                                    names='Grupo', 
-                                    hole=0.4,
-                                    title=f"Participación del Total del Costo ({ultimo_mes})",
-                                    color_discrete_sequence=['#00235d', '#00A8E8', '#28a745', '#ffc107']
-                                )
-                                fig_part_costos.update_layout(height=380)
-                                fig_part_costos.update_traces(textinfo='percent+label')
-                                st.plotly_chart(fig_part_costos, use_container_width=True)
+                                def armar_fig_part_costos():
+                                    df_ultimo_mes = df_melt_costos_6[df_melt_costos_6['Mes'] == ultimo_mes]
+                                    fig_part_costos = px.pie(
+                                        df_ultimo_mes, 
+                                        values='Monto', 
+                                        names='Grupo', 
+                                        hole=0.4,
+                                        title=f"Participación del Total del Costo ({ultimo_mes})",
+                                        color_discrete_sequence=['#00235d', '#00A8E8', '#28a745', '#ffc107']
+                                    )
+                                    fig_part_costos.update_layout(height=380)
+                                    return fig_part_costos.update_traces(textinfo='percent+label')
+                                st.plotly_chart(figura("costos_participacion", huellas.get(unidad), (unidad,), armar_fig_part_costos), use_container_width=True)
                                 
                         st.markdown("---")
 
@@ -1358,162 +863,84 @@ try:
             st.markdown(f"### 📈 Evolución Anual {año_sel}")
             
             # --- 0. PREPARACIÓN DE DATOS BASE PARA FACTURACIÓN ---
-            fact_mensual = []
-            for mes in h_cal['Mes'].unique():
-                nom_mes = h_cal[h_cal['Mes'] == mes]['NombreMes'].iloc[0]
-                
-                f_ser = 0
-                row_ser = h_ser[h_ser['Mes'] == mes]
-                if not row_ser.empty:
-                    for kw in ["CLI", "GAR", "INT", "TERCERO", "TERCEROS", "TER"]:
-                        c = find_col(h_ser, ["MO", kw], exclude_keywords=["OBJ"])
-                        if c: f_ser += float(row_ser[c].iloc[0] or 0)
-                
-                f_rep = 0
-                row_rep = h_rep[h_rep['Mes'] == mes]
-                ventas_canales_mes = {}
-                if not row_rep.empty:
-                    for can in canales_repuestos:
-                        c = find_col(h_rep, ["VENTA", can], exclude_keywords=["OBJ"])
-                        val_canal = float(row_rep[c].iloc[0] or 0) if c else 0
-                        ventas_canales_mes[can] = val_canal
-                        f_rep += val_canal
-                
-                fact_mensual.append({
-                    "Mes_Num": mes, "Mes": nom_mes, 
-                    "Servicios": f_ser, "Repuestos": f_rep, 
-                    **ventas_canales_mes
-                })
-
-            df_fact_hist = pd.DataFrame(fact_mensual).sort_values("Mes_Num")
+            df_fact_hist = facturacion_anual(meses, indice, año_sel, cubo).copy()
+            def pct(v): return v * 100 if pd.notna(v) else 0  # Variación sin base: 0% en las tarjetas
             
             # --- CREACIÓN DE SUB-PESTAÑAS ---
-            tab_ser, tab_tal, tab_rep, tab_cyp = st.tabs(["🛠️ Servicios", "⚙️ Taller", "📦 Repuestos", "🎨 Chapa"])
+            # Como el menú principal: sólo se calcula y se envía la sub-pestaña elegida (st.tabs arma las cuatro)
+            sub_hist = st.radio("Sub-pestaña", ["🛠️ Servicios", "⚙️ Taller", "📦 Repuestos", "🎨 Chapa", "📅 Períodos"], horizontal=True,
+                                label_visibility="collapsed", key="sub_historico")
 
             # ==========================================
             # PESTAÑA 1: SERVICIOS
             # ==========================================
-            with tab_ser:
+            if sub_hist == "🛠️ Servicios":
                 st.markdown("#### 💰 Evolución Facturación: Servicios")
                 if not df_fact_hist.empty:
-                    df_fact_hist['Var_Ser'] = df_fact_hist['Servicios'].pct_change()
-                    fig_fact_ser = go.Figure()
-                    fig_fact_ser.add_trace(go.Bar(
-                        x=df_fact_hist['Mes'], y=df_fact_hist['Servicios'], 
-                        marker_color='#00235d', name='Facturación',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in df_fact_hist['Var_Ser']],
-                        textposition='outside', textfont=dict(color="#444444", size=11)
-                    ))
-                    max_y_ser = df_fact_hist['Servicios'].max() * 1.25 if not df_fact_hist.empty else 100
-                    fig_fact_ser.update_layout(height=320, margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_ser]))
-                    st.plotly_chart(fig_fact_ser, use_container_width=True)
+                    df_fact_hist['Var_Ser'] = comparar_periodos(df_fact_hist, ['Servicios'], clave='Mes_Num')['Servicios MoM'].to_numpy()
+                    def armar_fig_fact_ser():
+                        fig_fact_ser = go.Figure()
+                        fig_fact_ser.add_trace(go.Bar(
+                            x=df_fact_hist['Mes'], y=df_fact_hist['Servicios'], 
+                            marker_color='#00235d', name='Facturación',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in df_fact_hist['Var_Ser']],
+                            textposition='outside', textfont=dict(color="#444444", size=11)
+                        ))
+                        max_y_ser = df_fact_hist['Servicios'].max() * 1.25 if not df_fact_hist.empty else 100
+                        return fig_fact_ser.update_layout(height=320, margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_ser]))
+                    st.plotly_chart(figura("hist_fact_servicios", huella, (año_sel,), armar_fig_fact_ser), use_container_width=True)
 
                 # --- CPUS, TUS y TICKET PROMEDIO ---
                 st.markdown("---")
                 st.markdown("#### 🚘 Evolución de Entradas y Eficiencia (Anual y Mensual)")
-                col_cpus = find_col(data['SERVICIOS'], ["CPUS"], exclude_keywords=["OBJ"])
-                col_tus_others = find_col(data['SERVICIOS'], ["OTROS", "CARGOS"], exclude_keywords=["OBJ"])
-                cols_hs_fact = [c for c in [find_col(data['TALLER'], ["FACT", k]) for k in ["CC", "CG", "CI"]] if c]
-
-                df_curr_ser = data['SERVICIOS'][data['SERVICIOS']['Año'] == año_sel].groupby('Mes').last().reset_index()
-                df_curr_tal = data['TALLER'][data['TALLER']['Año'] == año_sel].groupby('Mes').last().reset_index()
-                df_prev_ser = data['SERVICIOS'][data['SERVICIOS']['Año'] == año_sel - 1].groupby('Mes').last().reset_index()
-                df_prev_tal = data['TALLER'][data['TALLER']['Año'] == año_sel - 1].groupby('Mes').last().reset_index()
-
-                def extract_metrics(df_s, df_t):
-                    if df_s.empty and df_t.empty: return pd.DataFrame(columns=['Mes', 'CPUS', 'TUS', 'Hs Vendidas', 'Ticket Hs'])
-                    df_merged = pd.merge(df_s, df_t, on="Mes", how="outer")
-                    cpus = pd.to_numeric(df_merged[col_cpus], errors='coerce').fillna(0) if col_cpus in df_merged.columns else 0
-                    otros = pd.to_numeric(df_merged[col_tus_others], errors='coerce').fillna(0) if col_tus_others in df_merged.columns else 0
-                    df_merged['CPUS'] = cpus
-                    df_merged['TUS'] = cpus + otros
-                    df_merged['Hs Vendidas'] = 0
-                    for c in cols_hs_fact:
-                        if c in df_merged.columns: df_merged['Hs Vendidas'] += pd.to_numeric(df_merged[c], errors='coerce').fillna(0)
-                    df_merged['Ticket Hs'] = df_merged.apply(lambda row: row['Hs Vendidas'] / row['CPUS'] if row['CPUS'] > 0 else 0, axis=1)
-                    return df_merged[['Mes', 'CPUS', 'TUS', 'Hs Vendidas', 'Ticket Hs']]
-
-                metrics_curr = extract_metrics(df_curr_ser, df_curr_tal)
-                metrics_prev = extract_metrics(df_prev_ser, df_prev_tal)
-
-                df_plot = pd.merge(metrics_curr, metrics_prev, on="Mes", suffixes=(f" {año_sel}", f" {año_sel-1}"), how="outer")
-                df_plot = df_plot.sort_values('Mes').reset_index(drop=True)
-                df_plot['NombreMes'] = df_plot['Mes'].map(meses_nom)
-                df_plot.fillna(0, inplace=True)
-                
-                def calc_yoy_array(curr, prev):
-                    res = []
-                    for c, p in zip(curr, prev): res.append((c / p - 1) * 100 if p > 0 and c > 0 else None)
-                    return res
+                metrics_curr = entradas_anuales(meses, indice, año_sel, cubo)
+                metrics_prev = entradas_anuales(meses, indice, año_sel - 1, cubo)
 
-                df_plot['Var CPUS YoY'] = calc_yoy_array(df_plot[f'CPUS {año_sel}'], df_plot[f'CPUS {año_sel-1}'])
-                df_plot['Var TUS YoY'] = calc_yoy_array(df_plot[f'TUS {año_sel}'], df_plot[f'TUS {año_sel-1}'])
-                df_plot['Var Tkt YoY'] = calc_yoy_array(df_plot[f'Ticket Hs {año_sel}'], df_plot[f'Ticket Hs {año_sel-1}'])
+                # Una fila por mes: valor de cada año, MoM, YoY y acumulado (el Ticket es Hs Vendidas / CPUS)
+                df_plot = comparar_periodos(metrics_curr, ['CPUS', 'TUS', 'Hs Vendidas'], anterior=metrics_prev,
+                                            cocientes={'Ticket Hs': ('Hs Vendidas', 'CPUS')})
+                df_plot['NombreMes'] = df_plot['Mes'].map(meses_nom)
 
                 def html_card(title, val, var1_label, var1_val, var2_label=None, var2_val=None, is_tkt=False):
-                    fmt = "{:.2f} hs" if is_tkt else "{:,.0f}"
-                    def format_var(v):
-                        color = "#28a745" if v >= 0 else "#dc3545"
-                        icon = "▲" if v >= 0 else "▼"
-                        return f'<span style="color: {color}; font-weight: bold;">{icon} {v:+.1f}%</span>'
-                    var1_html = format_var(var1_val)
-                    lines_html = f'<div style="font-size: 0.85rem; color: #666; margin-bottom: 4px; display:flex; justify-content:space-between; padding:0 10px;"><span>{var1_label}:</span> {var1_html}</div>'
-                    if var2_label and var2_val is not None:
-                        lines_html += f'<div style="font-size: 0.85rem; color: #666; display:flex; justify-content:space-between; padding:0 10px;"><span>{var2_label}:</span> {format_var(var2_val)}</div>'
-                    return f'<div style="background-color: #ffffff; padding: 12px; border-radius: 8px; border: 1px solid #e0e0e0; text-align: center; height: 100%; box-shadow: 0 1px 3px rgba(0,0,0,0.05); margin-bottom: 10px;"><div style="font-size: 0.9rem; font-weight: bold; color: #666; margin-bottom: 5px;">{title}</div><div style="font-size: 1.8rem; font-weight: bold; color: #00235d; margin-bottom: 8px;">{fmt.format(val)}</div>{lines_html}</div>'
-
-                meses_con_datos_curr = df_plot[df_plot[f'CPUS {año_sel}'] > 0]['Mes'].tolist()
+                    return tarjeta_comparativa(title, val, var1_label, var1_val, var2_label, var2_val, is_tkt)
+
+                meses_con_datos_curr = df_plot[df_plot['CPUS'] > 0]['Mes'].tolist()
                 if meses_con_datos_curr:
                     idx_metric = -2 if prog_t < 1.0 and len(meses_con_datos_curr) >= 2 else -1
                     mes_cerrado = meses_con_datos_curr[idx_metric]
                     row_cerrado = df_plot[df_plot['Mes'] == mes_cerrado].iloc[0]
                     nom_mes_cerrado = row_cerrado['NombreMes']
-                    
-                    v_cpus = row_cerrado[f'CPUS {año_sel}']; v_tus = row_cerrado[f'TUS {año_sel}']; v_tkt = row_cerrado[f'Ticket Hs {año_sel}']
-                    vy_cpus = row_cerrado[f'CPUS {año_sel-1}']; vy_tus = row_cerrado[f'TUS {año_sel-1}']; vy_tkt = row_cerrado[f'Ticket Hs {año_sel-1}']
-                    
-                    vm_cpus, vm_tus, vm_tkt = 0, 0, 0
-                    idx_en_lista = meses_con_datos_curr.index(mes_cerrado)
-                    if idx_en_lista > 0:
-                        row_ant = df_plot[df_plot['Mes'] == meses_con_datos_curr[idx_en_lista - 1]].iloc[0]
-                        vm_cpus = row_ant[f'CPUS {año_sel}']; vm_tus = row_ant[f'TUS {año_sel}']; vm_tkt = row_ant[f'Ticket Hs {año_sel}']
-
-                    def calc_var(act, ant): return (act / ant - 1) * 100 if ant > 0 else 0
-                    
-                    df_ytd = df_plot[df_plot['Mes'] <= mes_cerrado]
-                    y_cpus_c = df_ytd[f'CPUS {año_sel}'].sum(); y_cpus_p = df_ytd[f'CPUS {año_sel-1}'].sum()
-                    y_tus_c = df_ytd[f'TUS {año_sel}'].sum(); y_tus_p = df_ytd[f'TUS {año_sel-1}'].sum()
-                    y_tkt_c = df_ytd[f'Hs Vendidas {año_sel}'].sum() / y_cpus_c if y_cpus_c > 0 else 0
-                    y_tkt_p = df_ytd[f'Hs Vendidas {año_sel-1}'].sum() / y_cpus_p if y_cpus_p > 0 else 0
 
                     st.markdown(f"**📉 Detalle de Mes Cerrado ({nom_mes_cerrado} {año_sel})**")
-                    cm1, cm2, cm3 = st.columns(3)
-                    with cm1: st.markdown(html_card("CPUS", v_cpus, "vs Mes Ant", calc_var(v_cpus, vm_cpus), f"vs {año_sel-1}", calc_var(v_cpus, vy_cpus)), unsafe_allow_html=True)
-                    with cm2: st.markdown(html_card("TUS", v_tus, "vs Mes Ant", calc_var(v_tus, vm_tus), f"vs {año_sel-1}", calc_var(v_tus, vy_tus)), unsafe_allow_html=True)
-                    with cm3: st.markdown(html_card("Ticket", v_tkt, "vs Mes Ant", calc_var(v_tkt, vm_tkt), f"vs {año_sel-1}", calc_var(v_tkt, vy_tkt), True), unsafe_allow_html=True)
+                    render_fila([
+                        html_card(titulo, row_cerrado[m], "vs Mes Ant", pct(row_cerrado[f'{m} MoM']), f"vs {año_sel-1}", pct(row_cerrado[f'{m} YoY']), m == 'Ticket Hs')
+                        for titulo, m in [("CPUS", 'CPUS'), ("TUS", 'TUS'), ("Ticket", 'Ticket Hs')]
+                    ])
 
                     st.markdown(f"**📈 Acumulado del Año (Enero a {nom_mes_cerrado} {año_sel})**")
-                    ca1, ca2, ca3 = st.columns(3)
-                    with ca1: st.markdown(html_card("CPUS YTD", y_cpus_c, f"Var vs {año_sel-1}", calc_var(y_cpus_c, y_cpus_p)), unsafe_allow_html=True)
-                    with ca2: st.markdown(html_card("TUS YTD", y_tus_c, f"Var vs {año_sel-1}", calc_var(y_tus_c, y_tus_p)), unsafe_allow_html=True)
-                    with ca3: st.markdown(html_card("Ticket YTD", y_tkt_c, f"Var vs {año_sel-1}", calc_var(y_tkt_c, y_tkt_p), is_tkt=True), unsafe_allow_html=True)
+                    render_fila([
+                        html_card(f"{titulo} YTD", row_cerrado[f'{m} YTD'], f"Var vs {año_sel-1}", pct(row_cerrado[f'{m} YTD YoY']), is_tkt=m == 'Ticket Hs')
+                        for titulo, m in [("CPUS", 'CPUS'), ("TUS", 'TUS'), ("Ticket", 'Ticket Hs')]
+                    ])
 
                 c_graf_1, c_graf_2, c_graf_3 = st.columns(3)
-                def create_yoy_chart(df, col_prev, col_curr, col_var, title, color_curr):
+                def create_yoy_chart(df, metrica, title, color_curr):
+                    # Sin valor del año elegido no se muestra la variación (mes todavía sin cargar)
+                    col_prev, col_curr, col_var = f'{metrica} Ant', metrica, df[f'{metrica} YoY'].where(df[metrica] > 0) * 100
                     fig = go.Figure()
                     fig.add_trace(go.Bar(x=df['NombreMes'], y=df[col_prev], name=f'{año_sel-1}', marker_color='#a5b1c2'))
                     fig.add_trace(go.Bar(
                         x=df['NombreMes'], y=df[col_curr], name=f'{año_sel}', marker_color=color_curr,
-                        text=[f"{v:+.1f}%" if pd.notna(v) else "" for v in df[col_var]],
+                        text=[f"{v:+.1f}%" if pd.notna(v) else "" for v in col_var],
                         textposition='outside', textfont=dict(color="#444444", size=11)
                     ))
                     max_val = max(df[col_prev].max(), df[col_curr].max()) if not df.empty else 10
                     fig.update_layout(barmode='group', title=title, height=320, legend=dict(orientation="h", y=-0.2), margin=dict(t=40, b=0, l=0, r=0), yaxis=dict(range=[0, max_val * 1.25]))
                     return fig
 
-                with c_graf_1: st.plotly_chart(create_yoy_chart(df_plot, f'CPUS {año_sel-1}', f'CPUS {año_sel}', 'Var CPUS YoY', "Evolución CPUS", '#00235d'), use_container_width=True)
-                with c_graf_2: st.plotly_chart(create_yoy_chart(df_plot, f'TUS {año_sel-1}', f'TUS {año_sel}', 'Var TUS YoY', "Evolución TUS", '#00A8E8'), use_container_width=True)
-                with c_graf_3: st.plotly_chart(create_yoy_chart(df_plot, f'Ticket Hs {año_sel-1}', f'Ticket Hs {año_sel}', 'Var Tkt YoY', "Evolución Ticket Promedio", '#28a745'), use_container_width=True)
+                with c_graf_1: st.plotly_chart(figura("hist_cpus", huella, (año_sel,), lambda: create_yoy_chart(df_plot, 'CPUS', "Evolución CPUS", '#00235d')), use_container_width=True)
+                with c_graf_2: st.plotly_chart(figura("hist_tus", huella, (año_sel,), lambda: create_yoy_chart(df_plot, 'TUS', "Evolución TUS", '#00A8E8')), use_container_width=True)
+                with c_graf_3: st.plotly_chart(figura("hist_ticket", huella, (año_sel,), lambda: create_yoy_chart(df_plot, 'Ticket Hs', "Evolución Ticket Promedio", '#28a745')), use_container_width=True)
 
                 # --- IRPV FIDELIZACIÓN ---
                 st.markdown("---")
@@ -1535,74 +962,95 @@ try:
                 else:
                     st.info("👈 Sube los archivos 'Ventas' y 'Taller' en la barra lateral para ver el análisis de IRPV.")
 
+                if os.path.exists(RUTA_HISTORIAL_VIN):
+                    with st.expander("🔎 Historial de service por VIN"):
+                        c_vin, c_venc = st.columns(2)
+                        with c_vin:
+                            vin_buscado = st.text_input("VIN / Bastidor")
+                            if vin_buscado:
+                                entrega_vin, servicios_vin = historial_de_vin(vin_buscado)
+                                st.caption(f"Entregado: {entrega_vin or 'sin entrega registrada'}")
+                                st.dataframe(servicios_vin, use_container_width=True, hide_index=True)
+                        with c_venc:
+                            hito_venc = st.selectbox("Vencen su service", list(COLUMNAS_HITO), index=1)
+                            dias_venc = st.number_input("en los próximos días", min_value=1, max_value=365, value=30)
+                            por_vencer = vins_por_vencer(hito_venc, int(dias_venc))
+                            st.caption(f"{len(por_vencer):,} vehículos")
+                            st.dataframe(por_vencer, use_container_width=True, hide_index=True)
+
             # ==========================================
             # PESTAÑA 2: TALLER
             # ==========================================
-            with tab_tal:
+            if sub_hist == "⚙️ Taller":
                 st.markdown("#### ⚙️ Análisis de Capacidad")
-                col_hab_hist = find_col(h_cal, ["HAB"])
-                col_tecs_hist = find_col(h_tal, ["TECNICOS"], exclude_keywords=["PROD", "EFIC"]) or find_col(h_tal, ["MECANICOS"], exclude_keywords=["PROD"])
-                col_disp_hist = find_col(h_tal, ["DISPONIBLES", "REAL"]) or find_col(h_tal, ["DISP", "REAL"]) or find_col(h_tal, ["DISPONIBLE"])
+                col_hab_hist = indice.col('CALENDARIO', ["HAB"])
+                col_tecs_hist = kpi['tecnicos_hist']
+                col_disp_hist = kpi['hs_disponibles_hist']
                 
                 if col_hab_hist and col_disp_hist:
                     df_capacidad = pd.merge(h_tal, h_cal[['Mes', col_hab_hist]], on='Mes', suffixes=('', '_cal'))
                     cant_tecnicos_series = df_capacidad[col_tecs_hist].astype(float) if col_tecs_hist else 6
                     df_capacidad['Hs Ideales'] = cant_tecnicos_series * 8 * df_capacidad[col_hab_hist].astype(float)
                     df_capacidad['Hs Reales'] = df_capacidad[col_disp_hist].astype(float)
-                    cols_trab_h = [c for c in [find_col(h_tal, ["TRAB", k]) for k in ["CC", "CG", "CI"]] if c]
+                    cols_trab_h = [c for c in [indice.col('TALLER', ["TRAB", k]) for k in ["CC", "CG", "CI"]] if c]
                     df_capacidad['Hs Ocupadas'] = df_capacidad[cols_trab_h].sum(axis=1) if cols_trab_h else 0
                     
-                    fig_cap = go.Figure()
-                    fig_cap.add_trace(go.Scatter(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Ideales'], name='Ideal (Teórico)', line=dict(color='gray', dash='dash')))
-                    fig_cap.add_trace(go.Bar(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Reales'], name='Presencia Real', marker_color='#00235d'))
-                    fig_cap.add_trace(go.Bar(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Ocupadas'], name='Hs Ocupadas', marker_color='#28a745'))
-                    st.plotly_chart(fig_cap.update_layout(title="Capacidad vs Presencia vs Ocupación", barmode='group', height=350), use_container_width=True)
+                    def armar_fig_cap():
+                        fig_cap = go.Figure()
+                        fig_cap.add_trace(go.Scatter(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Ideales'], name='Ideal (Teórico)', line=dict(color='gray', dash='dash')))
+                        fig_cap.add_trace(go.Bar(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Reales'], name='Presencia Real', marker_color='#00235d'))
+                        fig_cap.add_trace(go.Bar(x=df_capacidad['NombreMes'], y=df_capacidad['Hs Ocupadas'], name='Hs Ocupadas', marker_color='#28a745'))
+                        return fig_cap.update_layout(title="Capacidad vs Presencia vs Ocupación", barmode='group', height=350)
+                    st.plotly_chart(figura("hist_capacidad", huella, (año_sel,), armar_fig_cap), use_container_width=True)
                 
                 st.markdown("---")
                 st.markdown("#### 🚀 Eficiencia y Productividad")
-                col_prod = find_col(h_tal, ["PRODUCTIVIDAD", "TALLER"])
-                h_tal['Productividad'] = h_tal[col_prod].apply(lambda x: x/100 if x > 2 else x) if col_prod else 0
-                cols_trab = [c for c in [find_col(h_tal, ["TRAB", k]) for k in ["CC", "CG", "CI"]] if c]
+                col_prod = indice.col('TALLER', ["PRODUCTIVIDAD", "TALLER"])
+                h_tal['Productividad'] = h_tal[col_prod].mask(h_tal[col_prod] > 2, h_tal[col_prod] / 100) if col_prod else 0
+                cols_trab = [c for c in [indice.col('TALLER', ["TRAB", k]) for k in ["CC", "CG", "CI"]] if c]
                 h_tal['Hs Trabajadas'] = h_tal[cols_trab].sum(axis=1) if cols_trab else 0
-                cols_hs_fact = [c for c in [find_col(h_tal, ["FACT", k]) for k in ["CC", "CG", "CI"]] if c]
+                cols_hs_fact = [c for c in [indice.col('TALLER', ["FACT", k]) for k in ["CC", "CG", "CI"]] if c]
                 h_tal['Hs Vendidas'] = h_tal[cols_hs_fact].sum(axis=1) if cols_hs_fact else 0
-                h_tal['Eficiencia Global'] = h_tal.apply(lambda row: row['Hs Vendidas'] / row['Hs Trabajadas'] if row['Hs Trabajadas'] > 0 else 0, axis=1)
+                h_tal['Eficiencia Global'] = cociente(h_tal['Hs Vendidas'], h_tal['Hs Trabajadas'])
                 
-                fig_efi = go.Figure()
-                fig_efi.add_trace(go.Scatter(x=h_tal['NombreMes'], y=h_tal['Eficiencia Global'], name='Efic. Global', mode='lines+markers', line=dict(color='#28a745', width=3)))
-                fig_efi.add_trace(go.Scatter(x=h_tal['NombreMes'], y=h_tal['Productividad'], name='Productividad', mode='lines+markers', line=dict(color='#17a2b8', dash='dot', width=2)))
-                st.plotly_chart(fig_efi.update_layout(title="Tendencia de Rendimiento Operativo", yaxis_tickformat='.0%', height=350), use_container_width=True)
+                def armar_fig_efi():
+                    fig_efi = go.Figure()
+                    fig_efi.add_trace(go.Scatter(x=h_tal['NombreMes'], y=h_tal['Eficiencia Global'], name='Efic. Global', mode='lines+markers', line=dict(color='#28a745', width=3)))
+                    fig_efi.add_trace(go.Scatter(x=h_tal['NombreMes'], y=h_tal['Productividad'], name='Productividad', mode='lines+markers', line=dict(color='#17a2b8', dash='dot', width=2)))
+                    return fig_efi.update_layout(title="Tendencia de Rendimiento Operativo", yaxis_tickformat='.0%', height=350)
+                st.plotly_chart(figura("hist_eficiencia", huella, (año_sel,), armar_fig_efi), use_container_width=True)
 
             # ==========================================
             # PESTAÑA 3: REPUESTOS
             # ==========================================
-            with tab_rep:
+            if sub_hist == "📦 Repuestos":
                 st.markdown("#### 📦 Evolución Facturación: Repuestos")
                 if not df_fact_hist.empty:
-                    df_fact_hist['Var_Rep'] = df_fact_hist['Repuestos'].pct_change()
-                    fig_fact_rep = go.Figure()
-                    fig_fact_rep.add_trace(go.Bar(
-                        x=df_fact_hist['Mes'], y=df_fact_hist['Repuestos'], 
-                        marker_color='#fd7e14', name='Facturación',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in df_fact_hist['Var_Rep']],
-                        textposition='outside', textfont=dict(color="#444444", size=11)
-                    ))
-                    max_y_rep = df_fact_hist['Repuestos'].max() * 1.25 if not df_fact_hist.empty else 100
-                    fig_fact_rep.update_layout(height=320, margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_rep]))
-                    st.plotly_chart(fig_fact_rep, use_container_width=True)
+                    df_fact_hist['Var_Rep'] = comparar_periodos(df_fact_hist, ['Repuestos'], clave='Mes_Num')['Repuestos MoM'].to_numpy()
+                    def armar_fig_fact_rep():
+                        fig_fact_rep = go.Figure()
+                        fig_fact_rep.add_trace(go.Bar(
+                            x=df_fact_hist['Mes'], y=df_fact_hist['Repuestos'], 
+                            marker_color='#fd7e14', name='Facturación',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in df_fact_hist['Var_Rep']],
+                            textposition='outside', textfont=dict(color="#444444", size=11)
+                        ))
+                        max_y_rep = df_fact_hist['Repuestos'].max() * 1.25 if not df_fact_hist.empty else 100
+                        return fig_fact_rep.update_layout(height=320, margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_rep]))
+                    st.plotly_chart(figura("hist_fact_repuestos", huella, (año_sel,), armar_fig_fact_rep), use_container_width=True)
                 
                 st.markdown("---")
                 st.markdown("#### 📊 Análisis de Ventas y Márgenes por Canal")
                 
                 # --- PREPARACIÓN DE DATOS DE VENTA Y MARGEN ---
-                cols_canales = [c for c in canales_repuestos if c in df_fact_hist.columns]
+                cols_canales = [c for c in CANALES_REPUESTOS if c in df_fact_hist.columns]
                 
                 # 1. Crear dataframe histórico calculando los márgenes
                 df_margen = pd.DataFrame({'Mes': h_rep['NombreMes'], 'Mes_Num': h_rep['Mes']})
                 margen_cols = []
                 for can in cols_canales:
-                    c_venta = find_col(h_rep, ["VENTA", can], exclude_keywords=["OBJ"])
-                    c_costo = find_col(h_rep, ["COSTO", can], exclude_keywords=["OBJ"])
+                    c_venta = indice.col('REPUESTOS', ["VENTA", can], excluir=["OBJ"])
+                    c_costo = indice.col('REPUESTOS', ["COSTO", can], excluir=["OBJ"])
                     if c_venta and c_costo:
                         venta_val = pd.to_numeric(h_rep[c_venta], errors='coerce').fillna(0)
                         costo_val = pd.to_numeric(h_rep[c_costo], errors='coerce').fillna(0)
@@ -1623,37 +1071,18 @@ try:
                     mes_act_row = df_fact_hist.iloc[idx_rep]
                     mes_cerrado = int(mes_act_row['Mes_Num'])
                     nom_mes_cerrado = mes_act_row['Mes']
-                    mes_ant_row = df_fact_hist.iloc[idx_rep-1] if len(df_fact_hist) >= abs(idx_rep)+1 else None
+                    var_canales = comparar_periodos(df_fact_hist, cols_canales, clave='Mes_Num').iloc[idx_rep]
                     margen_act_row = df_margen.iloc[idx_rep] if not df_margen.empty else None
                     
                     st.markdown(f"**Rendimiento a Mes Cerrado ({nom_mes_cerrado})**")
                     
-                    # Función para crear las tarjetas HTML con Doble Mix (Venta y Margen) SIN PROMEDIO
-                    def html_card_rep(title, val, var1_label, var1_val, mix_venta, mix_margen):
-                        def format_var(v):
-                            color = "#28a745" if v >= 0 else "#dc3545"
-                            icon = "▲" if v >= 0 else "▼"
-                            return f'<span style="color: {color}; font-weight: bold;">{icon} {v:+.1f}%</span>'
-                        return f'''
-                        <div style="background-color: #ffffff; padding: 12px; border-radius: 8px; border: 1px solid #e0e0e0; text-align: center; height: 100%; box-shadow: 0 1px 3px rgba(0,0,0,0.05); margin-bottom: 15px;">
-                            <div style="font-size: 0.85rem; font-weight: bold; color: #666; margin-bottom: 5px; text-transform: uppercase;">{title}</div>
-                            <div style="font-size: 1.4rem; font-weight: bold; color: #00235d; margin-bottom: 8px;">${val:,.0f}</div>
-                            <div style="font-size: 0.8rem; color: #666; margin-bottom: 4px; display:flex; justify-content:center; padding:0 5px;"><span>{var1_label}:</span>&nbsp;&nbsp;{format_var(var1_val)}</div>
-                            <div style="font-size: 0.75rem; color: #00A8E8; font-weight: bold; margin-top: 8px; border-top: 1px dashed #eee; padding-top: 6px; display:flex; justify-content:space-between;">
-                                <span title="Porcentaje de la facturación total de repuestos aportada por este canal">🛒 Mix Venta: {mix_venta:.1f}%</span>
-                                <span title="Porcentaje de la rentabilidad (o pérdida) aportada por este canal al total general">💰 Mix Margen: {mix_margen:.1f}%</span>
-                            </div>
-                        </div>
-                        '''
-
                     total_rep_mes_act = df_fact_hist.iloc[idx_rep]['Repuestos']
 
-                    cols_grid = st.columns(4)
-                    
-                    for i, can in enumerate(cols_canales):
+                    # Tarjetas con Doble Mix (Venta y Margen): todas en una grilla de 4 columnas, un solo bloque
+                    tarjetas_canal = []
+                    for can in cols_canales:
                         val_act = mes_act_row[can]
-                        val_ant = mes_ant_row[can] if mes_ant_row is not None else 0
-                        var_mom = (val_act / val_ant - 1) * 100 if val_ant > 0 else 0
+                        var_mom = pct(var_canales[f'{can} MoM'])
                         
                         mix_pct_venta = (val_act / total_rep_mes_act) * 100 if total_rep_mes_act > 0 else 0
                         
@@ -1661,53 +1090,54 @@ try:
                         if margen_act_row is not None and f'Mix_Margen_{can}' in margen_act_row:
                             mix_pct_margen = margen_act_row[f'Mix_Margen_{can}']
                             
-                        card_html = html_card_rep(
+                        tarjetas_canal.append(tarjeta_canal(
                             can, val_act, 
                             "vs Mes Ant", var_mom, 
                             mix_pct_venta, mix_pct_margen
-                        )
-                        with cols_grid[i % 4]:
-                            st.markdown(card_html, unsafe_allow_html=True)
+                        ))
+                    render_fila(tarjetas_canal, anchos=[1] * 4)
                     
                     # --- GRÁFICOS: VENTA HISTÓRICA Y MARGEN BRUTO NOMINAL ---
                     c_graf_ven, c_graf_mar = st.columns(2)
                     
                     with c_graf_ven:
-                        fig_can_line = px.line(df_can_melt, x='Mes', y='Venta', color='Canal', markers=True, title="Tendencia de Facturación Nominal")
-                        fig_can_line.update_layout(height=350, yaxis_title="Facturación ($)", legend=dict(orientation="h", y=-0.2))
-                        st.plotly_chart(fig_can_line, use_container_width=True)
+                        def armar_fig_can_line():
+                            fig_can_line = px.line(df_can_melt, x='Mes', y='Venta', color='Canal', markers=True, title="Tendencia de Facturación Nominal")
+                            return fig_can_line.update_layout(height=350, yaxis_title="Facturación ($)", legend=dict(orientation="h", y=-0.2))
+                        st.plotly_chart(figura("hist_venta_canal", huella, (año_sel,), armar_fig_can_line), use_container_width=True)
                         
                     with c_graf_mar:
                         # Gráfico de barras agrupadas para el margen nominal ($)
-                        fig_margen_nominal = go.Figure()
-                        for can in cols_canales:
-                            if f'M_{can}' in df_margen.columns:
-                                fig_margen_nominal.add_trace(go.Bar(
-                                    x=df_margen['Mes'], 
-                                    y=df_margen[f'M_{can}'], 
-                                    name=can
-                                ))
-                        fig_margen_nominal.update_layout(
-                            barmode='group', # Agrupadas, no apiladas
-                            title="Evolución del Margen Bruto Nominal ($)", 
-                            height=350, 
-                            yaxis_title="Margen Bruto ($)",
-                            legend=dict(orientation="h", y=-0.2)
-                        )
-                        # Agregar línea en cero para resaltar canales que van a pérdida
-                        fig_margen_nominal.add_hline(y=0, line_width=1, line_color="black")
-                        st.plotly_chart(fig_margen_nominal, use_container_width=True)
+                        def armar_fig_margen_nominal():
+                            fig_margen_nominal = go.Figure()
+                            for can in cols_canales:
+                                if f'M_{can}' in df_margen.columns:
+                                    fig_margen_nominal.add_trace(go.Bar(
+                                        x=df_margen['Mes'], 
+                                        y=df_margen[f'M_{can}'], 
+                                        name=can
+                                    ))
+                            fig_margen_nominal.update_layout(
+                                barmode='group', # Agrupadas, no apiladas
+                                title="Evolución del Margen Bruto Nominal ($)", 
+                                height=350, 
+                                yaxis_title="Margen Bruto ($)",
+                                legend=dict(orientation="h", y=-0.2)
+                            )
+                            # Agregar línea en cero para resaltar canales que van a pérdida
+                            return fig_margen_nominal.add_hline(y=0, line_width=1, line_color="black")
+                        st.plotly_chart(figura("hist_margen_canal", huella, (año_sel,), armar_fig_margen_nominal), use_container_width=True)
 
                 st.markdown("---")
                 st.markdown("#### 📉 Flujo y Salud del Stock")
                 
                 # [CORRECCIÓN CENTRAL] Definimos las columnas de forma estricta para evitar duplicaciones
-                c_obj_compra = find_col(h_rep, ["OBJ", "COMPRA"]) or find_col(h_rep, ["OBJETIVO", "COMPRA"])
-                c_compra_pr = find_col(h_rep, ["COMPRA", "PR"], exclude_keywords=["OBJ"]) or find_col(h_rep, ["COMPRA"], exclude_keywords=["OBJ", "COSTO", "VENTA"])
+                c_obj_compra = kpi['obj_compra']
+                c_compra_pr = kpi['compra_pr']
                 
                 h_rep['CostoTotalMes'] = 0
-                for c in canales_repuestos:
-                    col_costo = find_col(h_rep, ["COSTO", c], exclude_keywords=["OBJ"])
+                for c in CANALES_REPUESTOS:
+                    col_costo = indice.col('REPUESTOS', ["COSTO", c], excluir=["OBJ"])
                     if col_costo: h_rep['CostoTotalMes'] += h_rep[col_costo]
                 
                 # Alimentamos el gráfico de flujo directamente con la columna real detectada arriba
@@ -1717,18 +1147,20 @@ try:
                 c_stk1, c_stk2 = st.columns(2)
                 with c_stk1:
                     h_rep['CostoPromedio3M'] = h_rep['CostoTotalMes'].rolling(window=3, min_periods=1).mean()
-                    col_val_stock = find_col(h_rep, ["VALOR", "STOCK"])
+                    col_val_stock = indice.col('REPUESTOS', ["VALOR", "STOCK"])
                     if col_val_stock:
-                        h_rep['MesesStock'] = h_rep.apply(lambda row: row[col_val_stock] / row['CostoPromedio3M'] if row['CostoPromedio3M'] > 0 else 0, axis=1)
-                        st.plotly_chart(go.Figure(go.Scatter(x=h_rep['NombreMes'], y=h_rep['MesesStock'], name='Meses Stock', mode='lines+markers', line=dict(color='#6610f2', width=3))).update_layout(title="Evolución Meses de Stock (Valor / Costo 3M)", height=320), use_container_width=True)
+                        h_rep['MesesStock'] = cociente(h_rep[col_val_stock], h_rep['CostoPromedio3M'])
+                        st.plotly_chart(figura("hist_meses_stock", huella, (año_sel,), lambda: go.Figure(go.Scatter(x=h_rep['NombreMes'], y=h_rep['MesesStock'], name='Meses Stock', mode='lines+markers', line=dict(color='#6610f2', width=3))).update_layout(title="Evolución Meses de Stock (Valor / Costo 3M)", height=320)), use_container_width=True)
                 
                 with c_stk2:
-                    col_vivo, col_obs, col_muerto = find_col(h_rep, ["VIVO"]), find_col(h_rep, ["OBSOLETO"]), find_col(h_rep, ["MUERTO"])
-                    fig_stk_salud = go.Figure()
-                    if col_vivo: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_vivo], name='Vivo', marker_color='#28a745'))
-                    if col_obs: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_obs], name='Obsoleto', marker_color='#ffc107'))
-                    if col_muerto: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_muerto], name='Muerto', marker_color='#dc3545'))
-                    st.plotly_chart(fig_stk_salud.update_layout(barmode='stack', title="Composición Salud del Stock", height=320), use_container_width=True)
+                    col_vivo, col_obs, col_muerto = indice.col('REPUESTOS', ["VIVO"]), indice.col('REPUESTOS', ["OBSOLETO"]), indice.col('REPUESTOS', ["MUERTO"])
+                    def armar_fig_stk_salud():
+                        fig_stk_salud = go.Figure()
+                        if col_vivo: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_vivo], name='Vivo', marker_color='#28a745'))
+                        if col_obs: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_obs], name='Obsoleto', marker_color='#ffc107'))
+                        if col_muerto: fig_stk_salud.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep[col_muerto], name='Muerto', marker_color='#dc3545'))
+                        return fig_stk_salud.update_layout(barmode='stack', title="Composición Salud del Stock", height=320)
+                    st.plotly_chart(figura("hist_salud_stock", huella, (año_sel,), armar_fig_stk_salud), use_container_width=True)
 
                 st.markdown("##### Flujo Operativo y Proyección")
                 total_var_anual = h_rep['VariacionStock'].sum()
@@ -1736,17 +1168,18 @@ try:
                 delta_color_anual = "normal" if total_var_anual < 0 else "inverse"
                 st.metric("Variación Acumulada Anual (Compras vs Salidas)", f"${total_var_anual:,.0f}", txt_var_anual, delta_color=delta_color_anual)
 
-                fig_flow = go.Figure()
-                fig_flow.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep['CompraTotalMes'], name='Compras (Entradas)', marker_color='#00235d'))
-                fig_flow.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep['CostoTotalMes'], name='Costo Venta (Salidas)', marker_color='#fd7e14'))
-                fig_flow.add_trace(go.Scatter(x=h_rep['NombreMes'], y=h_rep['VariacionStock'], name='Saldo', mode='lines+markers', line=dict(color='gray', width=2, dash='dot')))
-                st.plotly_chart(fig_flow.update_layout(title="Compras vs Costo de Venta Mensual", barmode='group', height=350), use_container_width=True)
+                def armar_fig_flow():
+                    fig_flow = go.Figure()
+                    fig_flow.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep['CompraTotalMes'], name='Compras (Entradas)', marker_color='#00235d'))
+                    fig_flow.add_trace(go.Bar(x=h_rep['NombreMes'], y=h_rep['CostoTotalMes'], name='Costo Venta (Salidas)', marker_color='#fd7e14'))
+                    fig_flow.add_trace(go.Scatter(x=h_rep['NombreMes'], y=h_rep['VariacionStock'], name='Saldo', mode='lines+markers', line=dict(color='gray', width=2, dash='dot')))
+                    return fig_flow.update_layout(title="Compras vs Costo de Venta Mensual", barmode='group', height=350)
+                st.plotly_chart(figura("hist_flujo_stock", huella, (año_sel,), armar_fig_flow), use_container_width=True)
 
                 ultimos_3 = h_rep.tail(3)
                 promedio_variacion = ultimos_3['VariacionStock'].mean()
                 
-                c_val_stock_actual = find_col(data['REPUESTOS'], ["VALOR", "STOCK"])
-                val_stock_actual = float(r_r.get(c_val_stock_actual, 0)) if c_val_stock_actual else 0
+                val_stock_actual = k.repuestos.val_stock
                 
                 costo_promedio_3m = ultimos_3['CostoTotalMes'].mean()
                 stock_objetivo_valor = costo_promedio_3m * 3.0 
@@ -1765,9 +1198,12 @@ try:
                         
                     vals_proy = [val_stock_actual + (promedio_variacion * i) for i in range(0, 6)]
                     df_proy = pd.DataFrame({"Mes": ["Act.", "+1", "+2", "+3", "+4", "+5"], "Valor": vals_proy})
-                    fig_proy = go.Figure(go.Bar(x=df_proy['Mes'], y=df_proy['Valor'], marker_color="#17a2b8", text=[f"${v/1000000:.1f}M" for v in vals_proy], textposition="auto"))
-                    fig_proy.add_hline(y=stock_objetivo_valor, line_dash="dash", line_color="#28a745", annotation_text="Meta")
-                    st.plotly_chart(fig_proy.update_layout(title="Simulación Reducción (5 meses)", height=300), use_container_width=True)
+                    def armar_fig_proy():
+                        fig_proy = go.Figure(go.Bar(x=df_proy['Mes'], y=df_proy['Valor'], marker_color="#17a2b8", text=[f"${v/1000000:.1f}M" for v in vals_proy], textposition="auto"))
+                        fig_proy.add_hline(y=stock_objetivo_valor, line_dash="dash", line_color="#28a745", annotation_text="Meta")
+                        return fig_proy.update_layout(title="Simulación Reducción (5 meses)", height=300)
+                    # Parte del stock del mes elegido: también va el mes en la clave
+                    st.plotly_chart(figura("hist_proyeccion_stock", huella, (año_sel, mes_sel), armar_fig_proy), use_container_width=True)
                 else:
                     c_proy3.metric("Ritmo de Variación (Prom 3M)", f"+${promedio_variacion:,.0f} / mes", "Stock en Aumento", delta_color="inverse")
                     st.error("❌ El promedio de los últimos 3 meses indica que el stock está AUMENTANDO.")
@@ -1777,19 +1213,12 @@ try:
                 st.markdown("#### 🎯 Cumplimiento de Compra Stellantis (Semestral)")
                 
                 if c_obj_compra and c_compra_pr:
-                    h_rep[c_obj_compra] = pd.to_numeric(h_rep[c_obj_compra], errors='coerce').fillna(0)
-                    h_rep[c_compra_pr] = pd.to_numeric(h_rep[c_compra_pr], errors='coerce').fillna(0)
-                    
-                    # Separar por semestres
-                    s1_df = h_rep[h_rep['Mes'] <= 6]
-                    s2_df = h_rep[h_rep['Mes'] >= 7]
-                    
-                    obj_s1 = s1_df[c_obj_compra].sum()
-                    compra_s1 = s1_df[c_compra_pr].sum()
+                    # Semestres: restas sobre las sumas acumuladas de la hoja
+                    acum = acumulados(meses, cubo)
+                    obj_s1, compra_s1 = acum.suma('REPUESTOS', [c_obj_compra, c_compra_pr], (año_sel, 1), (año_sel, 6))
                     pct_s1 = (compra_s1 / obj_s1 * 100) if obj_s1 > 0 else 0
                     
-                    obj_s2 = s2_df[c_obj_compra].sum()
-                    compra_s2 = s2_df[c_compra_pr].sum()
+                    obj_s2, compra_s2 = acum.suma('REPUESTOS', [c_obj_compra, c_compra_pr], (año_sel, 7), (año_sel, 12))
                     pct_s2 = (compra_s2 / obj_s2 * 100) if obj_s2 > 0 else 0
                     
                     # Lógica de Cuartiles
@@ -1827,17 +1256,17 @@ try:
             # ==========================================
             # PESTAÑA 4: CHAPA
             # ==========================================
-            with tab_cyp:
+            if sub_hist == "🎨 Chapa":
                 st.markdown("#### 💰 Evolución Facturación: Chapa y Pintura")
                 
                 # 1. Buscar columnas de facturación para Jujuy
-                c_mo_j = find_col(h_cyp_j, ['MO'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-                c_mo_t_j = find_col(h_cyp_j, ['MO', 'TERCERO'], exclude_keywords=['OBJ']) or find_col(h_cyp_j, ['MO', 'TER'], exclude_keywords=['OBJ'])
+                c_mo_j = indice.col('CyP JUJUY', ['MO'], excluir=['TER', 'OBJ', 'PRE'])
+                c_mo_t_j = kpi['cyp_mo_ter_j']
                 
                 # 2. Buscar columnas de facturación para Salta
-                c_mo_s = find_col(h_cyp_s, ['MO'], exclude_keywords=['TER', 'OBJ', 'PRE'])
-                c_mo_t_s = find_col(h_cyp_s, ['MO', 'TERCERO'], exclude_keywords=['OBJ']) or find_col(h_cyp_s, ['MO', 'TER'], exclude_keywords=['OBJ'])
-                c_rep_s = find_col(h_cyp_s, ['FACT', 'REP'], exclude_keywords=['OBJ', 'COSTO']) or find_col(h_cyp_s, ['REP'], exclude_keywords=['OBJ', 'COSTO'])
+                c_mo_s = indice.col('CyP SALTA', ['MO'], excluir=['TER', 'OBJ', 'PRE'])
+                c_mo_t_s = kpi['cyp_mo_ter_s']
+                c_rep_s = kpi['cyp_rep_s']
                 
                 def safe_col_sum(df, cols):
                     res = pd.Series(0, index=df.index)
@@ -1848,84 +1277,86 @@ try:
                 # 3. Calcular totales y variaciones Jujuy
                 h_cyp_j['MO Total'] = safe_col_sum(h_cyp_j, [c_mo_j, c_mo_t_j])
                 h_cyp_j['Fact Total'] = h_cyp_j['MO Total']
-                h_cyp_j['Var Fact'] = h_cyp_j['Fact Total'].pct_change().replace([np.inf, -np.inf], 0)
+                h_cyp_j['Var Fact'] = comparar_periodos(h_cyp_j, ['Fact Total'])['Fact Total MoM'].to_numpy()
 
                 # 4. Calcular totales y variaciones Salta
                 h_cyp_s['MO Total'] = safe_col_sum(h_cyp_s, [c_mo_s, c_mo_t_s])
                 h_cyp_s['Repuestos'] = safe_col_sum(h_cyp_s, [c_rep_s])
                 h_cyp_s['Fact Total'] = h_cyp_s['MO Total'] + h_cyp_s['Repuestos']
-                h_cyp_s['Var Fact'] = h_cyp_s['Fact Total'].pct_change().replace([np.inf, -np.inf], 0)
+                h_cyp_s['Var Fact'] = comparar_periodos(h_cyp_s, ['Fact Total'])['Fact Total MoM'].to_numpy()
 
                 c_fact_j, c_fact_s = st.columns(2)
                 
                 # 5. Gráfico Jujuy (Solo Mano de Obra)
                 with c_fact_j:
-                    fig_fj = go.Figure()
-                    fig_fj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['MO Total'], name='Mano de Obra', marker_color='#00235d'))
+                    def armar_fig_fj():
+                        fig_fj = go.Figure()
+                        fig_fj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['MO Total'], name='Mano de Obra', marker_color='#00235d'))
                     
-                    # Línea invisible para colocar los porcentajes arriba de la barra
-                    fig_fj.add_trace(go.Scatter(
-                        x=h_cyp_j['NombreMes'], y=h_cyp_j['Fact Total'], mode='text',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_j['Var Fact']],
-                        textposition='top center', textfont=dict(color="#444444", size=11), showlegend=False
-                    ))
+                        # Línea invisible para colocar los porcentajes arriba de la barra
+                        fig_fj.add_trace(go.Scatter(
+                            x=h_cyp_j['NombreMes'], y=h_cyp_j['Fact Total'], mode='text',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_j['Var Fact']],
+                            textposition='top center', textfont=dict(color="#444444", size=11), showlegend=False
+                        ))
                     
-                    max_y_fj = h_cyp_j['Fact Total'].max() * 1.25 if not h_cyp_j.empty else 100
-                    fig_fj.update_layout(
-                        barmode='stack', title="Facturación Jujuy", height=320, 
-                        margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_fj]), 
-                        legend=dict(orientation="h", y=-0.2)
-                    )
-                    st.plotly_chart(fig_fj, use_container_width=True)
+                        max_y_fj = h_cyp_j['Fact Total'].max() * 1.25 if not h_cyp_j.empty else 100
+                        fig_fj.update_layout(
+                            barmode='stack', title="Facturación Jujuy", height=320, 
+                            margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_fj]), 
+                            legend=dict(orientation="h", y=-0.2)
+                        )
+                        return fig_fj
+                    st.plotly_chart(figura("hist_cyp_fact_jujuy", huella, (año_sel,), armar_fig_fj), use_container_width=True)
 
                 # 6. Gráfico Salta (Mano de Obra + Repuestos apilados)
                 with c_fact_s:
-                    fig_fs = go.Figure()
-                    fig_fs.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['MO Total'], name='Mano de Obra', marker_color='#00235d'))
-                    fig_fs.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Repuestos'], name='Repuestos', marker_color='#28a745'))
+                    def armar_fig_fs():
+                        fig_fs = go.Figure()
+                        fig_fs.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['MO Total'], name='Mano de Obra', marker_color='#00235d'))
+                        fig_fs.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Repuestos'], name='Repuestos', marker_color='#28a745'))
                     
-                    # Línea invisible para colocar los porcentajes arriba de la barra total
-                    fig_fs.add_trace(go.Scatter(
-                        x=h_cyp_s['NombreMes'], y=h_cyp_s['Fact Total'], mode='text',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_s['Var Fact']],
-                        textposition='top center', textfont=dict(color="#444444", size=11), showlegend=False
-                    ))
+                        # Línea invisible para colocar los porcentajes arriba de la barra total
+                        fig_fs.add_trace(go.Scatter(
+                            x=h_cyp_s['NombreMes'], y=h_cyp_s['Fact Total'], mode='text',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_s['Var Fact']],
+                            textposition='top center', textfont=dict(color="#444444", size=11), showlegend=False
+                        ))
                     
-                    max_y_fs = h_cyp_s['Fact Total'].max() * 1.25 if not h_cyp_s.empty else 100
-                    fig_fs.update_layout(
-                        barmode='stack', title="Facturación Salta", height=320, 
-                        margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_fs]), 
-                        legend=dict(orientation="h", y=-0.2)
-                    )
-                    st.plotly_chart(fig_fs, use_container_width=True)
+                        max_y_fs = h_cyp_s['Fact Total'].max() * 1.25 if not h_cyp_s.empty else 100
+                        fig_fs.update_layout(
+                            barmode='stack', title="Facturación Salta", height=320, 
+                            margin=dict(t=30, b=0, l=0, r=0), yaxis=dict(range=[0, max_y_fs]), 
+                            legend=dict(orientation="h", y=-0.2)
+                        )
+                        return fig_fs
+                    st.plotly_chart(figura("hist_cyp_fact_salta", huella, (año_sel,), armar_fig_fs), use_container_width=True)
 
                 # --- SECCIÓN ORIGINAL DE PAÑOS ---
                 st.markdown("---")
                 st.markdown("#### 🎨 Análisis de Paños (Jujuy y Salta)")
                 c_hist_j, c_hist_s = st.columns(2)
                 
-                col_pp_j = find_col(h_cyp_j, ['PANOS'], exclude_keywords=['TER', 'OBJ', 'PRE']) or find_col(h_cyp_j, ['PAÑOS'], exclude_keywords=['TER', 'OBJ'])
-                col_pt_j = find_col(h_cyp_j, ['PANOS', 'TER']) or find_col(h_cyp_j, ['PAÑOS', 'TER'])
+                col_pp_j = kpi['cyp_panos_hist_j']
+                col_pt_j = kpi['cyp_panos_ter_j']
                 h_cyp_j['Paños Propios'] = h_cyp_j[col_pp_j] if col_pp_j else 0
                 h_cyp_j['Paños Terceros'] = h_cyp_j[col_pt_j] if col_pt_j else 0
                 
-                col_pp_s = find_col(h_cyp_s, ['PANOS'], exclude_keywords=['TER', 'OBJ']) or find_col(h_cyp_s, ['PAÑOS'], exclude_keywords=['TER', 'OBJ'])
-                col_pt_s = find_col(h_cyp_s, ['PANOS', 'TER']) or find_col(h_cyp_s, ['PAÑOS', 'TER'])
+                col_pp_s = kpi['cyp_panos_hist_s']
+                col_pt_s = kpi['cyp_panos_ter_s']
                 h_cyp_s['Paños Propios'] = h_cyp_s[col_pp_s] if col_pp_s else 0
                 h_cyp_s['Paños Terceros'] = h_cyp_s[col_pt_s] if col_pt_s else 0
                 
                 h_cyp_j['Total Paños'] = h_cyp_j['Paños Propios'] + h_cyp_j['Paños Terceros']
-                h_cyp_j['Var %'] = h_cyp_j['Total Paños'].pct_change()
-                h_cyp_j.replace([np.inf, -np.inf], 0, inplace=True)
+                h_cyp_j['Var %'] = comparar_periodos(h_cyp_j, ['Total Paños'])['Total Paños MoM'].to_numpy()
                 
                 h_cyp_s['Total Paños'] = h_cyp_s['Paños Propios'] + h_cyp_s['Paños Terceros']
-                h_cyp_s['Var %'] = h_cyp_s['Total Paños'].pct_change()
-                h_cyp_s.replace([np.inf, -np.inf], 0, inplace=True)
+                h_cyp_s['Var %'] = comparar_periodos(h_cyp_s, ['Total Paños'])['Total Paños MoM'].to_numpy()
 
                 idx_metric_cyp = -2 if prog_t < 1.0 else -1
                 def get_metric_data(df_h):
                     if len(df_h) >= abs(idx_metric_cyp):
-                        return df_h['Total Paños'].iloc[idx_metric_cyp], df_h['Var %'].iloc[idx_metric_cyp], df_h['NombreMes'].iloc[idx_metric_cyp]
+                        return df_h['Total Paños'].iloc[idx_metric_cyp], df_h['Var %'].fillna(0).iloc[idx_metric_cyp], df_h['NombreMes'].iloc[idx_metric_cyp]
                     elif len(df_h) == 1:
                         return df_h['Total Paños'].iloc[0], 0.0, df_h['NombreMes'].iloc[0]
                     return 0.0, 0.0, "N/A"
@@ -1935,29 +1366,92 @@ try:
                 
                 with c_hist_j:
                     st.metric(f"Var. a Mes Cerrado ({mes_j})", f"{val_j:.0f} Paños", f"{var_j * 100:.1f}% vs Anterior")
-                    fig_pj = go.Figure()
-                    fig_pj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['Paños Propios'], name='Propios', marker_color='#00235d'))
-                    fig_pj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['Paños Terceros'], name='Terceros', marker_color='#17a2b8'))
-                    fig_pj.add_trace(go.Scatter(
-                        x=h_cyp_j['NombreMes'], y=h_cyp_j['Total Paños'], name='Tendencia', mode='lines+markers+text',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_j['Var %']],
-                        textposition="top center", textfont=dict(color="#444444", size=11), line=dict(color='#ffc107', width=3)
-                    ))
-                    max_y_j = h_cyp_j['Total Paños'].max() if not h_cyp_j.empty else 100
-                    st.plotly_chart(fig_pj.update_layout(barmode='stack', title="Evolución Jujuy (Paños)", height=350, yaxis=dict(range=[0, max_y_j * 1.2])), use_container_width=True)
+                    def armar_fig_pj():
+                        fig_pj = go.Figure()
+                        fig_pj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['Paños Propios'], name='Propios', marker_color='#00235d'))
+                        fig_pj.add_trace(go.Bar(x=h_cyp_j['NombreMes'], y=h_cyp_j['Paños Terceros'], name='Terceros', marker_color='#17a2b8'))
+                        fig_pj.add_trace(go.Scatter(
+                            x=h_cyp_j['NombreMes'], y=h_cyp_j['Total Paños'], name='Tendencia', mode='lines+markers+text',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_j['Var %']],
+                            textposition="top center", textfont=dict(color="#444444", size=11), line=dict(color='#ffc107', width=3)
+                        ))
+                        max_y_j = h_cyp_j['Total Paños'].max() if not h_cyp_j.empty else 100
+                        return fig_pj.update_layout(barmode='stack', title="Evolución Jujuy (Paños)", height=350, yaxis=dict(range=[0, max_y_j * 1.2]))
+                    st.plotly_chart(figura("hist_cyp_panos_jujuy", huella, (año_sel,), armar_fig_pj), use_container_width=True)
                 
                 with c_hist_s:
                     st.metric(f"Var. a Mes Cerrado ({mes_s})", f"{val_s:.0f} Paños", f"{var_s * 100:.1f}% vs Anterior")
-                    fig_ps = go.Figure()
-                    fig_ps.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Paños Propios'], name='Propios', marker_color='#00235d'))
-                    fig_ps.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Paños Terceros'], name='Terceros', marker_color='#17a2b8'))
-                    fig_ps.add_trace(go.Scatter(
-                        x=h_cyp_s['NombreMes'], y=h_cyp_s['Total Paños'], name='Tendencia', mode='lines+markers+text',
-                        text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_s['Var %']],
-                        textposition="top center", textfont=dict(color="#444444", size=11), line=dict(color='#ffc107', width=3)
-                    ))
-                    max_y_s = h_cyp_s['Total Paños'].max() if not h_cyp_s.empty else 100
-                    st.plotly_chart(fig_ps.update_layout(barmode='stack', title="Evolución Salta (Paños)", height=350, yaxis=dict(range=[0, max_y_s * 1.2])), use_container_width=True)
+                    def armar_fig_ps():
+                        fig_ps = go.Figure()
+                        fig_ps.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Paños Propios'], name='Propios', marker_color='#00235d'))
+                        fig_ps.add_trace(go.Bar(x=h_cyp_s['NombreMes'], y=h_cyp_s['Paños Terceros'], name='Terceros', marker_color='#17a2b8'))
+                        fig_ps.add_trace(go.Scatter(
+                            x=h_cyp_s['NombreMes'], y=h_cyp_s['Total Paños'], name='Tendencia', mode='lines+markers+text',
+                            text=[f"{v*100:+.1f}%" if pd.notna(v) and v != 0 else "" for v in h_cyp_s['Var %']],
+                            textposition="top center", textfont=dict(color="#444444", size=11), line=dict(color='#ffc107', width=3)
+                        ))
+                        max_y_s = h_cyp_s['Total Paños'].max() if not h_cyp_s.empty else 100
+                        return fig_ps.update_layout(barmode='stack', title="Evolución Salta (Paños)", height=350, yaxis=dict(range=[0, max_y_s * 1.2]))
+                    st.plotly_chart(figura("hist_cyp_panos_salta", huella, (año_sel,), armar_fig_ps), use_container_width=True)
+
+            # ==========================================
+            # PESTAÑA 5: PERÍODOS
+            # ==========================================
+            if sub_hist == "📅 Períodos":
+                st.markdown("#### 📅 Resumen por Período")
+                # Cada total es una resta sobre las sumas acumuladas de todo el historial: cambiar de período no reagrupa nada
+                acum = acumulados(meses, cubo)
+                # Como el resto del Histórico: con el mes elegido en curso, el período termina en el último mes cerrado
+                fin = (año_sel, mes_sel) if prog_t >= 1.0 else año_mes(mes_abs(año_sel, mes_sel) - 1)
+                def nom_periodo(am): return f"{meses_nom.get(am[1], 'N/A')} {am[0]}"
+
+                c_per, c_desde, c_hasta = st.columns([3, 1, 1])
+                periodo = c_per.radio("Período", PERIODOS, horizontal=True, key="periodo_historico")
+                if periodo == "Personalizado":
+                    disponibles = sorted(meses['CALENDARIO'].filas) if 'CALENDARIO' in meses else [fin]
+                    inicio_anio = rango_periodo("Año a la fecha", *fin)[0]
+                    desde = c_desde.selectbox("Desde", disponibles, index=disponibles.index(inicio_anio) if inicio_anio in disponibles else 0,
+                                              format_func=nom_periodo, key="periodo_desde")
+                    hasta = c_hasta.selectbox("Hasta", disponibles, index=disponibles.index(fin) if fin in disponibles else len(disponibles) - 1,
+                                              format_func=nom_periodo, key="periodo_hasta")
+                else:
+                    desde, hasta = rango_periodo(periodo, *fin)
+
+                if desde > hasta:
+                    st.warning("⚠️ El mes 'Desde' es posterior al mes 'Hasta'.")
+                else:
+                    desde_ant, hasta_ant = (desde[0] - 1, desde[1]), (hasta[0] - 1, hasta[1])
+                    act = resumen_periodo(acum, indice, desde, hasta)
+                    ant = resumen_periodo(acum, indice, desde_ant, hasta_ant)
+                    def card_periodo(nombre, **formato):
+                        return tarjeta_comparativa(nombre, act[nombre], "vs Año Ant", pct(float(variacion(act[nombre], ant[nombre]))), **formato)
+
+                    st.markdown(f"**{nom_periodo(desde)} a {nom_periodo(hasta)}** (vs {nom_periodo(desde_ant)} a {nom_periodo(hasta_ant)})")
+                    render_fila([card_periodo("Facturación Servicios", es_moneda=True), card_periodo("Facturación Repuestos", es_moneda=True), card_periodo("Hs Vendidas")])
+                    render_fila([card_periodo("CPUS"), card_periodo("TUS"), card_periodo("Ticket Hs", es_ticket=True)])
+
+                # Trimestres y semestres del año, cortados en el último mes cerrado
+                st.markdown("---")
+                st.markdown(f"**Trimestres y Semestres {fin[0]} vs {fin[0] - 1}**")
+                metricas_tabla = {"Facturación Servicios": "${:,.0f}", "Facturación Repuestos": "${:,.0f}", "CPUS": "{:,.0f}", "Ticket Hs": "{:.2f}"}
+                filas_periodos = []
+                for nombre, m0, m1 in [*[(f"T{t}", 3 * t - 2, 3 * t) for t in range(1, 5)], ("S1", 1, 6), ("S2", 7, 12), ("Año", 1, 12)]:
+                    if m0 > fin[1]: continue
+                    if m1 > fin[1]: nombre, m1 = f"{nombre} (a {meses_nom.get(fin[1], 'N/A')})", fin[1]
+                    act = resumen_periodo(acum, indice, (fin[0], m0), (fin[0], m1))
+                    ant = resumen_periodo(acum, indice, (fin[0] - 1, m0), (fin[0] - 1, m1))
+                    fila = {"Período": nombre}
+                    for m in metricas_tabla:
+                        fila[m], fila[f"Var {m}"] = act[m], float(variacion(act[m], ant[m])) * 100
+                    filas_periodos.append(fila)
+                formatos = {**metricas_tabla, **{f"Var {m}": "{:+.1f}%" for m in metricas_tabla}}
+                st.dataframe(pd.DataFrame(filas_periodos).style.format(formatos, na_rep="-"), use_container_width=True, hide_index=True)
+
+        sin_resolver, ambiguas = indice.avisos()
+        if sin_resolver or ambiguas:
+            with st.sidebar.expander("🔎 Diagnóstico de columnas", expanded=False):
+                for a in sin_resolver: st.caption(f"❌ Sin resolver: {a}")
+                for a in ambiguas: st.caption(f"⚠️ Ambigua: {a}")
 
     else:
         st.warning("No se pudieron cargar los datos.")
@@ -0,0 +1,337 @@
+import pandas as pd
+import numpy as np
+import os
+import io
+import sys
+import time
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fuentes import TIMEOUT_HOJA_SEG, fuente_desde_config
+
+# --- CARGA DE DATOS ROBUSTA E INTELIGENTE ---
+# Descarga y normalización de las hojas del tablero, sin dependencias de Streamlit
+# (se puede correr y medir por fuera del dashboard: ver el bloque __main__ al final).
+
+HOJAS_NORMALES = ['CALENDARIO', 'SERVICIOS', 'REPUESTOS', 'TALLER', 'CyP JUJUY', 'CyP SALTA', 'WIP']
+HOJAS_COSTOS = ['Cta Res Taller', 'Cta Res Repuestos', 'Cta Res Chapa Jujuy', 'Cta Res Chapa Salta']
+MAX_DESCARGAS_SIMULTANEAS = 6  # Conexiones en paralelo contra la fuente
+# Hojas con una fila por fecha: al cargarlas se les agregan Fecha_dt, Mes y Año
+HOJAS_FECHADAS = ['CALENDARIO', 'SERVICIOS', 'REPUESTOS', 'TALLER', 'CyP JUJUY', 'CyP SALTA']
+COLUMNAS_DERIVADAS = ['Fecha_dt', 'Mes', 'Año']
+
+# --- ESQUEMA DE LAS HOJAS ---
+# Qué columnas de cada hoja son fecha o texto (por palabra clave en el título); el resto es numérico.
+CLAVES_FECHA = ["FECHA"]
+CLAVES_TEXTO = ["CANAL", "ESTADO", "MATRICUL", "MODELO", "DESCRIPCION", "TIPO", "VIN", "BASTIDOR", "NOMBRE"]
+ESQUEMA_HOJAS = {h: {"fecha": CLAVES_FECHA, "texto": CLAVES_TEXTO} for h in HOJAS_NORMALES}
+ESQUEMA_HOJAS['WIP'] = {"fecha": CLAVES_FECHA + ["APER"], "texto": CLAVES_TEXTO}
+ESQUEMA_COSTOS = {"fecha": [], "texto": ["RUBRO", "CONCEPTO"]}
+
+# Formatos en los que la planilla entrega las fechas (se prueban en orden, sin inferencia; %d y %m aceptan "1/3/2025")
+FORMATOS_FECHA = ["%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d-%m-%Y", "%d/%m/%y"]
+FORMATOS_TITULO_COSTOS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+# Tablas para limpiar el bloque de bytes: se borra todo lo que no sea dígito, coma, signo o separador
+BORRAR_NO_NUMERICO = bytes(c for c in range(256) if c not in b"0123456789,-\x00")
+COMA_A_PUNTO = bytes.maketrans(b",", b".")
+
+def tipo_columna(esquema, col):
+    if any(k in col for k in esquema["fecha"]): return "fecha"
+    if any(k in col for k in esquema["texto"]): return "texto"
+    return "numero"
+
+def columnas_numericas(df, esquema):
+    return [i for i, col in enumerate(df.columns) if tipo_columna(esquema, col) == "numero"]
+
+def _a_float(texto):
+    try: return float(texto)
+    except ValueError: return np.nan
+
+def convertir_numeros(df, posiciones):
+    # Una sola pasada para todas las columnas numéricas: apilamos las celdas en un único bloque de bytes,
+    # lo limpiamos de una vez ("$ 1.234,5" -> "1234.5") y lo convertimos entero a float.
+    if not posiciones or df.empty: return df
+    n = len(df)
+    celdas = df.iloc[:, posiciones].to_numpy(dtype=object).T.ravel().tolist()
+    bloque = "\x00".join(celdas).encode("utf-8").translate(COMA_A_PUNTO, BORRAR_NO_NUMERICO)
+    partes = bloque.split(b"\x00")
+    valores = np.fromiter(map(_a_float, partes), dtype=float, count=len(partes)).reshape(len(posiciones), n)
+    for j, pos in enumerate(posiciones):
+        col = valores[j]
+        invalidos = np.isnan(col)
+        # Igual que pd.to_numeric: la columna queda entera si todas sus celdas eran enteros válidos
+        if not invalidos.any() and np.abs(col).max() < 2**53 and b"." not in b"\x00".join(partes[j * n:(j + 1) * n]):
+            df.isetitem(pos, col.astype(np.int64))
+        else:
+            df.isetitem(pos, np.where(invalidos, 0.0, col))
+    return df
+
+def parsear_fechas(serie, formatos=FORMATOS_FECHA):
+    texto = serie.astype(str).str.strip()
+    res = pd.to_datetime(texto, format=formatos[0], errors='coerce')
+    for fmt in formatos[1:]:
+        pendientes = res.isna()
+        if not pendientes.any(): break
+        res = res.where(~pendientes, pd.to_datetime(texto[pendientes], format=fmt, errors='coerce'))
+    return res
+
+def columna_fecha(df):
+    # La primera columna FECHA (o la primera de la hoja)
+    return next((c for c in df.columns if "FECHA" in c), df.columns[0])
+
+def agregar_fechas(df):
+    # Único paso de fechas de las hojas fechadas
+    fechas = parsear_fechas(df[columna_fecha(df)])
+    df['Fecha_dt'] = fechas
+    df['Mes'] = fechas.dt.month
+    df['Año'] = fechas.dt.year
+    return df
+
+def huella_contenido(contenido):
+    return hashlib.sha1(contenido).hexdigest()
+
+def tabla_hoja_normal(contenido):
+    # La hoja como texto, con los títulos normalizados: todavía sin convertir
+    df = pd.read_csv(io.BytesIO(contenido), header=0, dtype=str).fillna("0")
+    df = df.dropna(how='all')
+    df.columns = [
+        str(c).strip().upper()
+        .replace(".", "")
+        .replace("Á", "A").replace("É", "E").replace("Í", "I").replace("Ó", "O").replace("Ú", "U")
+        .replace("Ñ", "N") 
+        for c in df.columns
+    ]
+    return df
+
+def normalizar_hoja_normal(contenido, hoja=None):
+    df = tabla_hoja_normal(contenido)
+    esquema = ESQUEMA_HOJAS.get(hoja, {"fecha": CLAVES_FECHA, "texto": CLAVES_TEXTO})
+    df = convertir_numeros(df, columnas_numericas(df, esquema))
+    return agregar_fechas(df) if hoja in HOJAS_FECHADAS else df
+
+def tabla_hoja_costos(contenido):
+    # Pasos 1 a 6: títulos traducidos y filas útiles, con los importes todavía como texto
+    df_raw = pd.read_csv(io.BytesIO(contenido), header=None, dtype=str).fillna("")
+    
+    # 1. Encontrar la fila real de cabecera
+    idx_header = 0
+    for i in range(min(5, len(df_raw))):
+        fila_texto = "".join(df_raw.iloc[i].astype(str).values).upper()
+        if "RUBRO" in fila_texto or "UBRO" in fila_texto:
+            idx_header = i
+            break
+    
+    # 2. Tomar los títulos de esa fila
+    titulos_crudos = df_raw.iloc[idx_header].astype(str).str.strip().values
+    
+    # 3. Limpiar y estandarizar (AQUÍ TRADUCIMOS LAS FECHAS)
+    # Las fechas vienen como código numérico interno de Google Sheets (ej: 45689) o como texto
+    # largo (ej: "2025-01-01 00:00:00"); se traducen todas juntas con formatos explícitos.
+    serie_titulos = pd.Series(titulos_crudos, dtype=object)
+    numeros = pd.to_numeric(serie_titulos, errors='coerce')
+    es_serial = serie_titulos.str.replace('.', '', n=1, regex=False).str.isdigit() & (numeros > 40000)
+    fechas = parsear_fechas(serie_titulos, FORMATOS_TITULO_COSTOS)
+    if es_serial.any():
+        fechas[es_serial] = pd.to_datetime(numeros[es_serial], unit='D', origin='1899-12-30')
+    meses_es = {1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril", 5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"}
+    
+    titulos_limpios = []
+    for t, fecha in zip(titulos_crudos, fechas):
+        t_upper = t.upper().replace(" ", "")
+        if "UBRO" in t_upper or "RUBRO" in t_upper:
+            titulos_limpios.append("RUBRO")
+        elif "CONCEPTO" in t_upper:
+            titulos_limpios.append("CONCEPTO")
+        elif t == "" or "UNNAMED" in t_upper or "%" in t_upper:
+            titulos_limpios.append(t) # Lo descartamos luego
+        elif pd.notna(fecha):
+            anio_corto = str(fecha.year)[-2:] # Toma los ultimos 2 digitos (2025 -> 25)
+            titulos_limpios.append(f"{meses_es[fecha.month]} {anio_corto}")
+        else:
+            # Si no es una fecha, deja el texto que estaba
+            titulos_limpios.append(t_upper)
+    
+    # 4. Crear el DataFrame limpio
+    df_clean = df_raw.iloc[idx_header+1:].copy()
+    df_clean.columns = titulos_limpios
+    
+    # 5. Eliminar columnas vacías o de porcentajes
+    cols_to_drop = [c for c in df_clean.columns if '%' in c or 'UNNAMED' in c or c == ""]
+    df_clean = df_clean.drop(columns=cols_to_drop)
+    
+    # 6. Filtrar filas donde CONCEPTO esté vacío
+    if 'CONCEPTO' in df_clean.columns:
+        df_clean = df_clean[df_clean['CONCEPTO'] != "0"]
+        df_clean = df_clean[df_clean['CONCEPTO'] != ""]
+    return df_clean
+
+def normalizar_hoja_costos(contenido, hoja=None):
+    # 7. Convertir el dinero a números
+    df = tabla_hoja_costos(contenido)
+    return convertir_numeros(df, columnas_numericas(df, ESQUEMA_COSTOS))
+
+def cargar_datos(fuente, previas=None, max_descargas=MAX_DESCARGAS_SIMULTANEAS, timeout=TIMEOUT_HOJA_SEG):
+    # previas: hoja -> (huella, DataFrame) de la última carga buena. Devuelve (data_dict, huellas, errores).
+    previas = previas or {}
+    data_dict, huellas, errores = {}, {}, []
+
+    def normalizar_si_cambio(h, contenido, normalizar):
+        # Solo re-parseamos las hojas cuyo CSV cambió desde la última carga
+        huella = huella_contenido(contenido)
+        previa = previas.get(h)
+        huellas[h] = huella
+        if previa is not None and previa[0] == huella:
+            return previa[1]
+        return normalizar(contenido, h)
+
+    # Las descargas corren en paralelo; cada hoja se normaliza apenas llega
+    with ThreadPoolExecutor(max_workers=max_descargas) as pool:
+        futuros = {pool.submit(fuente.leer, h, timeout): h for h in HOJAS_NORMALES + HOJAS_COSTOS}
+        for fut in as_completed(futuros):
+            h = futuros[fut]
+            if h in HOJAS_COSTOS:
+                # Hojas de Costos (Lógica Blindada + TRADUCTOR DE FECHAS)
+                try:
+                    data_dict[h] = normalizar_si_cambio(h, fut.result(), normalizar_hoja_costos)
+                except Exception as e:
+                    errores.append(f"Error cargando hoja de costos {h}: {e}")
+            else:
+                # Hojas Normales (CON PROTECCIÓN DE FECHAS)
+                try:
+                    data_dict[h] = normalizar_si_cambio(h, fut.result(), normalizar_hoja_normal)
+                except Exception as e:
+                    errores.append(f"Error cargando {h}: {e}")
+
+    # Mantenemos el orden original de las hojas
+    data_dict = {h: data_dict[h] for h in HOJAS_NORMALES + HOJAS_COSTOS if h in data_dict}
+    return data_dict, huellas, errores
+
+# --- ÍNDICE MENSUAL ---
+# Foto de cada mes por hoja, armada una vez por carga: elegir año/mes es una consulta a un diccionario
+# en lugar de filtrar y ordenar toda la historia en cada rerun. Requiere Fecha_dt, Año y Mes.
+
+class IndiceMensual:
+    def __init__(self, df):
+        con_fecha = df[df['Fecha_dt'].notna()]
+        # Última fila de cada (año, mes) según Fecha_dt; orden estable: ante empates gana la de más abajo
+        ultimas = con_fecha.sort_values('Fecha_dt', kind='stable').drop_duplicates(['Año', 'Mes'], keep='last')
+        self.filas = {(int(a), int(m)): fila for (_, fila), a, m in zip(ultimas.iterrows(), ultimas['Año'], ultimas['Mes'])}
+        # Cierre mensual de cada año: último valor de cada columna por mes, como groupby('Mes').last()
+        self.anios = {int(a): g.groupby('Mes').last().reset_index() for a, g in con_fecha.groupby('Año')}
+        self._anio_vacio = con_fecha.iloc[:0].groupby('Mes').last().reset_index()
+
+    def fila(self, año, mes):
+        fila = self.filas.get((año, mes))
+        return fila if fila is not None else pd.Series(dtype='object')
+
+    def anio(self, año):
+        # Compartido entre reruns: quien lo quiera modificar debe copiarlo
+        return self.anios.get(año, self._anio_vacio)
+
+    def meses_de(self, año):
+        return sorted(m for a, m in self.filas if a == año)
+
+    def años(self):
+        return sorted({a for a, _ in self.filas})
+
+# --- SNAPSHOT EN DISCO (ARRANQUE SIN ESPERAR A GOOGLE SHEETS) ---
+DIR_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_tablero")
+
+def guardar_snapshot(clave, data_dict, huellas):
+    carpeta = os.path.join(DIR_SNAPSHOT, clave)
+    os.makedirs(carpeta, exist_ok=True)
+    manifiesto = {"guardado": time.time(), "hojas": {}}
+    for h, df in data_dict.items():
+        nombre = h.replace(" ", "_")
+        # Parquet conserva los tipos; si la hoja no es compatible (ej: columnas duplicadas) usamos pickle
+        try:
+            archivo = nombre + ".parquet"
+            df.to_parquet(os.path.join(carpeta, archivo + ".tmp"))
+        except Exception:
+            archivo = nombre + ".pkl"
+            df.to_pickle(os.path.join(carpeta, archivo + ".tmp"))
+        os.replace(os.path.join(carpeta, archivo + ".tmp"), os.path.join(carpeta, archivo))
+        manifiesto["hojas"][h] = {"archivo": archivo, "huella": huellas.get(h)}
+    with open(os.path.join(carpeta, "manifiesto.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False)
+    os.replace(os.path.join(carpeta, "manifiesto.json.tmp"), os.path.join(carpeta, "manifiesto.json"))
+
+def leer_snapshot(clave):
+    carpeta = os.path.join(DIR_SNAPSHOT, clave)
+    try:
+        with open(os.path.join(carpeta, "manifiesto.json"), encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    data_dict, huellas = {}, {}
+    for h, info in manifiesto.get("hojas", {}).items():
+        ruta = os.path.join(carpeta, info["archivo"])
+        try:
+            data_dict[h] = pd.read_parquet(ruta) if ruta.endswith(".parquet") else pd.read_pickle(ruta)
+            # Snapshots guardados antes de derivar las fechas en la carga
+            if h in HOJAS_FECHADAS and 'Fecha_dt' not in data_dict[h].columns:
+                agregar_fechas(data_dict[h])
+            huellas[h] = info.get("huella")
+        except Exception:
+            continue
+    if not data_dict: return None
+    return data_dict, huellas, manifiesto.get("guardado", 0.0)
+
+# --- CONVERSIÓN ORIGINAL (REFERENCIA PARA MEDIR Y COMPARAR) ---
+# Como lo hacía el tablero antes del esquema: columna por columna con regex, y fechas con inferencia dayfirst
+
+def convertir_numeros_original(df, posiciones):
+    for pos in posiciones:
+        serie = df.iloc[:, pos].astype(str).str.replace(r'[^\d.,-]', '', regex=True)
+        serie = serie.str.replace('.', '', regex=False)
+        serie = serie.str.replace(',', '.', regex=False)
+        df.isetitem(pos, pd.to_numeric(serie, errors='coerce').fillna(0.0))
+    return df
+
+def parsear_fechas_original(serie):
+    return pd.to_datetime(serie, dayfirst=True, errors='coerce')
+
+def mejor_de(veces, funcion):
+    tiempos = []
+    for _ in range(veces):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos)
+
+if __name__ == "__main__":
+    # Medición de la carga completa: python carga.py [sheet_id]  (la fuente sale de TABLERO_FUENTE)
+    fuente = fuente_desde_config(sys.argv[1] if len(sys.argv) > 1 else "")
+    t0 = time.perf_counter()
+    data_dict, huellas, errores = cargar_datos(fuente)
+    print(f"Carga completa: {time.perf_counter() - t0:.3f} s")
+    for err in errores:
+        print(f"  ! {err}")
+    # Tiempo de normalización por hoja (sin la descarga)
+    for h, df in data_dict.items():
+        contenido = fuente.leer(h)
+        normalizar = normalizar_hoja_costos if h in HOJAS_COSTOS else normalizar_hoja_normal
+        t0 = time.perf_counter()
+        normalizar(contenido, h)
+        print(f"  {h:<22} {len(df):>7} filas x {len(df.columns):>3} columnas  {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    # Números y fechas antes y ahora sobre la misma tabla de texto (mejor de 5); avisa si el resultado difiere
+    print("Conversión (mejor de 5)                    antes      ahora")
+    for h in data_dict:
+        contenido = fuente.leer(h)
+        if h in HOJAS_COSTOS: tabla, esquema = tabla_hoja_costos(contenido), ESQUEMA_COSTOS
+        else: tabla, esquema = tabla_hoja_normal(contenido), ESQUEMA_HOJAS.get(h, {"fecha": CLAVES_FECHA, "texto": CLAVES_TEXTO})
+        posiciones = columnas_numericas(tabla, esquema)
+        fechas = tabla[columna_fecha(tabla)] if h in HOJAS_FECHADAS else None
+        t_antes = mejor_de(5, lambda: convertir_numeros_original(tabla.copy(), posiciones))
+        t_ahora = mejor_de(5, lambda: convertir_numeros(tabla.copy(), posiciones))
+        iguales = convertir_numeros_original(tabla.copy(), posiciones).equals(convertir_numeros(tabla.copy(), posiciones))
+        print(f"  {h:<22} números  {t_antes * 1000:8.1f} ms {t_ahora * 1000:8.1f} ms{'' if iguales else '  ! distinto'}")
+        if fechas is not None:
+            t_antes = mejor_de(5, lambda: parsear_fechas_original(fechas))
+            t_ahora = mejor_de(5, lambda: parsear_fechas(fechas))
+            antes, ahora = parsear_fechas_original(fechas), parsear_fechas(fechas)
+            distintas = (~(antes.eq(ahora) | (antes.isna() & ahora.isna()))).sum()
+            print(f"  {'':<22} fechas   {t_antes * 1000:8.1f} ms {t_ahora * 1000:8.1f} ms"
+                  f"{f'  ! {distintas} distintas' if distintas else ''}")
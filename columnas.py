@@ -0,0 +1,103 @@
+from carga import COLUMNAS_DERIVADAS
+
+# --- ÍNDICE DE COLUMNAS ---
+# Las columnas de la planilla se buscan por palabras clave en el título. El índice se arma una vez
+# por versión de los datos y memoiza cada búsqueda (hoja, incluir, excluir): en cada rerun resolver
+# una columna es una consulta a un diccionario.
+
+# Columnas de KPI con búsquedas alternativas (se usa la primera que resuelva).
+# nombre -> (hoja, [(incluir, excluir), ...])
+COLUMNAS_KPI = {
+    # Servicios
+    'mo_cli': ('SERVICIOS', [(["MO", "CLI"], ["OBJ"])]),
+    'mo_gar': ('SERVICIOS', [(["MO", "GAR"], ["OBJ"])]),
+    'mo_int': ('SERVICIOS', [(["MO", "INT"], ["OBJ"]), (["INTERNA"], ["OBJ", "MO"])]),
+    'mo_ter': ('SERVICIOS', [(["MO", "TERCERO"], ["OBJ"]), (["MO", "TERCEROS"], ["OBJ"]),
+                             (["MO", "TER"], ["OBJ"]), (["TERCERO"], ["OBJ", "MO", "COSTO"])]),
+    'obj_mo': ('SERVICIOS', [(["OBJ", "MO"], [])]),
+    'cpus': ('SERVICIOS', [(["CPUS"], ["OBJ"])]),
+    'otros_cargos': ('SERVICIOS', [(["OTROS", "CARGOS"], ["OBJ"])]),
+    # Taller
+    'tecnicos': ('TALLER', [(["TECNICOS"], ["PROD"]), (["DOTACION"], [])]),
+    'tecnicos_hist': ('TALLER', [(["TECNICOS"], ["PROD", "EFIC"]), (["MECANICOS"], ["PROD"])]),
+    'hs_disponibles': ('TALLER', [(["DISPONIBLES", "REAL"], [])]),
+    'hs_disponibles_hist': ('TALLER', [(["DISPONIBLES", "REAL"], []), (["DISP", "REAL"], []), (["DISPONIBLE"], [])]),
+    'productividad': ('TALLER', [(["PRODUCTIVIDAD", "TALLER"], [])]),
+    # Repuestos
+    'obj_fact_rep': ('REPUESTOS', [(["OBJ", "FACT"], [])]),
+    'valor_stock': ('REPUESTOS', [(["VALOR", "STOCK"], [])]),
+    'primas_rep': ('REPUESTOS', [(["PRIMA"], []), (["RAPPEL"], [])]),
+    'compra': ('REPUESTOS', [(["COMPRA"], ["OBJ", "COSTO", "VENTA"]), (["ENTRADA"], ["OBJ", "COSTO", "VENTA"]),
+                             (["COMPRAS"], ["OBJ", "COSTO", "VENTA"])]),
+    'obj_compra': ('REPUESTOS', [(["OBJ", "COMPRA"], []), (["OBJETIVO", "COMPRA"], [])]),
+    'compra_pr': ('REPUESTOS', [(["COMPRA", "PR"], ["OBJ"]), (["COMPRA"], ["OBJ", "COSTO", "VENTA"])]),
+    # WIP
+    'wip_saldo': ('WIP', [(["TOTAL", "IM"], []), (["SALDO"], [])]),
+}
+# Chapa y Pintura: las mismas búsquedas para las dos sedes
+for _sede, _hoja in [('j', 'CyP JUJUY'), ('s', 'CyP SALTA')]:
+    COLUMNAS_KPI.update({
+        f'cyp_mo_{_sede}': (_hoja, [(['MO'], ['TER', 'OBJ', 'PRE'])]),
+        f'cyp_mo_ter_{_sede}': (_hoja, [(['MO', 'TERCERO'], ['OBJ']), (['MO', 'TER'], ['OBJ'])]),
+        f'cyp_rep_{_sede}': (_hoja, [(['FACT', 'REP'], ['OBJ', 'COSTO']), (['REP'], ['OBJ', 'COSTO'])]),
+        f'cyp_obj_fact_{_sede}': (_hoja, [(["OBJ", "FACT"], [])]),
+        f'cyp_panos_{_sede}': (_hoja, [(['PANOS'], ['TER', 'OBJ', 'PRE']), (['PAÑOS'], ['TER', 'OBJ', 'PRE'])]),
+        f'cyp_panos_ter_{_sede}': (_hoja, [(['PANOS', 'TER'], []), (['PAÑOS', 'TER'], [])]),
+        f'cyp_tecnicos_{_sede}': (_hoja, [(['TECNICO'], ['PRODUCTIVIDAD']), (['DOTACION'], [])]),
+    })
+# El histórico de paños siempre buscó sin excluir "PRE" en Salta y en la alternativa con Ñ
+COLUMNAS_KPI['cyp_panos_hist_j'] = ('CyP JUJUY', [(['PANOS'], ['TER', 'OBJ', 'PRE']), (['PAÑOS'], ['TER', 'OBJ'])])
+COLUMNAS_KPI['cyp_panos_hist_s'] = ('CyP SALTA', [(['PANOS'], ['TER', 'OBJ']), (['PAÑOS'], ['TER', 'OBJ'])])
+
+
+class IndiceColumnas:
+    def __init__(self, data):
+        # Títulos en mayúsculas precalculados por hoja (se conserva el orden original de las columnas;
+        # las columnas de fecha que agrega la carga no participan de las búsquedas)
+        self.titulos = {h: [(c, str(c).upper()) for c in df.columns if c not in COLUMNAS_DERIVADAS]
+                        for h, df in data.items()}
+        self._memo = {}
+        self._directo = {}
+        self.sin_resolver = {}  # búsqueda -> texto del aviso
+        self.ambiguas = {}
+        self.kpi = {nombre: self.primera(hoja, *busquedas) for nombre, (hoja, busquedas) in COLUMNAS_KPI.items()}
+
+    def _candidatas(self, hoja, incluir, excluir):
+        clave = (hoja, incluir, excluir)
+        if clave not in self._memo:
+            self._memo[clave] = [c for c, cu in self.titulos.get(hoja, [])
+                                 if all(k in cu for k in incluir) and not any(x in cu for x in excluir)]
+        return self._memo[clave]
+
+    def _registrar(self, hoja, busquedas, candidatas):
+        texto = f"{hoja}: " + " | ".join("+".join(i) + (f" (sin {'/'.join(e)})" if e else "") for i, e in busquedas)
+        if not candidatas:
+            self.sin_resolver.setdefault(texto, texto)
+        elif len(candidatas) > 1:
+            self.ambiguas.setdefault(texto, f"{texto} → '{candidatas[0]}' (también: {', '.join(map(str, candidatas[1:]))})")
+
+    def primera(self, hoja, *busquedas):
+        # busquedas: pares (incluir, excluir); devuelve "" si ninguna resuelve
+        busquedas = tuple((tuple(k.upper() for k in i), tuple(x.upper() for x in e)) for i, e in busquedas)
+        clave = (hoja, busquedas)
+        if clave in self._memo:
+            return self._memo[clave]
+        candidatas = []
+        for incluir, excluir in busquedas:
+            candidatas = self._candidatas(hoja, incluir, excluir)
+            if candidatas: break
+        if hoja in self.titulos: self._registrar(hoja, busquedas, candidatas)
+        res = candidatas[0] if candidatas else ""
+        self._memo[clave] = res
+        return res
+
+    def col(self, hoja, incluir, excluir=()):
+        # Atajo sin normalizar las palabras clave: es la llamada que más se repite
+        clave = (hoja, tuple(incluir), tuple(excluir))
+        res = self._directo.get(clave)
+        if res is None:
+            res = self._directo[clave] = self.primera(hoja, (incluir, excluir))
+        return res
+
+    def avisos(self):
+        return list(self.sin_resolver.values()), list(self.ambiguas.values())
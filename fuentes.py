@@ -0,0 +1,133 @@
+import csv
+import io
+import os
+import re
+import sys
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- FUENTES DE DATOS DEL TABLERO ---
+# Todas las fuentes entregan cada hoja como los bytes de un CSV con el mismo formato que exporta
+# Google Sheets (gviz), así la normalización de carga.py es una sola para todas.
+
+TIMEOUT_HOJA_SEG = 20  # Tiempo máximo de descarga por hoja
+URL_GOOGLE = "https://docs.google.com"
+
+
+def _clave_segura(texto):
+    return re.sub(r'[^0-9A-Za-z_-]+', '_', texto).strip('_')
+
+
+class FuenteGviz:
+    # Exportación CSV de Google Sheets (o un servidor que la imite, ver servir_gviz)
+    def __init__(self, sheet_id, url_base=URL_GOOGLE):
+        self.sheet_id = sheet_id
+        self.url_base = url_base.rstrip('/')
+        self.clave = sheet_id if self.url_base == URL_GOOGLE else _clave_segura(f"{sheet_id}-{self.url_base}")
+
+    def url_hoja(self, hoja):
+        return f"{self.url_base}/spreadsheets/d/{self.sheet_id}/gviz/tq?tqx=out:csv&sheet={hoja.replace(' ', '%20')}"
+
+    def leer(self, hoja, timeout=TIMEOUT_HOJA_SEG):
+        with urllib.request.urlopen(self.url_hoja(hoja), timeout=timeout) as resp:
+            return resp.read()
+
+
+class FuenteDirectorioCSV:
+    # Una carpeta con un CSV por hoja: "<carpeta>/<nombre de la hoja>.csv"
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.clave = "csv-" + _clave_segura(os.path.abspath(carpeta))
+
+    def leer(self, hoja, timeout=TIMEOUT_HOJA_SEG):
+        with open(os.path.join(self.carpeta, f"{hoja}.csv"), "rb") as f:
+            return f.read()
+
+
+def _celda_a_texto(valor):
+    # Reproduce lo que entrega gviz: fechas ISO y números con coma decimal (sin separador de miles)
+    if valor is None: return ""
+    if isinstance(valor, datetime): return valor.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, date): return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, bool): return str(valor).upper()
+    if isinstance(valor, int): return str(valor)
+    if isinstance(valor, float):
+        if valor.is_integer(): return str(int(valor))
+        texto = repr(valor)
+        if 'e' in texto: texto = f"{valor:.15f}".rstrip('0')
+        return texto.replace('.', ',')
+    return str(valor)
+
+
+class FuenteXlsx:
+    # Libro .xlsx exportado de la planilla, leído con openpyxl en modo solo lectura
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.clave = "xlsx-" + _clave_segura(os.path.abspath(ruta))
+
+    def leer(self, hoja, timeout=TIMEOUT_HOJA_SEG):
+        import openpyxl
+        # Un libro por lectura: openpyxl no es seguro entre hilos y la carga es en paralelo
+        libro = openpyxl.load_workbook(self.ruta, read_only=True, data_only=True)
+        try:
+            if hoja not in libro.sheetnames:
+                raise KeyError(f"La hoja '{hoja}' no existe en {os.path.basename(self.ruta)}")
+            salida = io.StringIO()
+            escritor = csv.writer(salida)
+            for fila in libro[hoja].iter_rows(values_only=True):
+                escritor.writerow([_celda_a_texto(v) for v in fila])
+            return salida.getvalue().encode("utf-8")
+        finally:
+            libro.close()
+
+
+def fuente_desde_config(sheet_id, config=None):
+    # TABLERO_FUENTE: "gviz" (por defecto), "gviz:<url base>", "csv:<carpeta>" o "xlsx:<archivo>"
+    config = config if config is not None else os.environ.get("TABLERO_FUENTE", "gviz")
+    tipo, _, destino = config.partition(":")
+    tipo = tipo.strip().lower()
+    if tipo == "gviz": return FuenteGviz(sheet_id, destino or URL_GOOGLE)
+    if tipo == "csv": return FuenteDirectorioCSV(destino)
+    if tipo == "xlsx": return FuenteXlsx(destino)
+    raise ValueError(f"Fuente de datos desconocida: {config}")
+
+
+# --- SERVIDOR LOCAL QUE IMITA EL ENDPOINT GVIZ (PRUEBAS DE CARGA SIN RED) ---
+def servir_gviz(fuente, puerto=8765, demora_seg=0.0):
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            consulta = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            hoja = consulta.get("sheet", [""])[0]
+            try:
+                cuerpo = fuente.leer(hoja)
+            except Exception:
+                # Google responde 400 cuando la hoja no existe
+                self.send_response(400)
+                self.end_headers()
+                return
+            if demora_seg: time.sleep(demora_seg)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+
+
+if __name__ == "__main__":
+    # Uso: python fuentes.py <carpeta de CSVs | libro.xlsx> [puerto] [demora_seg]
+    # Luego: TABLERO_FUENTE=gviz:http://127.0.0.1:<puerto> streamlit run autociel.py
+    origen = sys.argv[1]
+    puerto = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    demora = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    fuente = FuenteXlsx(origen) if origen.lower().endswith(".xlsx") else FuenteDirectorioCSV(origen)
+    servidor = servir_gviz(fuente, puerto, demora)
+    print(f"Sirviendo {origen} como gviz en http://127.0.0.1:{puerto}")
+    servidor.serve_forever()
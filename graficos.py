@@ -0,0 +1,54 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# --- CACHÉ DE GRÁFICOS ---
+# Los gráficos sólo cambian con los datos (huella) o con lo elegido (año, mes, asesor...): se arman una vez por
+# (gráfico, huella, selección) y se guardan en memoria, acotada por el tamaño del JSON de cada figura.
+# Las figuras guardadas se comparten entre sesiones: se arman enteras dentro de `armar` y no se tocan después.
+
+MAX_BYTES_GRAFICOS = 32 * 1024 * 1024
+
+_graficos = OrderedDict()  # clave -> (figura, bytes del JSON)
+_bytes_graficos = 0
+_lock_graficos = threading.Lock()
+
+def figura(id_grafico, huella, seleccion, armar):
+    # Sin huella (datos sin versión) no hay con qué invalidar: se arma siempre
+    global _bytes_graficos
+    if huella is None: return armar()
+    clave = (id_grafico, huella, seleccion)
+    with _lock_graficos:
+        if clave in _graficos:
+            _graficos.move_to_end(clave)
+            return _graficos[clave][0]
+    fig = armar()
+    peso = len(pio.to_json(fig, validate=False))
+    with _lock_graficos:
+        if clave in _graficos: _bytes_graficos -= _graficos[clave][1]
+        _graficos[clave] = (fig, peso)
+        _bytes_graficos += peso
+        while _bytes_graficos > MAX_BYTES_GRAFICOS and len(_graficos) > 1:
+            _bytes_graficos -= _graficos.popitem(last=False)[1][1]
+    return fig
+
+
+if __name__ == "__main__":
+    # python graficos.py [n_barras]: arma un gráfico y lo vuelve a pedir desde la caché
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    df = pd.DataFrame({'Mes': range(1, n + 1), 'Valor': np.random.rand(n) * 1e6})
+    def armar():
+        fig = go.Figure(go.Bar(x=df['Mes'], y=df['Valor'], text=[f"${v/1000000:.1f}M" for v in df['Valor']]))
+        return fig.update_layout(title="Prueba", height=320)
+    t0 = time.perf_counter()
+    figura("prueba", "huella", (n,), armar)
+    t1 = time.perf_counter()
+    figura("prueba", "huella", (n,), armar)
+    print(f"Gráfico de {n} barras: armado en {(t1 - t0) * 1000:.1f} ms, desde la caché en {(time.perf_counter() - t1) * 1000:.3f} ms "
+          f"({_bytes_graficos:,} bytes en caché)")
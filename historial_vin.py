@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from carga import DIR_SNAPSHOT
+from irpv import DIAS_TOLERANCIA, HITOS, bloques_taller, leer_ventas, normalizar_vin, parsear_fechas_irpv
+
+# --- HISTORIAL DE SERVICE POR VIN ---
+# Entregas y órdenes de taller ya limpias (las mismas reglas que el IRPV) en un sqlite local con índices:
+# "historial de este VIN" y "VINs que vencen su próximo service" son consultas de milisegundos.
+# Se guardan todas las órdenes, también Chapa y Pintura (con su tipo y sin hito, como en el IRPV).
+# Las cargas se suman: volver a cargar un archivo no duplica filas.
+
+RUTA_HISTORIAL_VIN = os.path.join(DIR_SNAPSHOT, "historial_vin.sqlite")
+COLUMNAS_HITO = {h: f"h_{h}" for h, *_ in HITOS}  # Primera fecha de cada hito en la tabla de vehículos
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS entregas (vin TEXT NOT NULL, fecha_entrega TEXT NOT NULL, PRIMARY KEY (vin, fecha_entrega));
+CREATE TABLE IF NOT EXISTS servicios (vin TEXT NOT NULL, fecha TEXT NOT NULL, km REAL, hito TEXT, descripcion TEXT, tipo TEXT,
+                                      UNIQUE (vin, fecha, km, descripcion));
+CREATE INDEX IF NOT EXISTS servicios_fecha ON servicios (fecha);
+CREATE TABLE IF NOT EXISTS vehiculos (vin TEXT PRIMARY KEY, fecha_entrega TEXT, {", ".join(f"{c} TEXT" for c in COLUMNAS_HITO.values())});
+{"".join(f"CREATE INDEX IF NOT EXISTS vehiculos_{c} ON vehiculos ({c});" for c in ["fecha_entrega", *COLUMNAS_HITO.values()])}
+"""
+
+def conectar(ruta=RUTA_HISTORIAL_VIN):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    con = sqlite3.connect(ruta)
+    con.executescript(ESQUEMA)
+    # Bases armadas cuando sólo se guardaban las órdenes de service: se agrega el tipo (volver a cargar el
+    # archivo de taller suma las de Chapa y Pintura que faltaban)
+    if "tipo" not in {c[1] for c in con.execute("PRAGMA table_info(servicios)")}:
+        con.execute("ALTER TABLE servicios ADD COLUMN tipo TEXT")
+    return con
+
+def fechas_iso(serie):
+    return parsear_fechas_irpv(serie).dt.strftime("%Y-%m-%d")
+
+def cargar_entregas(con, file_v):
+    df_v, msg = leer_ventas(file_v)
+    if df_v is None: return 0, msg
+    filas = zip(df_v['VIN'], df_v['Fecha_Entrega'].dt.strftime("%Y-%m-%d"))
+    return con.executemany("INSERT OR IGNORE INTO entregas VALUES (?, ?)", filas).rowcount, "OK"
+
+def cargar_servicios(con, file_t):
+    nuevas = 0
+    try:
+        for b in bloques_taller(file_t, solo_service=False):
+            fecha = fechas_iso(b['Fecha'])
+            b = pd.DataFrame({'vin': normalizar_vin(b['VIN']), 'fecha': fecha, 'km': b['Km'], 'hito': b['Hito'],
+                              'descripcion': b['Descripcion'].fillna(""), 'tipo': b['Tipo']})[fecha.notna().to_numpy()]
+            nuevas += con.executemany("INSERT OR IGNORE INTO servicios (vin, fecha, km, hito, descripcion, tipo) VALUES (?, ?, ?, ?, ?, ?)",
+                                      b.itertuples(index=False, name=None)).rowcount
+    except Exception as e:
+        return nuevas, f"Taller: {e}"
+    return nuevas, "OK"
+
+def rearmar_vehiculos(con):
+    # Una fila por VIN con su entrega y la primera fecha de cada hito (se recalcula entera: es un GROUP BY indexado)
+    casos = ", ".join(f"CASE WHEN hito = '{h}' THEN fecha END" for h in COLUMNAS_HITO)
+    nulos = ", ".join(f"NULL AS {c}" for c in COLUMNAS_HITO.values())
+    minimos = ", ".join(f"MIN({c})" for c in COLUMNAS_HITO.values())
+    con.execute("DELETE FROM vehiculos")
+    con.execute(f"""INSERT INTO vehiculos
+        SELECT vin, MIN(fecha_entrega), {minimos} FROM (
+            SELECT vin, fecha_entrega, {nulos} FROM entregas
+            UNION ALL
+            SELECT vin, NULL, {casos} FROM servicios WHERE hito IS NOT NULL
+        )
+        GROUP BY vin""")
+
+def actualizar_historial_vin(file_v=None, file_t=None, ruta=RUTA_HISTORIAL_VIN):
+    # Devuelve (entregas nuevas, órdenes nuevas, mensaje)
+    con = conectar(ruta)
+    try:
+        with con:
+            n_v, msg = cargar_entregas(con, file_v) if file_v is not None else (0, "OK")
+            if msg != "OK": return 0, 0, msg
+            n_t, msg = cargar_servicios(con, file_t) if file_t is not None else (0, "OK")
+            if msg != "OK": raise ValueError(msg)
+            rearmar_vehiculos(con)
+    except (sqlite3.Error, ValueError) as e:
+        return 0, 0, str(e)  # La transacción se deshace entera
+    finally:
+        con.close()
+    return n_v, n_t, "OK"
+
+def historial_de_vin(vin, ruta=RUTA_HISTORIAL_VIN):
+    con = conectar(ruta)
+    try:
+        vin = str(vin).strip().upper()
+        servicios = pd.read_sql_query("SELECT fecha, km, tipo, hito, descripcion FROM servicios WHERE vin = ? ORDER BY fecha",
+                                      con, params=(vin,))
+        entrega = con.execute("SELECT MIN(fecha_entrega) FROM entregas WHERE vin = ?", (vin,)).fetchone()[0]
+    finally:
+        con.close()
+    return entrega, servicios
+
+def vins_por_vencer(hito, dias=30, hoy=None, ruta=RUTA_HISTORIAL_VIN):
+    # Sin el hito hecho y con el plazo (DIAS_TOLERANCIA desde la entrega o el hito anterior) venciendo en los próximos días
+    nombres = list(COLUMNAS_HITO)
+    base = "fecha_entrega" if hito == nombres[0] else COLUMNAS_HITO[nombres[nombres.index(hito) - 1]]
+    hoy = hoy or datetime.now()
+    desde = (hoy - timedelta(days=DIAS_TOLERANCIA)).strftime("%Y-%m-%d")
+    hasta = (hoy + timedelta(days=dias - DIAS_TOLERANCIA)).strftime("%Y-%m-%d")
+    con = conectar(ruta)
+    try:
+        res = pd.read_sql_query(f"""SELECT vin, fecha_entrega, {base} AS base, date({base}, '+{DIAS_TOLERANCIA} days') AS vence
+                                    FROM vehiculos WHERE {COLUMNAS_HITO[hito]} IS NULL AND {base} BETWEEN ? AND ?
+                                    ORDER BY vence""", con, params=(desde, hasta))
+    finally:
+        con.close()
+    return res
+
+
+if __name__ == "__main__":
+    # python historial_vin.py <ventas.csv> <taller.csv> [VIN]: carga y mide las consultas
+    with open(sys.argv[1], "rb") as f_v, open(sys.argv[2], "rb") as f_t:
+        t0 = time.perf_counter()
+        n_v, n_t, msg = actualizar_historial_vin(f_v, f_t)
+    print(f"Carga: {msg}, {n_v} entregas y {n_t} órdenes nuevas en {time.perf_counter() - t0:.2f} s")
+    for h in COLUMNAS_HITO:
+        t0 = time.perf_counter()
+        res = vins_por_vencer(h)
+        print(f"Vencen el {h} en 30 días: {len(res)} VINs ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+    vin = sys.argv[3] if len(sys.argv) > 3 else (res['vin'].iloc[0] if len(res) else "")
+    t0 = time.perf_counter()
+    entrega, servicios = historial_de_vin(vin)
+    print(f"Historial de {vin} ({(time.perf_counter() - t0) * 1000:.1f} ms), entregado {entrega}:")
+    print(servicios.to_string(index=False))
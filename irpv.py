@@ -0,0 +1,431 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from carga import DIR_SNAPSHOT, parsear_fechas
+
+# --- PROCESAMIENTO IRPV ---
+# Retención de cada cohorte de ventas 0km en el 1er, 2do y 3er service. Todo en operaciones por columna:
+# los archivos del DMS traen varios años de historial de taller.
+
+# Formatos habituales de las exportaciones del DMS; lo que no entra se interpreta como antes (día primero).
+# Mes primero va al final: sólo lo toman las fechas que no pueden ser día/mes (ej: 04/13/2024)
+FORMATOS_FECHA_IRPV = ["%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d-%m-%Y", "%d/%m/%y",
+                       "%m/%d/%Y", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M"]
+
+# Hitos en orden de prioridad: rango de km y textos de la descripción que los delatan
+HITOS = [
+    ("1er", 2500, 16500, ["10.000", "10K", "1ER", "PRIMER", "DIEZ MIL"]),
+    ("2do", 16501, 27000, ["20.000", "20K", "2DO", "SEGUNDO", "VEINTE MIL"]),
+    ("3er", 27001, 38000, ["30.000", "30K", "3ER", "TERCER", "TREINTA MIL"]),
+]
+DIAS_TOLERANCIA = 365  # Plazo desde la entrega (o el hito anterior) para hacer el siguiente service
+
+# Lectura por bloques: las exportaciones de varios años pesan cientos de MB y sólo se usan cinco columnas
+CLAVES_ENCABEZADO = ['BASTIDOR', 'VIN', 'CHASIS', 'MATRICULA', 'REF.OR']
+BYTES_MUESTRA = 64 * 1024
+FILAS_POR_BLOQUE = 500000
+
+# Caché en disco: el estado por VIN de cada par de archivos ya procesado, por contenido
+DIR_CACHE_IRPV = os.path.join(DIR_SNAPSHOT, "irpv")
+MAX_CACHE_IRPV = 20  # Pares de archivos guardados; se descarta el de uso más viejo
+VERSION_CACHE_IRPV = "1"  # Cambiarla si cambia la lectura o la clasificación de hitos
+DIR_ESTADO_IRPV = os.path.join(DIR_SNAPSHOT, "irpv_incremental")  # Historial acumulado con las novedades de cada mes
+
+def detectar_formato(archivo):
+    # Fila del encabezado (la primera de las 20 primeras con alguna palabra clave) y separador, mirando sólo el comienzo
+    archivo.seek(0)
+    muestra = archivo.read(BYTES_MUESTRA)
+    lineas = muestra.decode('utf-8', errors='replace').split('\n')
+    if len(muestra) == BYTES_MUESTRA: lineas = lineas[:-1]  # La última puede estar cortada
+    no_vacias = [(i, l) for i, l in enumerate(lineas) if l.strip()][:20]
+    if not no_vacias: raise ValueError("El archivo está vacío")
+    fila, linea = next(((i, l) for i, l in no_vacias if any(k in l.upper() for k in CLAVES_ENCABEZADO)), no_vacias[0])
+    sep = ';' if linea.count(';') >= linea.count(',') else ','
+    titulos = [str(c).upper().strip() for c in next(csv.reader([linea.rstrip('\r')], delimiter=sep))]
+    return fila, sep, titulos
+
+def buscar_columna(titulos, *claves):
+    return next((i for i, c in enumerate(titulos) if any(k in c for k in claves)), None)
+
+def leer_bloques(archivo, fila, sep, titulos, posiciones):
+    # Sólo las columnas pedidas, como texto, de a FILAS_POR_BLOQUE filas; los bloques traen los títulos normalizados
+    posiciones = sorted({p for p in posiciones if p is not None})
+    archivo.seek(0)
+    lector = pd.read_csv(archivo, skiprows=fila, header=0, sep=sep, usecols=posiciones, dtype=str, encoding='utf-8',
+                         on_bad_lines='skip', chunksize=FILAS_POR_BLOQUE)
+    for bloque in lector:
+        bloque.columns = [titulos[p] for p in posiciones]
+        yield bloque
+
+def parsear_fecha_suelta(x):
+    try: return pd.to_datetime(x, dayfirst=True)
+    except: return pd.NaT
+
+def parsear_fechas_irpv(serie):
+    # Las fechas se repiten mucho: se parsea cada valor distinto una sola vez. Primero los formatos conocidos
+    # en bloque; lo que quede se interpreta valor por valor
+    codigos, valores = pd.factorize(serie)
+    valores = pd.Series(valores)
+    fechas = parsear_fechas(valores, FORMATOS_FECHA_IRPV)
+    pendientes = fechas.isna()
+    if pendientes.any():
+        fechas[pendientes] = pd.Series([parsear_fecha_suelta(v) for v in valores[pendientes]], index=valores.index[pendientes], dtype=fechas.dtype)
+    # El código -1 (vacío) cae en el NaT agregado al final
+    res = pd.concat([fechas, pd.Series([pd.NaT], dtype=fechas.dtype)], ignore_index=True).to_numpy()[codigos]
+    return pd.Series(res, index=serie.index)
+
+def clasificar_hitos(km, texto):
+    # Gana el primer hito (en orden) cuyo rango de km o alguno de sus textos coincida
+    condiciones = [km.between(km_min, km_max).to_numpy() | texto.str.contains("|".join(map(re.escape, claves)), regex=True, na=False).to_numpy()
+                   for _, km_min, km_max, claves in HITOS]
+    return pd.Series(np.select(condiciones, [h for h, *_ in HITOS], default=None), index=km.index)
+
+def retencion(base, hecho, hoy):
+    # 1 si el service se hizo; 0 si venció el plazo sin hacerlo; vacío si no hay base o todavía está en plazo
+    vencido = (base + pd.Timedelta(days=DIAS_TOLERANCIA)) <= hoy
+    res = np.where(hecho.notna(), 1.0, np.where(vencido, 0.0, np.nan))
+    res[base.isna().to_numpy()] = np.nan
+    return res
+
+def normalizar_vin(serie):
+    return serie.astype(str).str.strip().str.upper()
+
+def leer_ventas(file_v):
+    try:
+        fila, sep, titulos = detectar_formato(file_v)
+        p_vin = buscar_columna(titulos, 'BASTIDOR', 'VIN')
+        p_fec = buscar_columna(titulos, 'FEC', 'ENTR')
+        if p_vin is None or p_fec is None: return None, "Ventas: Faltan columnas VIN/Fecha"
+        col_vin, col_fec = titulos[p_vin], titulos[p_fec]
+        partes = [pd.DataFrame({'VIN': normalizar_vin(b[col_vin]), 'Fecha_Entrega': parsear_fechas_irpv(b[col_fec])})
+                  for b in leer_bloques(file_v, fila, sep, titulos, [p_vin, p_fec])]
+    except Exception as e:
+        return None, f"Ventas: {e}"
+    df_v = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame({'VIN': [], 'Fecha_Entrega': pd.Series(dtype='datetime64[ns]')})
+    df_v['Año_Venta'] = df_v['Fecha_Entrega'].dt.year
+    return df_v.dropna(subset=['VIN', 'Fecha_Entrega']), "OK"
+
+def consolidar(acumulado, pendientes):
+    partes = ([acumulado] if acumulado is not None else []) + pendientes
+    if not partes: return acumulado
+    return pd.concat(partes).groupby(level=[0, 1]).min()
+
+def bloques_taller(file_t, solo_service=True):
+    # Órdenes de taller por bloques con km, descripción, tipo y hito ya resueltos. Chapa y Pintura nunca marcan hito:
+    # con solo_service (el IRPV) se descartan; sin él (el historial por VIN) quedan, sin hito.
+    # VIN y fecha quedan como texto crudo: cada uso los normaliza sólo en las filas que necesita
+    fila, sep, titulos = detectar_formato(file_t)
+    p_vin = buscar_columna(titulos, 'BASTIDOR', 'VIN')
+    p_fec = buscar_columna(titulos, 'CIERRE', 'FEC')
+    p_km = buscar_columna(titulos, 'KM')
+    p_or = buscar_columna(titulos, 'TIPO', 'O.R.')
+    p_desc = buscar_columna(titulos, 'DESCR', 'OPER', 'TRABAJO')
+    if p_vin is None or p_fec is None: raise ValueError("Faltan columnas VIN/Fecha")
+    for bloque in leer_bloques(file_t, fila, sep, titulos, [p_vin, p_fec, p_km, p_or, p_desc]):
+        tipo = bloque[titulos[p_or]] if p_or is not None else pd.Series(None, index=bloque.index, dtype=object)
+        es_service = ~tipo.astype(str).str.contains('CHAPA|PINTURA|SINIESTRO', case=False, na=False)
+        if solo_service: bloque, tipo, es_service = bloque[es_service], tipo[es_service], es_service[es_service]
+        km = pd.to_numeric(bloque[titulos[p_km]], errors='coerce').fillna(0) if p_km is not None else pd.Series(0, index=bloque.index)
+        texto = bloque[titulos[p_desc]].astype(str).str.upper() if p_desc is not None else pd.Series("", index=bloque.index)
+        hito = clasificar_hitos(km, texto)
+        yield pd.DataFrame({'VIN': bloque[titulos[p_vin]], 'Fecha': bloque[titulos[p_fec]], 'Km': km, 'Tipo': tipo,
+                            'Descripcion': texto, 'Hito': hito if solo_service else hito.where(es_service, None)})
+
+def hitos_por_vin(file_t):
+    # Cada bloque se reduce a la primera fecha de cada (VIN, hito): la memoria depende de los autos, no del archivo
+    try:
+        acumulado, pendientes = None, []
+        for bloque in bloques_taller(file_t):
+            # Sólo las órdenes que marcan un hito necesitan fecha y VIN
+            bloque = bloque[bloque['Hito'].notna().to_numpy()]
+            parcial = pd.DataFrame({
+                'VIN': normalizar_vin(bloque['VIN']),
+                'Hito': bloque['Hito'],
+                'Fecha_Servicio': parsear_fechas_irpv(bloque['Fecha']),
+            }).groupby(['VIN', 'Hito'])['Fecha_Servicio'].min()
+            pendientes.append(parcial)
+            # Se consolida cuando lo pendiente supera a lo ya reducido: memoria acotada sin reagrupar en cada bloque
+            if sum(map(len, pendientes)) > (len(acumulado) if acumulado is not None else FILAS_POR_BLOQUE):
+                acumulado = consolidar(acumulado, pendientes)
+                pendientes = []
+        acumulado = consolidar(acumulado, pendientes)
+    except Exception as e:
+        return None, f"Taller: {e}"
+    if acumulado is None or acumulado.empty: return pd.DataFrame({'VIN': []}), "OK"
+    return acumulado.unstack('Hito').reset_index(), "OK"
+
+def estado_por_vin(df_v, pivot_dates):
+    # Una fila por entrega con la primera fecha de cada hito: no depende del día en que se calcula
+    estado = pd.merge(df_v, pivot_dates, on='VIN', how='left')
+    for h, *_ in HITOS:
+        if h not in estado.columns: estado[h] = pd.Series(pd.NaT, index=estado.index, dtype='datetime64[ns]')
+    return estado[['VIN', 'Fecha_Entrega', 'Año_Venta'] + [h for h, *_ in HITOS]]
+
+def calcular_retencion(estado, hoy=None):
+    hoy = hoy or datetime.now()
+    r = pd.DataFrame({
+        '1er': retencion(estado['Fecha_Entrega'], estado['1er'], hoy),
+        '2do': retencion(estado['1er'], estado['2do'], hoy),
+        '3er': retencion(estado['2do'], estado['3er'], hoy),
+        'Año_Venta': estado['Año_Venta'].to_numpy(),
+    })
+    return r.groupby('Año_Venta')[['1er', '2do', '3er']].mean()
+
+def procesar_estado(file_v, file_t):
+    df_v, msg_v = leer_ventas(file_v)
+    if df_v is None: return None, msg_v
+    pivot_dates, msg_t = hitos_por_vin(file_t)
+    if pivot_dates is None: return None, msg_t
+    return estado_por_vin(df_v, pivot_dates), "OK"
+
+def procesar_irpv(file_v, file_t):
+    estado, msg = procesar_estado(file_v, file_t)
+    if estado is None: return None, msg
+    return calcular_retencion(estado), "OK"
+
+# --- CACHÉ IRPV EN DISCO ---
+# Se guarda el estado por VIN (no la matriz, que cambia con la fecha de hoy) bajo la huella de los dos archivos:
+# volver a subir un par conocido no relee nada, para cualquier usuario y después de reiniciar.
+
+def huella_archivos(*archivos):
+    h = hashlib.sha1(VERSION_CACHE_IRPV.encode())
+    for archivo in archivos:
+        archivo.seek(0)
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            h.update(bloque)
+        h.update(b"\x00")  # Separa los archivos: (ab, c) no es (a, bc)
+        archivo.seek(0)
+    return h.hexdigest()
+
+def leer_cache_irpv(clave):
+    ruta = os.path.join(DIR_CACHE_IRPV, clave + ".parquet")
+    try:
+        estado = pd.read_parquet(ruta)
+        os.utime(ruta)  # La fecha de modificación marca el último uso
+        return estado
+    except Exception:
+        return None
+
+def guardar_cache_irpv(clave, estado):
+    try:
+        os.makedirs(DIR_CACHE_IRPV, exist_ok=True)
+        ruta = os.path.join(DIR_CACHE_IRPV, clave + ".parquet")
+        estado.to_parquet(ruta + ".tmp")
+        os.replace(ruta + ".tmp", ruta)
+        guardados = sorted((e for e in os.scandir(DIR_CACHE_IRPV) if e.name.endswith(".parquet")), key=lambda e: e.stat().st_mtime)
+        for e in guardados[:-MAX_CACHE_IRPV]:
+            os.remove(e.path)
+    except OSError:
+        pass  # Sin disco escribible el IRPV funciona igual, sólo que sin caché
+
+def procesar_irpv_cache(file_v, file_t):
+    clave = huella_archivos(file_v, file_t)
+    estado = leer_cache_irpv(clave)
+    if estado is None:
+        estado, msg = procesar_estado(file_v, file_t)
+        if estado is None: return None, msg
+        guardar_cache_irpv(clave, estado)
+    return calcular_retencion(estado), "OK"
+
+# --- IRPV INCREMENTAL ---
+# Cada mes se suben sólo las novedades (entregas nuevas y/o órdenes nuevas). El estado acumulado son dos tablas
+# chicas: las entregas y la primera fecha de cada hito por VIN. Sumar un archivo dos veces no cambia nada.
+
+def leer_estado_incremental():
+    try:
+        return (pd.read_parquet(os.path.join(DIR_ESTADO_IRPV, "ventas.parquet")),
+                pd.read_parquet(os.path.join(DIR_ESTADO_IRPV, "hitos.parquet")))
+    except Exception:
+        return None, None
+
+def guardar_estado_incremental(ventas, hitos):
+    os.makedirs(DIR_ESTADO_IRPV, exist_ok=True)
+    for nombre, df in [("ventas", ventas), ("hitos", hitos)]:
+        ruta = os.path.join(DIR_ESTADO_IRPV, nombre + ".parquet")
+        df.to_parquet(ruta + ".tmp")
+        os.replace(ruta + ".tmp", ruta)
+
+def borrar_estado_incremental():
+    for nombre in ["ventas", "hitos"]:
+        try: os.remove(os.path.join(DIR_ESTADO_IRPV, nombre + ".parquet"))
+        except OSError: pass
+
+def estado_incremental():
+    ventas, hitos = leer_estado_incremental()
+    if ventas is None: return None
+    return estado_por_vin(ventas, hitos.reset_index())
+
+def huella_estado_incremental():
+    # Cambia con cada suma o reinicio (las tablas se reemplazan enteras); None si todavía no hay historial
+    try:
+        datos = [os.stat(os.path.join(DIR_ESTADO_IRPV, nombre + ".parquet")) for nombre in ["ventas", "hitos"]]
+    except OSError:
+        return None
+    return tuple((d.st_mtime_ns, d.st_size) for d in datos)
+
+_retencion_incremental = {}
+_lock_incremental = threading.Lock()
+
+def retencion_incremental(hoy=None):
+    # Matriz del historial acumulado y cantidad de entregas. Se relee el Parquet sólo si cambió el historial
+    # o el día (la retención depende de la fecha): un rerun del tablero cuesta dos stat
+    hoy = hoy or datetime.now()
+    huella = huella_estado_incremental()
+    if huella is None: return None, 0
+    clave = (huella, hoy.date())
+    with _lock_incremental:
+        if _retencion_incremental.get("clave") == clave: return _retencion_incremental["res"]
+    estado = estado_incremental()
+    if estado is None: return None, 0
+    res = calcular_retencion(estado, hoy), len(estado)
+    with _lock_incremental:
+        _retencion_incremental.update(clave=clave, res=res)
+    return res
+
+def sumar_novedades(file_v=None, file_t=None):
+    ventas, hitos = leer_estado_incremental()
+    if file_v is not None:
+        df_v, msg = leer_ventas(file_v)
+        if df_v is None: return None, msg
+        ventas = df_v if ventas is None else pd.concat([ventas, df_v], ignore_index=True)
+        ventas = ventas.drop_duplicates(['VIN', 'Fecha_Entrega'], ignore_index=True)
+    if file_t is not None:
+        pivot_dates, msg = hitos_por_vin(file_t)
+        if pivot_dates is None: return None, msg
+        # La primera fecha de cada hito entre lo acumulado y lo nuevo
+        nuevos = pivot_dates.set_index('VIN')
+        hitos = nuevos if hitos is None else pd.concat([hitos, nuevos]).groupby(level=0).min()
+    # Se puede empezar por cualquiera de los dos archivos
+    if ventas is None: ventas = pd.DataFrame({'VIN': pd.Series(dtype=object), 'Fecha_Entrega': pd.Series(dtype='datetime64[ns]'),
+                                              'Año_Venta': pd.Series(dtype=float)})
+    if hitos is None: hitos = pd.DataFrame(index=pd.Index([], name='VIN'))
+    try:
+        guardar_estado_incremental(ventas, hitos)
+    except OSError as e:
+        return None, f"No se pudo guardar el historial: {e}"
+    return estado_por_vin(ventas, hitos.reset_index()), "OK"
+
+# --- IRPV POR LOTE (SIN TABLERO) ---
+def procesar_par(nombre, ruta_v, ruta_t, salida):
+    # Una sucursal en su propio proceso: devuelve los segundos de cada etapa para el reporte
+    tiempos, t0 = {}, time.perf_counter()
+    def marcar(etapa):
+        nonlocal t0
+        tiempos[etapa], t0 = time.perf_counter() - t0, time.perf_counter()
+    try:
+        with open(ruta_v, "rb") as f: df_v, msg = leer_ventas(f)
+        marcar("ventas")
+        if df_v is None: return nombre, tiempos, msg
+        with open(ruta_t, "rb") as f: pivot_dates, msg = hitos_por_vin(f)
+        marcar("taller")
+        if pivot_dates is None: return nombre, tiempos, msg
+        res = calcular_retencion(estado_por_vin(df_v, pivot_dates))
+        marcar("retencion")
+        res.to_csv(os.path.join(salida, f"{nombre}.csv"))
+        marcar("escritura")
+    except Exception as e:
+        # Un par roto (archivo ilegible, columna rara, CSV mal formado) no frena a los demás
+        return nombre, tiempos, f"{type(e).__name__}: {e}"
+    return nombre, tiempos, "OK"
+
+# --- ARCHIVOS SINTÉTICOS (PRUEBAS Y MEDICIÓN) ---
+# Un par ventas/taller con lo que traen las exportaciones del DMS: fechas día primero (con y sin hora, con barra o guion),
+# ISO, vacías e inválidas; km justo en los bordes de cada hito y no numéricos; hitos que sólo se ven en la descripción;
+# órdenes de Chapa y Pintura; VINs vacíos, en minúscula o con espacios. Las fechas ISO tienen día > 12: las ambiguas
+# (2024-04-03) se leen distinto que con el dayfirst celda por celda de antes, a propósito
+KM_BORDES = [0, 2499, 2500, 16500, 16501, 27000, 27001, 38000, 38001]
+DESCRIPCIONES_PRUEBA = ["SERVICE 10.000 KM", "1er service", "SERVICE 20K", "SEGUNDO SERVICE", "TREINTA MIL", "revision diez mil",
+                        "20K Y 1ER", "CAMBIO DE ACEITE", "ALINEACION Y BALANCEO", "3ER SERVICE", "CONTROL GENERAL"]
+TIPOS_OR_PRUEBA = ["MECANICA", "GARANTIA", "CLIENTE", "CHAPA", "Pintura", "SINIESTRO"]
+
+def fechas_texto_prueba(fechas, rng):
+    formato = rng.choice(["%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y", "%Y-%m-%d", "vacia", "invalida"], len(fechas),
+                         p=[0.45, 0.2, 0.1, 0.15, 0.05, 0.05])
+    formato[(formato == "%Y-%m-%d") & (fechas.dt.day.to_numpy() <= 12)] = "%d/%m/%Y"
+    texto = pd.Series("", index=fechas.index, dtype=object)
+    for f in ["%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y", "%Y-%m-%d"]:
+        texto[formato == f] = fechas[formato == f].dt.strftime(f)
+    texto[formato == "invalida"] = "sin fecha"
+    return texto
+
+def generar_archivos_prueba(filas_taller, filas_ventas=None, semilla=0, hoy=None):
+    # Devuelve (ventas, taller) como bytes CSV con ';'
+    rng = np.random.default_rng(semilla)
+    hoy = pd.Timestamp(hoy or datetime.now()).normalize()
+    filas_ventas = filas_ventas or max(1, filas_taller // 4)
+    vins = pd.Series([f"VF3{i:014d}" for i in range(filas_ventas)])
+    entregas = hoy - pd.to_timedelta(rng.integers(30, 6 * 365, filas_ventas), unit="D")
+    vin_v = vins.where(rng.random(filas_ventas) > 0.02, "")
+    vin_v = vin_v.where(rng.random(filas_ventas) > 0.1, vin_v.str.lower())
+    ventas = pd.DataFrame({'BASTIDOR': vin_v, 'FECHA ENTREGA': fechas_texto_prueba(pd.Series(entregas), rng), 'MODELO': "208"})
+
+    auto = rng.integers(0, filas_ventas, filas_taller)
+    fechas = pd.Series(entregas[auto] + pd.to_timedelta(rng.integers(-30, 3 * 365, filas_taller), unit="D"))
+    km = rng.integers(0, 60000, filas_taller).astype(object)
+    en_borde = rng.random(filas_taller) < 0.3
+    km[en_borde] = rng.choice(KM_BORDES, en_borde.sum())
+    km[rng.random(filas_taller) < 0.02] = "s/d"
+    vin_t = vins[auto].reset_index(drop=True)
+    sorteo = rng.random(filas_taller)
+    vin_t = vin_t.where(sorteo > 0.02, "").where((sorteo <= 0.02) | (sorteo > 0.1), " " + vin_t.str.lower() + " ")
+    taller = pd.DataFrame({
+        'REF.OR': np.arange(filas_taller), 'BASTIDOR': vin_t, 'FECHA CIERRE': fechas_texto_prueba(fechas, rng), 'KM': km,
+        'TIPO O.R.': rng.choice(TIPOS_OR_PRUEBA, filas_taller, p=[0.5, 0.15, 0.2, 0.05, 0.05, 0.05]),
+        'DESCRIPCION': rng.choice(DESCRIPCIONES_PRUEBA, filas_taller),
+    })
+    return ventas.to_csv(sep=';', index=False).encode(), taller.to_csv(sep=';', index=False).encode()
+
+if __name__ == "__main__":
+    # python irpv.py --par Jujuy ventas_j.csv taller_j.csv --par Salta ventas_s.csv taller_s.csv [--salida dir]
+    # (o un solo par: python irpv.py ventas.csv taller.csv; o una medición: python irpv.py --medir 1000000)
+    parser = argparse.ArgumentParser(description="Matrices de retención IRPV por sucursal, en paralelo")
+    parser.add_argument("archivos", nargs="*", metavar="CSV", help="ventas.csv taller.csv de un solo par")
+    parser.add_argument("--par", nargs=3, action="append", default=[], metavar=("NOMBRE", "VENTAS", "TALLER"))
+    parser.add_argument("--salida", default="irpv_resultados", help="carpeta donde se escribe <NOMBRE>.csv")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count())
+    parser.add_argument("--medir", type=int, metavar="FILAS", help="mide procesar_irpv con un taller sintético de FILAS órdenes")
+    args = parser.parse_args()
+    if args.medir:
+        t0 = time.perf_counter()
+        ventas, taller = generar_archivos_prueba(args.medir)
+        t1 = time.perf_counter()
+        print(f"Archivos sintéticos: {args.medir:,} órdenes de taller y {args.medir // 4:,} entregas "
+              f"({(len(ventas) + len(taller)) / 1e6:.0f} MB) armados en {t1 - t0:.1f} s")
+        res, msg = procesar_irpv(io.BytesIO(ventas), io.BytesIO(taller))
+        t2 = time.perf_counter()
+        print(f"procesar_irpv: {msg} en {t2 - t1:.2f} s")
+        print(res.to_string(float_format="{:.1%}".format))
+        sys.exit(0 if msg == "OK" else 1)
+    pares = list(args.par)
+    if len(args.archivos) == 2: pares.append(("irpv", *args.archivos))
+    elif args.archivos: parser.error("los archivos sueltos van de a dos: ventas.csv taller.csv")
+    if not pares: parser.error("falta al menos un par de archivos")
+    os.makedirs(args.salida, exist_ok=True)
+
+    t_total = time.perf_counter()
+    errores = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(len(pares), args.procesos))) as ex:
+        futuros = {ex.submit(procesar_par, nombre, ruta_v, ruta_t, args.salida): nombre for nombre, ruta_v, ruta_t in pares}
+        for fut in as_completed(futuros):
+            try:
+                nombre, tiempos, msg = fut.result()
+            except Exception as e:
+                # El proceso mismo se cayó (memoria, señal): se informa ese par y se sigue con el resto
+                nombre, tiempos, msg = futuros[fut], {}, f"{type(e).__name__}: {e}"
+            etapas = " | ".join(f"{e} {s:.2f} s" for e, s in tiempos.items())
+            print(f"{nombre}: {msg} ({etapas}; total {sum(tiempos.values()):.2f} s)")
+            errores += msg != "OK"
+    print(f"{len(pares)} sucursales en {time.perf_counter() - t_total:.2f} s -> {os.path.abspath(args.salida)}")
+    sys.exit(1 if errores else 0)
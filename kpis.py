@@ -0,0 +1,706 @@
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from carga import HOJAS_FECHADAS, IndiceMensual, cargar_datos
+from columnas import IndiceColumnas
+from fuentes import fuente_desde_config
+
+# --- MOTOR DE KPIs ---
+# Toda la cuenta de las pestañas mensuales (Objetivos, Servicios y Taller, Repuestos, Chapa y Pintura)
+# sin Streamlit: recibe las hojas cargadas y (año, mes) y devuelve un ResultadoKpis. El tablero sólo
+# dibuja. Se puede correr y medir por fuera del dashboard (ver el bloque __main__ al final).
+
+MESES_NOMBRE = {1:"Enero", 2:"Febrero", 3:"Marzo", 4:"Abril", 5:"Mayo", 6:"Junio", 7:"Julio", 8:"Agosto", 9:"Septiembre", 10:"Octubre", 11:"Noviembre", 12:"Diciembre"}
+CANALES_REPUESTOS = ['MOSTRADOR', 'TALLER', 'INTERNA', 'GAR', 'CYP', 'MAYORISTA', 'SEGUROS']
+CANALES_PREMIUM = ['TALLER', 'MOSTRADOR', 'INTERNA']
+MARGEN_OBJETIVO_REPUESTOS = 0.21
+RATIO_OBJETIVO_REDUCCION = 1.20  # Vender 20% más de lo que se compra
+MAX_RESULTADOS_CACHE = 256  # (huella, año, mes) guardados en memoria
+
+
+@dataclass(frozen=True)
+class Avance:
+    d_t: float  # Días transcurridos (completos si el mes ya cerró)
+    d_h: float  # Días hábiles del mes
+    prog_t: float
+
+
+@dataclass(frozen=True)
+class Objetivos:
+    real_mo_total: float
+    obj_mo: float
+    real_rep: float
+    obj_rep: float
+    real_cj: float
+    obj_cj: float
+    real_cs: float
+    obj_cs: float
+    real_autociel: float
+    obj_autociel: float
+    real_total_general: float
+    obj_total_general: float
+
+
+@dataclass(frozen=True)
+class Indicador:
+    real: float
+    obj_parcial: float
+    obj_mes: float
+    proyeccion: float
+
+
+@dataclass(frozen=True)
+class Servicios:
+    val_cli: float
+    val_gar: float
+    val_int: float
+    val_ter: float
+    real_mo_total: float
+    obj_mo_total: float
+    real_cpus: float
+    real_tus: float
+    obj_cpus: float
+    obj_tus: float
+    tp_mo: float
+    tgt_tp_mo: float
+    tp_hs: float
+    tp_rep: float
+    val_prima_p: float
+    val_prima_c: float
+    obj_prima_p: float
+    obj_prima_c: float
+    pct_prima_p: float
+    pct_prima_c: float
+    nps_p: Indicador
+    nps_c: Indicador
+    vc_p: Indicador
+    vc_c: Indicador
+    ff_p: Indicador
+    ff_c: Indicador
+
+
+@dataclass(frozen=True)
+class Taller:
+    cant_tecs: float
+    hf_cc: float
+    hf_cg: float
+    hf_ci: float
+    ht_cc: float
+    ht_cg: float
+    ht_ci: float
+    ef_cc: float
+    ef_cg: float
+    ef_ci: float
+    ef_gl: float
+    hs_disp: float
+    presencia: float
+    ocup: float
+    prod: float
+
+
+@dataclass(frozen=True)
+class Repuestos:
+    primas_input: float
+    df_r: pd.DataFrame  # Detalle por canal; compartido entre reruns, no modificar
+    vta_total_bruta: float
+    vta_total_neta: float
+    util_total_final: float
+    mg_total_final: float
+    obj_rep_total: float
+    costo_total_mes_actual_real: float
+    desc_total: float
+    ganancia_primaria: float
+    pct_margen_primario: float
+    ganancia_secundaria: float
+    pct_margen_secundario: float
+    val_stock: float
+    meses_stock: float
+    p_vivo: float
+    p_obs: float
+    p_muerto: float
+    compra_real_sheet: float
+    diferencia_flujo: float
+    ratio_reduccion: float
+    margen_critico: float
+
+
+@dataclass(frozen=True)
+class ChapaPintura:
+    j_f_p: float
+    j_f_t: float
+    j_total_fact: float
+    j_obj_fact: float
+    j_obj_mo: float
+    j_panos_prop: float
+    j_obj_panos: float
+    j_ratio: float
+    j_panos_ter: float
+    j_m_ter: float
+    j_mg_ter_pct: float
+    s_f_p: float
+    s_f_t: float
+    s_f_r: float
+    s_total_fact: float
+    s_obj_mo: float
+    s_obj_rep: float
+    s_obj_fact: float
+    s_panos_prop: float
+    s_obj_panos: float
+    s_ratio: float
+    s_panos_ter: float
+    s_m_ter: float
+    s_mg_ter_pct: float
+    s_c_rep: float
+    s_mg_rep_pct: float
+
+
+@dataclass(frozen=True)
+class ResultadoKpis:
+    año: int
+    mes: int
+    avance: Avance
+    objetivos: Objetivos
+    servicios: Servicios
+    taller: Taller
+    repuestos: Repuestos
+    cyp: ChapaPintura
+
+
+# --- ÍNDICES DE UNA VERSIÓN DE LOS DATOS ---
+def armar_indices(data_dict):
+    # Índices que dependen sólo del contenido: columnas y foto mensual de cada hoja
+    indice = IndiceColumnas(data_dict)
+    meses = {h: IndiceMensual(data_dict[h]) for h in HOJAS_FECHADAS if h in data_dict}
+    return indice, meses
+
+def huella_datos(huellas):
+    return hashlib.sha1(repr(sorted(huellas.items())).encode("utf-8")).hexdigest()
+
+
+# --- CÁLCULO POR PESTAÑA ---
+def calcular_avance(c_r, indice, año, mes, hoy):
+    d_t = float(c_r.get(indice.col('CALENDARIO', ["TRANS"]), 0))
+    d_h = float(c_r.get(indice.col('CALENDARIO', ["HAB"]), 22))
+    # Un mes cerrado cuenta con todos sus días hábiles
+    if (año < hoy.year) or (año == hoy.year and mes < hoy.month):
+        if d_t < d_h: d_t = d_h
+    prog_t = d_t / d_h if d_h > 0 else 0
+    return Avance(d_t, d_h, min(prog_t, 1.0))
+
+def calcular_mo(s_r, kpi):
+    vals = [s_r.get(kpi[k], 0) if kpi[k] else 0 for k in ('mo_cli', 'mo_gar', 'mo_int', 'mo_ter')]
+    return vals + [sum(vals)]
+
+def calcular_objetivos(s_r, r_r, cj_r, cs_r, indice, real_mo_total):
+    kpi = indice.kpi
+    real_rep = sum([r_r.get(indice.col('REPUESTOS', ["VENTA", c], excluir=["OBJ"]), 0) for c in CANALES_REPUESTOS])
+
+    def total_cyp(row, sede):
+        c_mo, c_mo_t, c_rep = kpi[f'cyp_mo_{sede}'], kpi[f'cyp_mo_ter_{sede}'], kpi[f'cyp_rep_{sede}']
+        mo_p = float(row.get(c_mo, 0)) if c_mo else 0
+        mo_t = float(row.get(c_mo_t, 0)) if c_mo_t else 0
+        rep = float(row.get(c_rep, 0)) if c_rep else 0
+        return mo_p + mo_t + rep
+
+    obj_mo = float(s_r.get(indice.col('SERVICIOS', ["OBJ", "MO"]), 1))
+    obj_rep = float(r_r.get(indice.col('REPUESTOS', ["OBJ", "FACT"]), 1))
+    real_cj = total_cyp(cj_r, 'j')
+    obj_cj = float(cj_r.get(indice.col('CyP JUJUY', ["OBJ", "FACT"]), 1))
+    real_cs = total_cyp(cs_r, 's')
+    obj_cs = float(cs_r.get(indice.col('CyP SALTA', ["OBJ", "FACT"]), 1))
+
+    # Autociel = MO + Repuestos + CyP Jujuy; el total general suma CyP Salta
+    real_autociel = real_mo_total + real_rep + real_cj
+    obj_autociel = obj_mo + obj_rep + obj_cj
+    return Objetivos(real_mo_total, obj_mo, real_rep, obj_rep, real_cj, obj_cj, real_cs, obj_cs,
+                     real_autociel, obj_autociel, real_autociel + real_cs, obj_autociel + obj_cs)
+
+def calcular_calidad(df_mes, indice, s_r, prog_t, keyword_main, brand, is_percent=False, prorate_target=False):
+    c_real = indice.col('SERVICIOS', [keyword_main, brand], excluir=["OBJ"])
+    c_obj = indice.primera('SERVICIOS', (["OBJ", keyword_main, brand], []), (["OBJ", keyword_main], []))
+    val_real = s_r.get(c_real, 0)
+    if not df_mes.empty and c_obj: val_obj_mensual = df_mes[c_obj].max()
+    else: val_obj_mensual = 0
+    val_proyeccion = val_real / prog_t if prog_t > 0 else 0
+    if prorate_target: val_obj_parcial = val_obj_mensual * prog_t
+    else: val_obj_parcial = val_obj_mensual; val_proyeccion = val_real
+    if is_percent:
+        if val_real > 1.0: val_real /= 100
+        if val_obj_parcial > 1.0: val_obj_parcial /= 100
+        if val_obj_mensual > 1.0: val_obj_mensual /= 100
+        if val_proyeccion > 1.0: val_proyeccion /= 100
+    return Indicador(val_real, val_obj_parcial, val_obj_mensual, val_proyeccion)
+
+def calcular_servicios(data, indice, s_r, t_r, r_r, año, mes, prog_t, mo):
+    val_cli, val_gar, val_int, val_ter, real_mo_total = mo
+    obj_mo_total = s_r.get(indice.col('SERVICIOS', ["OBJ", "MO"]), 1)
+    real_cpus = s_r.get(indice.col('SERVICIOS', ["CPUS"], excluir=["OBJ"]), 0)
+    real_tus = real_cpus + s_r.get(indice.col('SERVICIOS', ["OTROS", "CARGOS"], excluir=["OBJ"]), 0)
+    obj_cpus = s_r.get(indice.col('SERVICIOS', ['OBJ', 'CPUS']), 1)
+    obj_tus = s_r.get(indice.col('SERVICIOS', ['OBJ', 'TUS']), 1)
+    div = real_cpus if real_cpus > 0 else 1
+    tp_mo = real_mo_total / div
+    tgt_tp_mo = obj_mo_total / obj_cpus if obj_cpus > 0 else 0
+
+    hs_fact = sum(t_r.get(indice.col('TALLER', ["FACT", k]), 0) for k in ["CC", "CG", "CI"])
+    tp_hs = hs_fact / div
+    v_rep = sum(r_r.get(indice.col('REPUESTOS', ["VENTA", c], excluir=["OBJ"]), 0) for c in ["TALLER", "GAR", "INT"])
+    tp_rep = v_rep / div
+
+    val_prima_p = s_r.get(indice.col('SERVICIOS', ["PRIMA", "PEUGEOT"], excluir=["OBJ"]), 0)
+    val_prima_c = s_r.get(indice.col('SERVICIOS', ["PRIMA", "CITROEN"], excluir=["OBJ"]), 0)
+    obj_prima_p = s_r.get(indice.col('SERVICIOS', ["OBJ", "PRIMA", "PEUGEOT"]), 0)
+    obj_prima_c = s_r.get(indice.col('SERVICIOS', ["OBJ", "PRIMA", "CITROEN"]), 0)
+    pct_prima_p = (val_prima_p / obj_prima_p * 100) if obj_prima_p > 0 else 0
+    pct_prima_c = (val_prima_c / obj_prima_c * 100) if obj_prima_c > 0 else 0
+
+    # Los objetivos de calidad toman el máximo de todas las filas del mes, no sólo la última
+    df_mes = data['SERVICIOS'][(data['SERVICIOS']['Año'] == año) & (data['SERVICIOS']['Mes'] == mes)]
+
+    def calidad(keyword_main, brand, prorate_target):
+        return calcular_calidad(df_mes, indice, s_r, prog_t, keyword_main, brand, prorate_target=prorate_target)
+
+    return Servicios(val_cli, val_gar, val_int, val_ter, real_mo_total, obj_mo_total,
+                     real_cpus, real_tus, obj_cpus, obj_tus, tp_mo, tgt_tp_mo, tp_hs, tp_rep,
+                     val_prima_p, val_prima_c, obj_prima_p, obj_prima_c, pct_prima_p, pct_prima_c,
+                     calidad("NPS", "PEUGEOT", False), calidad("NPS", "CITROEN", False),
+                     calidad("VIDEO", "PEUGEOT", True), calidad("VIDEO", "CITROEN", True),
+                     calidad("FORFAIT", "PEUGEOT", True), calidad("FORFAIT", "CITROEN", True))
+
+def calcular_taller(t_r, indice, d_t):
+    cant_tecs = t_r.get(indice.kpi['tecnicos'], 6)
+    if cant_tecs == 0: cant_tecs = 6
+    hf_cc, hf_cg, hf_ci = [t_r.get(indice.col('TALLER', ["FACT", k]), 0) for k in ["CC", "CG", "CI"]]
+    ht_cc, ht_cg, ht_ci = [t_r.get(indice.col('TALLER', ["TRAB", k]), 0) for k in ["CC", "CG", "CI"]]
+    ef_cc = hf_cc / ht_cc if ht_cc > 0 else 0
+    ef_cg = hf_cg / ht_cg if ht_cg > 0 else 0
+    ef_ci = hf_ci / ht_ci if ht_ci > 0 else 0
+    ef_gl = (hf_cc+hf_cg+hf_ci) / (ht_cc+ht_cg+ht_ci) if (ht_cc+ht_cg+ht_ci) > 0 else 0
+    hs_disp = t_r.get(indice.col('TALLER', ["DISPONIBLES", "REAL"]), 0)
+    hs_teoricas = cant_tecs * 8 * d_t
+    presencia = hs_disp / hs_teoricas if hs_teoricas > 0 else 0
+    ocup = (ht_cc+ht_cg+ht_ci) / hs_disp if hs_disp > 0 else 0
+    prod = t_r.get(indice.col('TALLER', ["PRODUCTIVIDAD", "TALLER"]), 0)
+    if prod > 2: prod /= 100
+    return Taller(cant_tecs, hf_cc, hf_cg, hf_ci, ht_cc, ht_cg, ht_ci, ef_cc, ef_cg, ef_ci, ef_gl,
+                  hs_disp, presencia, ocup, prod)
+
+def costo_mes_repuestos(meses, indice, año, mes):
+    last_row = meses['REPUESTOS'].fila(año, mes)
+    if last_row.empty: return 0.0
+    total_c = 0
+    for ch in CANALES_REPUESTOS:
+        col_c = indice.col('REPUESTOS', ["COSTO", ch], excluir=["OBJ"])
+        if col_c:
+            try: total_c += float(last_row[col_c])
+            except: pass
+    return total_c
+
+def calcular_repuestos(r_r, meses, indice, año, mes, prog_t):
+    c_primas = indice.kpi['primas_rep']
+    primas_input = float(r_r.get(c_primas, 0.0)) if c_primas else 0.0
+
+    detalles = []
+    for c in CANALES_REPUESTOS:
+        v_col = indice.col('REPUESTOS', ["VENTA", c], excluir=["OBJ"])
+        if v_col:
+            vb = r_r.get(v_col, 0)
+            d = r_r.get(indice.col('REPUESTOS', ["DESC", c]), 0)
+            cost = r_r.get(indice.col('REPUESTOS', ["COSTO", c]), 0)
+            vn = vb - d
+            ut = vn - cost
+            detalles.append({"Canal": c, "Venta Bruta": vb, "Desc.": d, "Venta Neta": vn, "Costo": cost, "Utilidad $": ut, "Margen %": (ut/vn if vn>0 else 0)})
+    df_r = pd.DataFrame(detalles)
+
+    vta_total_bruta = df_r['Venta Bruta'].sum() if not df_r.empty else 0
+    vta_total_neta = df_r['Venta Neta'].sum() if not df_r.empty else 0
+    if vta_total_neta > 0:
+        df_r['% Part.'] = df_r['Venta Neta'] / vta_total_neta
+    else:
+        df_r['% Part.'] = 0.0
+
+    util_total_operativa = df_r['Utilidad $'].sum() if not df_r.empty else 0
+    util_total_final = util_total_operativa + primas_input
+    mg_total_final = util_total_final / vta_total_neta if vta_total_neta > 0 else 0
+    obj_rep_total = r_r.get(indice.col('REPUESTOS', ["OBJ", "FACT"]), 1)
+    costo_total_mes_actual_real = df_r['Costo'].sum() if not df_r.empty else 0
+    val_stock = float(r_r.get(indice.col('REPUESTOS', ["VALOR", "STOCK"]), 0))
+
+    desc_total = df_r['Desc.'].sum() if not df_r.empty else 0
+    ganancia_primaria = vta_total_neta - costo_total_mes_actual_real
+    pct_margen_primario = (ganancia_primaria / vta_total_bruta) * 100 if vta_total_bruta > 0 else 0.0
+    ganancia_secundaria = ganancia_primaria + primas_input
+    pct_margen_secundario = (ganancia_secundaria / vta_total_bruta) * 100 if vta_total_bruta > 0 else 0.0
+
+    # Meses de stock: valor del stock sobre el costo promedio de los últimos 3 meses (el actual proyectado)
+    date_prev1 = (datetime(año, mes, 1) - timedelta(days=1)).replace(day=1)
+    date_prev2 = (date_prev1 - timedelta(days=1)).replace(day=1)
+    costo_mes_minus_1 = costo_mes_repuestos(meses, indice, date_prev1.year, date_prev1.month)
+    costo_mes_minus_2 = costo_mes_repuestos(meses, indice, date_prev2.year, date_prev2.month)
+    if prog_t > 0:
+        costo_mes_actual_proy = costo_total_mes_actual_real / prog_t
+    else:
+        costo_mes_actual_proy = costo_total_mes_actual_real
+    suma_trimestral = costo_mes_minus_2 + costo_mes_minus_1 + costo_mes_actual_proy
+    promedio_costo_3m = suma_trimestral / 3 if suma_trimestral > 0 else 0
+    meses_stock = val_stock / promedio_costo_3m if promedio_costo_3m > 0 else 0
+
+    p_vivo = float(r_r.get(indice.col('REPUESTOS', ["VIVO"]), 0))
+    p_obs = float(r_r.get(indice.col('REPUESTOS', ["OBSOLETO"]), 0))
+    p_muerto = float(r_r.get(indice.col('REPUESTOS', ["MUERTO"]), 0))
+
+    col_compra_sheet = indice.kpi['compra']
+    compra_real_sheet = float(r_r.get(col_compra_sheet, 0)) if col_compra_sheet else 0.0
+    costo_venta_total = df_r['Costo'].sum() if not df_r.empty else 0
+    diferencia_flujo = compra_real_sheet - costo_venta_total
+    ratio_reduccion = costo_venta_total / compra_real_sheet if compra_real_sheet > 0 else 0
+
+    # Margen que necesitan los canales de volumen para llegar al objetivo global
+    util_premium = df_r[df_r['Canal'].isin(CANALES_PREMIUM)]['Utilidad $'].sum()
+    utilidad_objetivo_total = vta_total_neta * MARGEN_OBJETIVO_REPUESTOS
+    margen_necesario_volumen = utilidad_objetivo_total - util_premium - primas_input
+    vta_volumen = df_r[df_r['Canal'].str.contains('MAYORISTA|SEGUROS|GAR', na=False)]['Venta Neta'].sum()
+    margen_critico = (margen_necesario_volumen / vta_volumen) if vta_volumen > 0 else 0
+
+    return Repuestos(primas_input, df_r, vta_total_bruta, vta_total_neta, util_total_final, mg_total_final,
+                     obj_rep_total, costo_total_mes_actual_real, desc_total, ganancia_primaria, pct_margen_primario,
+                     ganancia_secundaria, pct_margen_secundario, val_stock, meses_stock, p_vivo, p_obs, p_muerto,
+                     compra_real_sheet, diferencia_flujo, ratio_reduccion, margen_critico)
+
+def calcular_cyp(cj_r, cs_r, indice):
+    kpi = indice.kpi
+    j_f_p = cj_r.get(kpi['cyp_mo_j'], 0)
+    j_f_t = cj_r.get(kpi['cyp_mo_ter_j'], 0)
+    j_total_fact = j_f_p + j_f_t
+    j_obj_fact = cj_r.get(indice.col('CyP JUJUY', ["OBJ", "FACT"]), 1)
+    j_panos_prop = cj_r.get(kpi['cyp_panos_j'], 0)
+    j_obj_panos = cj_r.get(indice.col('CyP JUJUY', ['OBJ', 'PANOS']), 1)
+    j_cant_tec = cj_r.get(kpi['cyp_tecnicos_j'], 1)
+    j_ratio = j_panos_prop / j_cant_tec if j_cant_tec > 0 else 0
+    j_panos_ter = cj_r.get(indice.col('CyP JUJUY', ['PANOS', 'TER']), 0)
+    j_c_ter = cj_r.get(indice.col('CyP JUJUY', ['COSTO', 'TER']), 0)
+    j_m_ter = j_f_t - j_c_ter
+    j_mg_ter_pct = j_m_ter/j_f_t if j_f_t > 0 else 0
+
+    s_f_p = cs_r.get(kpi['cyp_mo_s'], 0)
+    s_f_t = cs_r.get(indice.col('CyP SALTA', ['MO', 'TER'], excluir=['OBJ', 'PRE']), 0)
+    s_f_r = cs_r.get(kpi['cyp_rep_s'], 0)
+    s_total_fact = s_f_p + s_f_t + s_f_r
+    s_obj_mo = float(cs_r.get(indice.col('CyP SALTA', ['OBJ', 'MO']), 0))
+    s_obj_rep = float(cs_r.get(indice.col('CyP SALTA', ['OBJ', 'REP']), 0))
+    s_obj_fact = float(cs_r.get(indice.col('CyP SALTA', ["OBJ", "FACT"], excluir=["MO", "REP", "PRE"]), 1))
+    s_panos_prop = cs_r.get(kpi['cyp_panos_s'], 0)
+    s_obj_panos = cs_r.get(indice.col('CyP SALTA', ['OBJ', 'PANOS']), 1)
+    s_cant_tec = cs_r.get(kpi['cyp_tecnicos_s'], 1)
+    s_ratio = s_panos_prop / s_cant_tec if s_cant_tec > 0 else 0
+    s_panos_ter = cs_r.get(indice.col('CyP SALTA', ['PANOS', 'TER']), 0)
+    s_c_ter = cs_r.get(indice.col('CyP SALTA', ['COSTO', 'TER'], excluir=['OBJ']), 0)
+    s_m_ter = s_f_t - s_c_ter
+    s_mg_ter_pct = s_m_ter/s_f_t if s_f_t > 0 else 0
+    s_c_rep = cs_r.get(indice.col('CyP SALTA', ['COSTO', 'REP'], excluir=['OBJ']), 0)
+    s_mg_rep_pct = (s_f_r - s_c_rep)/s_f_r if s_f_r > 0 else 0
+
+    # Sin objetivo de MO propia en Jujuy se usa el de facturación
+    j_obj_mo_raw = float(cj_r.get(indice.col('CyP JUJUY', ['OBJ', 'MO']), 0))
+    j_obj_mo = j_obj_mo_raw if j_obj_mo_raw > 0 else j_obj_fact
+
+    return ChapaPintura(j_f_p, j_f_t, j_total_fact, j_obj_fact, j_obj_mo, j_panos_prop, j_obj_panos, j_ratio,
+                        j_panos_ter, j_m_ter, j_mg_ter_pct, s_f_p, s_f_t, s_f_r, s_total_fact, s_obj_mo, s_obj_rep,
+                        s_obj_fact, s_panos_prop, s_obj_panos, s_ratio, s_panos_ter, s_m_ter, s_mg_ter_pct,
+                        s_c_rep, s_mg_rep_pct)
+
+
+def calcular_kpis(data, indice, meses, año, mes, hoy=None):
+    hoy = hoy or datetime.now()
+    filas = {h: meses[h].fila(año, mes) for h in HOJAS_FECHADAS}
+    c_r, s_r, r_r = filas['CALENDARIO'], filas['SERVICIOS'], filas['REPUESTOS']
+    t_r, cj_r, cs_r = filas['TALLER'], filas['CyP JUJUY'], filas['CyP SALTA']
+
+    avance = calcular_avance(c_r, indice, año, mes, hoy)
+    mo = calcular_mo(s_r, indice.kpi)
+    return ResultadoKpis(
+        año, mes, avance,
+        calcular_objetivos(s_r, r_r, cj_r, cs_r, indice, mo[-1]),
+        calcular_servicios(data, indice, s_r, t_r, r_r, año, mes, avance.prog_t, mo),
+        calcular_taller(t_r, indice, avance.d_t),
+        calcular_repuestos(r_r, meses, indice, año, mes, avance.prog_t),
+        calcular_cyp(cj_r, cs_r, indice),
+    )
+
+
+# --- COMPARACIÓN DE PERÍODOS (MoM, YoY, YTD) ---
+# Todo en arrays enteros (una posición por mes), sin recorrer meses ni filas en Python
+def cociente(num, den):
+    # num / den mes a mes; 0 donde el denominador no es positivo (ej: Ticket Hs sin CPUS)
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / den, 0.0)
+
+def variacion(actual, base):
+    # actual / base - 1 (0.1 = +10%); sin base positiva no hay variación: NaN
+    actual, base = np.asarray(actual, dtype=float), np.asarray(base, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(base > 0, actual / base - 1, np.nan)
+
+def _periodos(df, metricas, cocientes, clave):
+    orden = np.argsort(df[clave].to_numpy(), kind='stable')
+    res = {clave: df[clave].to_numpy()[orden]}
+    cols = {c: df[c].to_numpy(dtype=float)[orden] for c in {*metricas, *(c for par in cocientes.values() for c in par)}}
+    for m in metricas:
+        res[m], res[f"{m} YTD"] = cols[m], np.nancumsum(cols[m])
+    # El acumulado de un cociente es el cociente de los acumulados, no la suma de los cocientes
+    for m, (num, den) in cocientes.items():
+        res[m], res[f"{m} YTD"] = cociente(cols[num], cols[den]), cociente(np.nancumsum(cols[num]), np.nancumsum(cols[den]))
+    for m in [*metricas, *cocientes]:
+        res[f"{m} MoM"] = variacion(res[m], np.concatenate(([np.nan], res[m]))[:-1])
+    return res
+
+def comparar_periodos(actual, metricas, anterior=None, cocientes=None, clave='Mes'):
+    # actual / anterior: cierre mensual de un año y del anterior (una fila por mes en `clave`).
+    # Por métrica devuelve el valor, su acumulado (YTD) y la variación contra el mes anterior con datos (MoM);
+    # con `anterior` suma el valor y el acumulado del año pasado ("<m> Ant", "<m> YTD Ant") y sus variaciones YoY.
+    # cocientes: {"Ticket Hs": ("Hs Vendidas", "CPUS")} arma la métrica desde dos columnas.
+    cocientes = cocientes or {}
+    act = _periodos(actual, metricas, cocientes, clave)
+    if anterior is None: return pd.DataFrame(act)
+    ant = _periodos(anterior, metricas, cocientes, clave)
+    meses_union = np.union1d(act[clave], ant[clave])
+
+    def alinear(per, col, acumulado=False):
+        # Un mes sin datos vale 0 (y su MoM queda vacío); el acumulado sigue siendo el del último mes con datos
+        vacio = np.nan if col.endswith(" MoM") else 0.0
+        if not len(per[clave]): return np.full(len(meses_union), vacio)
+        pos = np.searchsorted(per[clave], meses_union, side='right') - 1
+        hay = pos >= 0 if acumulado else per[clave][np.maximum(pos, 0)] == meses_union
+        return np.where(hay, per[col][np.maximum(pos, 0)], vacio)
+
+    res = {clave: meses_union}
+    for m in [*metricas, *cocientes]:
+        res[m], res[f"{m} Ant"] = alinear(act, m), alinear(ant, m)
+        res[f"{m} MoM"] = alinear(act, f"{m} MoM")
+        res[f"{m} YTD"], res[f"{m} YTD Ant"] = alinear(act, f"{m} YTD", True), alinear(ant, f"{m} YTD", True)
+        res[f"{m} YoY"] = variacion(res[m], res[f"{m} Ant"])
+        res[f"{m} YTD YoY"] = variacion(res[f"{m} YTD"], res[f"{m} YTD Ant"])
+    return pd.DataFrame(res)
+
+
+# --- SERIES ANUALES DEL HISTÓRICO ---
+# El Histórico trabaja con el cierre de cada mes (último valor de cada columna), no con la última fila
+def hist_anio(meses, hoja, año):
+    df = meses[hoja].anio(año).copy()
+    df['NombreMes'] = df['Mes'].map(MESES_NOMBRE)
+    return df
+
+def columnas_facturacion(indice):
+    # MO de cada cargo en SERVICIOS (se suman tal cual, aunque dos claves den la misma columna) y venta de cada canal
+    cols_ser = [c for c in [indice.col('SERVICIOS', ["MO", kw], excluir=["OBJ"]) for kw in ["CLI", "GAR", "INT", "TERCERO", "TERCEROS", "TER"]] if c]
+    cols_canal = {can: indice.col('REPUESTOS', ["VENTA", can], excluir=["OBJ"]) for can in CANALES_REPUESTOS}
+    return cols_ser, cols_canal
+
+def columnas_entradas(indice):
+    # CPUS, otros cargos (TUS = CPUS + otros) y horas facturadas del taller
+    return (indice.col('SERVICIOS', ["CPUS"], excluir=["OBJ"]), indice.col('SERVICIOS', ["OTROS", "CARGOS"], excluir=["OBJ"]),
+            [c for c in [indice.col('TALLER', ["FACT", k]) for k in ["CC", "CG", "CI"]] if c])
+
+def calcular_facturacion_anual(meses, indice, año):
+    # Facturación de servicios (MO de cada cargo) y de repuestos (venta de cada canal) por mes del calendario
+    meses_cal = pd.Series(meses['CALENDARIO'].anio(año)['Mes'].unique())
+    h_ser, h_rep = meses['SERVICIOS'].anio(año).set_index('Mes'), meses['REPUESTOS'].anio(año).set_index('Mes')
+    cols_ser, cols_canal = columnas_facturacion(indice)
+    servicios = sum((h_ser[c].astype(float) for c in cols_ser), pd.Series(0.0, index=h_ser.index))
+    # Un mes sin fila en la hoja factura 0; sus canales quedan vacíos (y no hay columnas de canal si no hay ninguna fila)
+    canales = {}
+    if meses_cal.isin(h_rep.index).any():
+        for can, c in cols_canal.items():
+            canales[can] = (h_rep[c].astype(float) if c else pd.Series(0.0, index=h_rep.index)).reindex(meses_cal).to_numpy()
+    repuestos = sum((pd.Series(v) for v in canales.values()), pd.Series(0.0, index=meses_cal.index))
+    return pd.DataFrame({
+        "Mes_Num": meses_cal, "Mes": meses_cal.map(MESES_NOMBRE),
+        "Servicios": servicios.reindex(meses_cal, fill_value=0).to_numpy(),
+        "Repuestos": repuestos.where(meses_cal.isin(h_rep.index), 0),
+        **canales
+    })
+
+def calcular_entradas_anuales(meses, indice, año):
+    # CPUS, TUS y horas vendidas por mes de un año (base de las comparaciones interanuales)
+    col_cpus, col_tus_others, cols_hs_fact = columnas_entradas(indice)
+    df_s, df_t = meses['SERVICIOS'].anio(año), meses['TALLER'].anio(año)
+    if df_s.empty and df_t.empty: return pd.DataFrame(columns=['Mes', 'CPUS', 'TUS', 'Hs Vendidas', 'Ticket Hs'])
+    df_merged = pd.merge(df_s, df_t, on="Mes", how="outer")
+    cpus = pd.to_numeric(df_merged[col_cpus], errors='coerce').fillna(0) if col_cpus in df_merged.columns else 0
+    otros = pd.to_numeric(df_merged[col_tus_others], errors='coerce').fillna(0) if col_tus_others in df_merged.columns else 0
+    df_merged['CPUS'] = cpus
+    df_merged['TUS'] = cpus + otros
+    df_merged['Hs Vendidas'] = 0
+    for c in cols_hs_fact:
+        if c in df_merged.columns: df_merged['Hs Vendidas'] += pd.to_numeric(df_merged[c], errors='coerce').fillna(0)
+    df_merged['Ticket Hs'] = cociente(df_merged['Hs Vendidas'], df_merged['CPUS'])
+    return df_merged[['Mes', 'CPUS', 'TUS', 'Hs Vendidas', 'Ticket Hs']]
+
+
+# --- ACUMULADOS (SUMA DE CUALQUIER RANGO DE MESES) ---
+# Suma prefija de cada columna numérica del cierre mensual a lo largo de todos los años: la suma de un trimestre,
+# un semestre, los últimos 12 meses o cualquier desde/hasta es la resta de dos filas, sin filtrar ni agrupar de nuevo
+PERIODOS = ["Año a la fecha", "Trimestre", "Semestre", "Últimos 12 meses", "Personalizado"]
+
+def mes_abs(año, mes):
+    return año * 12 + mes - 1
+
+def año_mes(n):
+    año, mes = divmod(n, 12)
+    return año, mes + 1
+
+class Acumulados:
+    def __init__(self, meses):
+        self.hojas = {}
+        for hoja, im in meses.items():
+            if not im.anios: continue
+            df = pd.concat(im.anios.values(), ignore_index=True)
+            pos = mes_abs(df['Año'].to_numpy(dtype=int), df['Mes'].to_numpy(dtype=int))
+            inicio = int(pos.min())
+            valores = df.drop(columns=['Año', 'Mes']).select_dtypes(exclude='datetime').apply(pd.to_numeric, errors='coerce')
+            # Fila k = suma de los primeros k meses desde `inicio` (un mes sin datos suma 0); la última columna
+            # queda en 0 para las columnas que no están en la hoja
+            suma = np.zeros((int(pos.max()) - inicio + 2, valores.shape[1] + 1))
+            suma[pos - inicio + 1, :-1] = valores.fillna(0).to_numpy(dtype=float)
+            self.hojas[hoja] = (inicio, {c: i for i, c in enumerate(valores.columns)}, np.cumsum(suma, axis=0))
+
+    def suma(self, hoja, columnas, desde, hasta):
+        # Suma de cada columna entre dos meses (año, mes), ambos incluidos; lo que cae fuera del historial suma 0
+        if hoja not in self.hojas: return np.zeros(len(columnas))
+        inicio, idx, suma = self.hojas[hoja]
+        i0 = min(max(mes_abs(*desde) - inicio, 0), len(suma) - 1)
+        i1 = min(max(mes_abs(*hasta) - inicio + 1, i0), len(suma) - 1)
+        cols = [idx.get(c, -1) for c in columnas]
+        return suma[i1, cols] - suma[i0, cols]
+
+def rango_periodo(periodo, año, mes):
+    # (desde, hasta) del período que termina en (año, mes); el trimestre y el semestre arrancan en su primer mes
+    largo = {"Año a la fecha": mes, "Trimestre": (mes - 1) % 3 + 1, "Semestre": (mes - 1) % 6 + 1, "Últimos 12 meses": 12}[periodo]
+    return año_mes(mes_abs(año, mes) - largo + 1), (año, mes)
+
+def resumen_periodo(acum, indice, desde, hasta):
+    # Totales de un rango de meses; el ticket es el cociente de las sumas, no la suma de los tickets
+    cols_ser, cols_canal = columnas_facturacion(indice)
+    col_cpus, col_otros, cols_hs = columnas_entradas(indice)
+    # Una columna que falta en la hoja suma 0
+    *ser, cpus, otros = acum.suma('SERVICIOS', [*cols_ser, col_cpus, col_otros], desde, hasta)
+    hs = acum.suma('TALLER', cols_hs, desde, hasta).sum()
+    return {
+        "Facturación Servicios": sum(ser), "Facturación Repuestos": acum.suma('REPUESTOS', list(cols_canal.values()), desde, hasta).sum(),
+        "CPUS": cpus, "TUS": cpus + otros, "Hs Vendidas": hs, "Ticket Hs": hs / cpus if cpus > 0 else 0.0,
+    }
+
+
+# --- CUBO DE KPIs (TODOS LOS MESES DE CALENDARIO) ---
+def aplanar(obj, prefijo=""):
+    # ResultadoKpis -> {"servicios.nps_p.real": valor, ...}; los detalles en DataFrame quedan afuera
+    plano = {}
+    for f in fields(obj):
+        val = getattr(obj, f.name)
+        if is_dataclass(val): plano.update(aplanar(val, f"{prefijo}{f.name}."))
+        elif not isinstance(val, pd.DataFrame): plano[f"{prefijo}{f.name}"] = val
+    return plano
+
+class CuboKpis:
+    def __init__(self, data, indice, meses, huella, hoy=None):
+        hoy = hoy or datetime.now()
+        # Vale para una versión de los datos y un mes calendario (define qué meses están cerrados)
+        self.huella, self.hoy = huella, (hoy.year, hoy.month)
+        periodos = sorted(meses['CALENDARIO'].filas) if 'CALENDARIO' in meses else []
+        self.resultados = {(a, m): calcular_kpis(data, indice, meses, a, m, hoy) for a, m in periodos}
+        años = sorted({a for a, _ in periodos})
+        self.facturacion = {a: calcular_facturacion_anual(meses, indice, a) for a in años}
+        # El Histórico compara cada año con el anterior
+        self.entradas = {a: calcular_entradas_anuales(meses, indice, a) for a in sorted(set(años) | {a - 1 for a in años})}
+        self.acumulados = Acumulados(meses)
+        # Vista compacta: una fila por (año, mes), una columna por KPI escalar
+        filas = [aplanar(r) for r in self.resultados.values()]
+        self.tabla = pd.DataFrame(filas, index=pd.MultiIndex.from_tuples(periodos, names=['Año', 'Mes'])) if filas else pd.DataFrame()
+
+    def vigente(self, huella, hoy=None):
+        hoy = hoy or datetime.now()
+        return self.huella == huella and self.hoy == (hoy.year, hoy.month)
+
+    def serie(self, nombre, año):
+        # Un KPI a lo largo de los meses de un año, ej: serie("servicios.real_cpus", 2025)
+        if self.tabla.empty or año not in self.tabla.index.get_level_values('Año'): return pd.Series(dtype=float)
+        return self.tabla.loc[año, nombre]
+
+def facturacion_anual(meses, indice, año, cubo=None):
+    if cubo is not None and año in cubo.facturacion: return cubo.facturacion[año]
+    return calcular_facturacion_anual(meses, indice, año)
+
+def entradas_anuales(meses, indice, año, cubo=None):
+    if cubo is not None and año in cubo.entradas: return cubo.entradas[año]
+    return calcular_entradas_anuales(meses, indice, año)
+
+def acumulados(meses, cubo=None):
+    if cubo is not None: return cubo.acumulados
+    return Acumulados(meses)
+
+
+# --- CACHÉ POR (HUELLA DE LOS DATOS, AÑO, MES) ---
+_resultados = OrderedDict()
+_lock_resultados = threading.Lock()
+
+def kpis_mes(data, indice, meses, huella, año, mes, hoy=None, cubo=None):
+    hoy = hoy or datetime.now()
+    # Con el cubo armado cambiar de mes es una consulta; mientras tanto se calcula y se guarda aparte
+    if cubo is not None and (año, mes) in cubo.resultados and cubo.vigente(huella, hoy):
+        return cubo.resultados[(año, mes)]
+    # El mes actual entra en la clave: define si el mes elegido ya cerró
+    clave = (huella, año, mes, hoy.year, hoy.month)
+    with _lock_resultados:
+        if clave in _resultados:
+            _resultados.move_to_end(clave)
+            return _resultados[clave]
+    res = calcular_kpis(data, indice, meses, año, mes, hoy)
+    with _lock_resultados:
+        _resultados[clave] = res
+        while len(_resultados) > MAX_RESULTADOS_CACHE:
+            _resultados.popitem(last=False)
+    return res
+
+
+if __name__ == "__main__":
+    # Medición sin Streamlit: python kpis.py [sheet_id]  (la fuente sale de TABLERO_FUENTE)
+    fuente = fuente_desde_config(sys.argv[1] if len(sys.argv) > 1 else "")
+    data_dict, huellas, errores = cargar_datos(fuente)
+    for err in errores:
+        print(f"  ! {err}")
+    t0 = time.perf_counter()
+    indice, meses = armar_indices(data_dict)
+    print(f"Índices: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    periodos = list(meses['CALENDARIO'].filas)
+    t0 = time.perf_counter()
+    for año, mes in periodos:
+        calcular_kpis(data_dict, indice, meses, año, mes)
+    total = time.perf_counter() - t0
+    print(f"KPIs de {len(periodos)} meses: {total * 1000:.1f} ms ({total * 1000 / max(len(periodos), 1):.2f} ms por mes)")
+    t0 = time.perf_counter()
+    cubo = CuboKpis(data_dict, indice, meses, huella_datos(huellas))
+    print(f"Cubo completo: {(time.perf_counter() - t0) * 1000:.1f} ms, tabla {cubo.tabla.shape[0]} meses x {cubo.tabla.shape[1]} KPIs")
+    if periodos:
+        año = max(a for a, _ in periodos)
+        t0 = time.perf_counter()
+        comp = comparar_periodos(entradas_anuales(meses, indice, año, cubo), ['CPUS', 'TUS', 'Hs Vendidas'],
+                                 anterior=entradas_anuales(meses, indice, año - 1, cubo), cocientes={'Ticket Hs': ('Hs Vendidas', 'CPUS')})
+        print(f"Comparación MoM/YoY/YTD {año} vs {año - 1}: {(time.perf_counter() - t0) * 1000:.1f} ms, {comp.shape[0]} meses x {comp.shape[1]} columnas")
+        t0 = time.perf_counter()
+        acum = Acumulados(meses)
+        t1 = time.perf_counter()
+        consultas = [rango_periodo(p, año, m) for p in PERIODOS[:-1] for m in range(1, 13)]
+        for desde, hasta in consultas:
+            resumen_periodo(acum, indice, desde, hasta)
+        t2 = time.perf_counter()
+        print(f"Acumulados: armado {(t1 - t0) * 1000:.1f} ms; {len(consultas)} resúmenes por período en {(t2 - t1) * 1000:.1f} ms "
+              f"({(t2 - t1) * 1e6 / len(consultas):.0f} µs c/u)")
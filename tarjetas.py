@@ -0,0 +1,180 @@
+import sys
+import time
+from types import SimpleNamespace
+
+# --- TARJETAS HTML ---
+# Plantillas fijas (se completan con str.format, sin ir concatenando pedazos) y un armador de filas: cada fila o
+# sección de tarjetas sale en un solo bloque HTML (un st.markdown) en vez de un st.columns con un st.markdown por
+# tarjeta. Menos elementos que mandar al navegador y menos reacomodos de la página. Sin Streamlit: se puede medir
+# por fuera del tablero (ver el bloque __main__ al final).
+
+VERDE, AMARILLO, ROJO = "#28a745", "#ffc107", "#dc3545"
+
+# Las clases .fila-tarjetas y .pila-tarjetas están en el CSS del tablero
+PLANTILLA_FILA = '<div class="fila-tarjetas" style="grid-template-columns: {columnas};">{celdas}</div>'
+PLANTILLA_PILA = '<div class="pila-tarjetas">{celdas}</div>'
+
+PLANTILLA_KPI = (
+    '<div class="kpi-card"><div><p>{titulo}</p><h2>{real}</h2>{diario}</div>'
+    '<div><div class="kpi-subtext">vs Obj. Parcial: <b>{obj_parcial}</b> <span style="color:{color_parcial}">({cumpl_parcial:.1%})</span> {icono}</div>'
+    '<hr style="margin:5px 0; border:0; border-top:1px solid #eee;">'
+    '<div style="display:flex; justify-content:space-between; font-size:0.75rem; margin-bottom:2px;"><span>Obj. Mes:</span><b>{obj_mes}</b></div>'
+    '<div style="display:flex; justify-content:space-between; font-size:0.75rem; color:{color}; font-weight:bold;"><span>Proyección:</span><span>{proy} ({cumpl_proy:.1%})</span></div>'
+    '<div style="margin-top:5px;"><div style="width:100%; background:#e0e0e0; height:5px; border-radius:10px;"><div style="width:{barra}%; background:{color}; height:5px; border-radius:10px;"></div></div></div></div></div>'
+)
+PLANTILLA_DIARIO = '<div style="font-size:0.75rem; color:#00235d; background-color:#eef2f7; padding: 1px 6px; border-radius:4px; display:inline-block; margin-bottom:4px;">Prom: <b>{valor}</b> /día</div>'
+
+PLANTILLA_MINI = (
+    '<div class="kpi-card" style="min-height: 145px;"><div><p style="font-size: 0.8rem; margin-bottom: 2px;">{titulo}</p><h2 style="font-size: 1.45rem; margin: 0; color: {color_titulo};">{real}</h2></div>'
+    '<div style="margin-top: auto;">'
+    '<div class="kpi-subtext" style="font-size:0.7rem;">vs Obj: <b>{obj_parcial}</b> <span style="color:{color_parcial}">({cumpl_parcial:.1%})</span> {icono}</div>'
+    '<hr style="margin:4px 0; border:0; border-top:1px solid #eee;">'
+    '<div style="display:flex; justify-content:space-between; font-size:0.7rem; margin-bottom:2px;"><span>Obj. Mes:</span><b>{obj_mes}</b></div>'
+    '<div style="display:flex; justify-content:space-between; font-size:0.7rem; color:{color}; font-weight:bold;"><span>Proy:</span><span>{proy} ({cumpl_proy:.1%})</span></div>'
+    '<div style="margin-top:2px;"><div style="width:100%; background:#e0e0e0; height:4px; border-radius:10px;"><div style="width:{barra}%; background:{color}; height:4px; border-radius:10px;"></div></div></div>'
+    '</div></div>'
+)
+# Sin objetivo: el mismo alto que la de arriba, con las líneas de objetivo invisibles
+PLANTILLA_MINI_SIN_OBJ = (
+    '<div class="kpi-card" style="min-height: 145px;"><div><p style="font-size: 0.8rem; margin-bottom: 2px;">{titulo}</p><h2 style="font-size: 1.45rem; margin: 0; color: {color_titulo};">{real}</h2></div>'
+    '<div style="margin-top: auto;">'
+    '<div class="kpi-subtext" style="color:transparent; user-select:none; font-size:0.7rem;">vs Obj: $0 (0%) ✅</div>'
+    '<hr style="margin:4px 0; border:0; border-top:1px solid transparent;">'
+    '<div style="display:flex; justify-content:space-between; font-size:0.7rem; margin-bottom:2px; color:transparent; user-select:none;"><span>Obj. Mes:</span><b>$0</b></div>'
+    '<div style="display:flex; justify-content:space-between; font-size:0.7rem; color:transparent; user-select:none;"><span>Proy:</span><span>$0 (0%)</span></div>'
+    '<div style="margin-top:2px;"><div style="width:100%; background:transparent; height:4px;"></div></div>'
+    '</div></div>'
+)
+
+PLANTILLA_KPI_CHICA = '<div class="metric-card"><div><p style="color:#666; font-size:0.8rem; margin-bottom:2px;">{titulo}</p><h3 style="color:#00235d; margin:0; font-size:1.3rem;">{valor}</h3>{subtexto}</div>{pie}</div>'
+SUBTEXTO_VACIO = "<div style='height:15px;'></div>"
+PLANTILLA_SUBTEXTO = "<div style='margin-top:4px; display:flex; justify-content:center; align-items:center; gap:5px; font-size:0.7rem;'><span style='color:#888;'>{etiqueta}: {objetivo}</span><span style='color:{color}; font-weight:bold; background-color:{color}15; padding:1px 4px; border-radius:3px;'>{icono} {delta}</span></div>"
+PLANTILLA_PIE = '<div class="metric-footer"><div>Obj. Mes: <b>{obj_mes}</b></div><div style="color:{color}">Proy: <b>{proy}</b></div></div>'
+
+PLANTILLA_METRICA = '<div class="metric-card"{estilo}><div class="metric-title">{titulo}</div><div class="metric-value-{clase}" style="color:{color};">{valor}</div>{subtitulo}</div>'
+PLANTILLA_DATO = '<div class="metric-card"><div style="font-size:0.85rem; color:#666; font-weight:600;">{titulo}</div><div style="font-size:{tamaño}; color:#00235d; font-weight:bold; margin-top:5px;">{valor}</div><div style="{estilo_pie}">{pie}</div></div>'
+
+PLANTILLA_PRIMA = (
+    '<div style="background-color: #f8f9fa; border: 1px solid #dee2e6; border-radius: 5px; padding: 10px; margin-top: 10px; text-align: center;">'
+    '<p style="margin: 0; color: #666; font-size: 0.75rem; font-weight: bold; text-transform: uppercase;">Posible Cobro {marca}</p>'
+    '<p style="margin: 0; color: #00235d; font-size: 1.2rem; font-weight: bold;">${valor:,.0f}</p>'
+    '<div style="display:flex; justify-content:center; align-items:center; gap: 10px; margin-top: 4px;"><span style="color: #999; font-size: 0.75rem;">Potencial: ${potencial:,.0f}</span>'
+    '<span style="background-color: {color}20; color: {color}; padding: 2px 6px; border-radius: 4px; font-weight: bold; font-size: 0.8rem;">{pct:.1f}% Alcanzado</span></div></div>'
+)
+PLANTILLA_MESES_STOCK = (
+    '<div class="metric-card" style="padding: 18px;"><div>'
+    '<p style="color:#666; font-size:0.9rem; margin-bottom:5px; font-weight: bold;">Meses Stock (Prom 3M)</p>'
+    '<h3 style="color:{color}; margin:0; font-size:1.8rem;">{meses:.2f}</h3><div style="height:10px;"></div></div>'
+    '<div class="metric-footer" style="font-size: 0.85rem;"><div>Obj: <b>3.0</b></div><div style="color:{color}">{icono} Est: <b>{estado}</b></div></div></div>'
+)
+
+PLANTILLA_VARIACION = '<span style="color: {color}; font-weight: bold;">{icono} {v:+.1f}%</span>'
+PLANTILLA_LINEA_VAR = '<div style="font-size: 0.85rem; color: #666;{margen} display:flex; justify-content:space-between; padding:0 10px;"><span>{etiqueta}:</span> {variacion}</div>'
+PLANTILLA_COMPARATIVA = (
+    '<div style="background-color: #ffffff; padding: 12px; border-radius: 8px; border: 1px solid #e0e0e0; text-align: center; height: 100%; box-shadow: 0 1px 3px rgba(0,0,0,0.05); margin-bottom: 10px;">'
+    '<div style="font-size: 0.9rem; font-weight: bold; color: #666; margin-bottom: 5px;">{titulo}</div>'
+    '<div style="font-size: 1.8rem; font-weight: bold; color: #00235d; margin-bottom: 8px;">{valor}</div>{lineas}</div>'
+)
+PLANTILLA_CANAL = (
+    '<div style="background-color: #ffffff; padding: 12px; border-radius: 8px; border: 1px solid #e0e0e0; text-align: center; height: 100%; box-shadow: 0 1px 3px rgba(0,0,0,0.05); margin-bottom: 15px;">'
+    '<div style="font-size: 0.85rem; font-weight: bold; color: #666; margin-bottom: 5px; text-transform: uppercase;">{titulo}</div>'
+    '<div style="font-size: 1.4rem; font-weight: bold; color: #00235d; margin-bottom: 8px;">${valor:,.0f}</div>'
+    '<div style="font-size: 0.8rem; color: #666; margin-bottom: 4px; display:flex; justify-content:center; padding:0 5px;"><span>{etiqueta}:</span>&nbsp;&nbsp;{variacion}</div>'
+    '<div style="font-size: 0.75rem; color: #00A8E8; font-weight: bold; margin-top: 8px; border-top: 1px dashed #eee; padding-top: 6px; display:flex; justify-content:space-between;">'
+    '<span title="Porcentaje de la facturación total de repuestos aportada por este canal">🛒 Mix Venta: {mix_venta:.1f}%</span>'
+    '<span title="Porcentaje de la rentabilidad (o pérdida) aportada por este canal al total general">💰 Mix Margen: {mix_margen:.1f}%</span></div></div>'
+)
+
+def fila_tarjetas(celdas, anchos=None):
+    # Una fila (o grilla, si hay más celdas que anchos) en un solo bloque; una celda puede ser una lista que se apila
+    anchos = anchos or [1] * len(celdas)
+    celdas = "".join(PLANTILLA_PILA.format(celdas="".join(c)) if isinstance(c, list) else c for c in celdas)
+    return PLANTILLA_FILA.format(columnas=" ".join(f"{a}fr" for a in anchos), celdas=celdas)
+
+def pila_tarjetas(celdas):
+    return PLANTILLA_PILA.format(celdas="".join(celdas))
+
+def proyeccion(real, obj_mes, avance):
+    # (objetivo parcial, proyección a fin de mes, cumplimiento de la proyección, color del semáforo)
+    obj_parcial = obj_mes * avance.prog_t
+    proy = (real / avance.d_t) * avance.d_h if avance.d_t > 0 else 0
+    cumpl_proy = proy / obj_mes if obj_mes > 0 else 0
+    color = ROJO if cumpl_proy < 0.90 else (AMARILLO if cumpl_proy < 0.98 else VERDE)
+    return obj_parcial, proy, cumpl_proy, color
+
+def tarjeta_kpi(titulo, real, obj_mes, avance, es_moneda=True, unidad="", diario=False):
+    obj_parcial, proy, cumpl_proy, color = proyeccion(real, obj_mes, avance)
+    fmt = "${:,.0f}" if es_moneda else "{:,.0f}"
+    if unidad: fmt += f" {unidad}"
+    html_diario = ""
+    if diario:
+        valor_diario = real / avance.d_t if avance.d_t > 0 else 0
+        html_diario = PLANTILLA_DIARIO.format(valor=("${:,.0f}" if es_moneda else "{:,.1f}").format(valor_diario))
+    return PLANTILLA_KPI.format(
+        titulo=titulo, real=fmt.format(real), diario=html_diario, obj_parcial=fmt.format(obj_parcial),
+        color_parcial=VERDE if real >= obj_parcial else ROJO, cumpl_parcial=real / obj_parcial if obj_parcial > 0 else 0,
+        icono="✅" if real >= obj_parcial else "🔻", obj_mes=fmt.format(obj_mes), color=color, proy=fmt.format(proy),
+        cumpl_proy=cumpl_proy, barra=min(cumpl_proy * 100, 100))
+
+def tarjeta_mini_kpi(titulo, real, obj_mes, avance, color_titulo="#00235d"):
+    fmt = "${:,.0f}"
+    if not (obj_mes and obj_mes > 0):
+        return PLANTILLA_MINI_SIN_OBJ.format(titulo=titulo, real=fmt.format(real), color_titulo=color_titulo)
+    obj_parcial, proy, cumpl_proy, color = proyeccion(real, obj_mes, avance)
+    return PLANTILLA_MINI.format(
+        titulo=titulo, real=fmt.format(real), color_titulo=color_titulo, obj_parcial=fmt.format(obj_parcial),
+        color_parcial=VERDE if real >= obj_parcial else ROJO, cumpl_parcial=real / obj_parcial if obj_parcial > 0 else 0,
+        icono="✅" if real >= obj_parcial else "🔻", obj_mes=fmt.format(obj_mes), color=color, proy=fmt.format(proy),
+        cumpl_proy=cumpl_proy, barra=min(cumpl_proy * 100, 100))
+
+def tarjeta_kpi_chica(titulo, valor, objetivo=None, obj_mes=None, proy=None, formato="{:.1%}", etiqueta="Obj. Parcial"):
+    subtexto, pie = SUBTEXTO_VACIO, ""
+    if objetivo is not None:
+        delta = valor - objetivo
+        subtexto = PLANTILLA_SUBTEXTO.format(etiqueta=etiqueta, objetivo=formato.format(objetivo), color=VERDE if delta >= 0 else ROJO,
+                                             icono="▲" if delta >= 0 else "▼", delta=formato.format(abs(delta)))
+    if obj_mes is not None and proy is not None:
+        pie = PLANTILLA_PIE.format(obj_mes=formato.format(obj_mes), color=VERDE if proy >= obj_mes else ROJO, proy=formato.format(proy))
+    return PLANTILLA_KPI_CHICA.format(titulo=titulo, valor=formato.format(valor), subtexto=subtexto, pie=pie)
+
+def tarjeta_metrica(titulo, valor, color, clase="money", subtitulo=None, borde=None):
+    # Tarjeta de un solo número (Repuestos); con borde, resaltada
+    estilo = f' style="border: 2px solid {borde}; background-color: #f8f9fa;"' if borde else ""
+    sub = f'<div class="metric-subtitle-gray">{subtitulo}</div>' if subtitulo else ""
+    return PLANTILLA_METRICA.format(estilo=estilo, titulo=titulo, clase=clase, color=color, valor=valor, subtitulo=sub)
+
+def tarjeta_dato(titulo, valor, pie, tamaño="1.5rem", estilo_pie="font-size:0.75rem; color:#888;"):
+    return PLANTILLA_DATO.format(titulo=titulo, valor=valor, pie=pie, tamaño=tamaño, estilo_pie=estilo_pie)
+
+def tarjeta_prima(marca, valor, potencial, pct):
+    color = VERDE if pct >= 90 else (AMARILLO if pct >= 50 else ROJO)
+    return PLANTILLA_PRIMA.format(marca=marca, valor=valor, potencial=potencial, pct=pct, color=color)
+
+def tarjeta_meses_stock(meses):
+    color, icono, estado = (VERDE, "✅", "Óptimo") if meses <= 3.0 else ((AMARILLO, "⚠️", "Medio") if meses <= 5.0 else (ROJO, "🛑", "Crítico"))
+    return PLANTILLA_MESES_STOCK.format(color=color, meses=meses, icono=icono, estado=estado)
+
+def variacion(v):
+    return PLANTILLA_VARIACION.format(color=VERDE if v >= 0 else ROJO, icono="▲" if v >= 0 else "▼", v=v)
+
+def tarjeta_comparativa(titulo, valor, etiqueta1, var1, etiqueta2=None, var2=None, es_ticket=False, es_moneda=False):
+    # Valor de un período con su variación contra uno o dos períodos de referencia (Histórico)
+    lineas = PLANTILLA_LINEA_VAR.format(margen=" margin-bottom: 4px;", etiqueta=etiqueta1, variacion=variacion(var1))
+    if etiqueta2 and var2 is not None:
+        lineas += PLANTILLA_LINEA_VAR.format(margen="", etiqueta=etiqueta2, variacion=variacion(var2))
+    formato = "{:.2f} hs" if es_ticket else "${:,.0f}" if es_moneda else "{:,.0f}"
+    return PLANTILLA_COMPARATIVA.format(titulo=titulo, valor=formato.format(valor), lineas=lineas)
+
+def tarjeta_canal(titulo, valor, etiqueta, var, mix_venta, mix_margen):
+    return PLANTILLA_CANAL.format(titulo=titulo, valor=valor, etiqueta=etiqueta, variacion=variacion(var), mix_venta=mix_venta, mix_margen=mix_margen)
+
+
+if __name__ == "__main__":
+    # python tarjetas.py [n_filas]: arma filas de tarjetas como en la pestaña Objetivos y mide cuánto tarda
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    avance = SimpleNamespace(d_t=12, d_h=22, prog_t=12 / 22)
+    t0 = time.perf_counter()
+    for i in range(n):
+        html = fila_tarjetas([tarjeta_kpi(f"Unidad {j}", 1e6 * (i + j), 2e6 * (j + 1), avance) for j in range(4)]
+                             + [tarjeta_kpi_chica("Eficiencia", 0.9, 0.85, 0.95, 0.92)])
+    print(f"{n} filas de 5 tarjetas en {(time.perf_counter() - t0) * 1000:.1f} ms ({len(html):,} caracteres por fila)")
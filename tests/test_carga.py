@@ -0,0 +1,38 @@
+# Conversión de la carga (carga.py) contra la que hacía el tablero antes del esquema, columna por columna.
+# Se corre desde la raíz del repo: python -m unittest discover tests  (o python -m pytest)
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from carga import convertir_numeros, convertir_numeros_original, parsear_fechas, parsear_fechas_original
+
+class NumerosCarga(unittest.TestCase):
+    def test_igual_que_la_original(self):
+        tabla = pd.DataFrame({
+            'FECHA': ["01/03/2025", "02/03/2025", "03/03/2025", "04/03/2025"],
+            'MO CLIENTE': ["$ 1.234,50", "0", "-12,5", "$ 0,00"],
+            'ENTRADAS': ["12", "0", "7", "1.500"],
+            'OBJ': ["", "s/d", "$ -", "3"],
+            'MODELO': ["208", "2008", "PARTNER", "C3"],
+        })
+        posiciones = [1, 2, 3]
+        nuevo = convertir_numeros(tabla.copy(), posiciones)
+        pd.testing.assert_frame_equal(nuevo, convertir_numeros_original(tabla.copy(), posiciones))
+        self.assertEqual(nuevo['ENTRADAS'].dtype, np.int64)
+        self.assertEqual(nuevo['MO CLIENTE'].tolist(), [1234.5, 0.0, -12.5, 0.0])
+
+class FechasCarga(unittest.TestCase):
+    def test_sin_ceros_igual_que_la_original(self):
+        textos = pd.Series(["1/3/2025", "15/3/2025", "01/03/2025", "9/12/2024", "0"])
+        pd.testing.assert_series_equal(parsear_fechas(textos), parsear_fechas_original(textos), check_dtype=False)
+
+    def test_formatos_mezclados(self):
+        # La original infería el formato de la primera celda y dejaba vacías las demás; acá cada una tiene el suyo
+        textos = pd.Series(["1/3/2025", "1/3/2025 8:05:00", "3/1/2025 10:30", "2025-03-01", "1-3-2025", "1/3/25", "0", ""])
+        esperado = [pd.Timestamp(2025, 3, 1), pd.Timestamp(2025, 3, 1, 8, 5), pd.Timestamp(2025, 1, 3, 10, 30),
+                    pd.Timestamp(2025, 3, 1), pd.Timestamp(2025, 3, 1), pd.Timestamp(2025, 3, 1), pd.NaT, pd.NaT]
+        self.assertEqual(parsear_fechas(textos).tolist(), esperado)
+
+if __name__ == "__main__":
+    unittest.main()
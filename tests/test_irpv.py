@@ -0,0 +1,194 @@
+# Equivalencia entre el IRPV vectorizado (irpv.py) y la versión fila por fila que traía el tablero,
+# sobre pares ventas/taller chicos con los casos de borde de las exportaciones del DMS.
+# Se corre desde la raíz del repo: python -m unittest discover tests  (o python -m pytest)
+import io
+import unittest
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from irpv import clasificar_hitos, generar_archivos_prueba, parsear_fechas_irpv, procesar_irpv
+
+# --- VERSIÓN ORIGINAL (copia textual del tablero antes de irpv.py) ---
+# --- PROCESAMIENTO IRPV ---
+def leer_csv_inteligente(uploaded_file):
+    try:
+        uploaded_file.seek(0)
+        preview = pd.read_csv(uploaded_file, header=None, nrows=20, sep=None, engine='python', encoding='utf-8', on_bad_lines='skip')
+        idx_header = -1
+        keywords = ['BASTIDOR', 'VIN', 'CHASIS', 'MATRICULA', 'REF.OR']
+        for i, row in preview.iterrows():
+            row_txt = " ".join([str(x).upper() for x in row.values])
+            if any(kw in row_txt for kw in keywords):
+                idx_header = i
+                break
+        if idx_header == -1: idx_header = 0
+        
+        uploaded_file.seek(0)
+        try:
+            df = pd.read_csv(uploaded_file, header=idx_header, sep=';', encoding='utf-8', on_bad_lines='skip')
+        except:
+            uploaded_file.seek(0)
+            df = pd.read_csv(uploaded_file, header=idx_header, sep=',', encoding='utf-8', on_bad_lines='skip')
+        return df, "OK"
+    except Exception as e:
+        return None, str(e)
+
+def procesar_irpv_original(file_v, file_t):
+    df_v, msg_v = leer_csv_inteligente(file_v)
+    if df_v is None: return None, f"Ventas: {msg_v}"
+    df_v.columns = [str(c).upper().strip() for c in df_v.columns]
+    
+    col_vin = next((c for c in df_v.columns if 'BASTIDOR' in c or 'VIN' in c), None)
+    col_fec = next((c for c in df_v.columns if 'FEC' in c or 'ENTR' in c), None)
+    if not col_vin or not col_fec: return None, "Ventas: Faltan columnas VIN/Fecha"
+
+    def clean_date(x):
+        try: return pd.to_datetime(x, dayfirst=True)
+        except: return pd.NaT
+
+    df_v['Fecha_Entrega'] = df_v[col_fec].apply(clean_date)
+    df_v['Año_Venta'] = df_v['Fecha_Entrega'].dt.year
+    df_v['VIN'] = df_v[col_vin].astype(str).str.strip().str.upper()
+    df_v = df_v.dropna(subset=['VIN', 'Fecha_Entrega'])
+
+    df_t, msg_t = leer_csv_inteligente(file_t)
+    if df_t is None: return None, f"Taller: {msg_t}"
+    df_t.columns = [str(c).upper().strip() for c in df_t.columns]
+    
+    col_vin_t = next((c for c in df_t.columns if 'BASTIDOR' in c or 'VIN' in c), None)
+    col_fec_t = next((c for c in df_t.columns if 'CIERRE' in c or 'FEC' in c), None)
+    col_km = next((c for c in df_t.columns if 'KM' in c), None)
+    col_or = next((c for c in df_t.columns if 'TIPO' in c or 'O.R.' in c), None)
+    col_desc = next((c for c in df_t.columns if 'DESCR' in c or 'OPER' in c or 'TRABAJO' in c), None)
+    if not col_vin_t or not col_fec_t: return None, "Taller: Faltan columnas VIN/Fecha"
+
+    df_t['Fecha_Servicio'] = df_t[col_fec_t].apply(clean_date)
+    df_t['VIN'] = df_t[col_vin_t].astype(str).str.strip().str.upper()
+    df_t['Km'] = pd.to_numeric(df_t[col_km], errors='coerce').fillna(0) if col_km else 0
+    df_t['Texto'] = df_t[col_desc].astype(str).str.upper() if col_desc else ""
+
+    if col_or:
+        mask = ~df_t[col_or].astype(str).str.contains('CHAPA|PINTURA|SINIESTRO', case=False, na=False)
+        df_t = df_t[mask]
+
+    def clasif_hibrida(row):
+        k = row['Km']
+        t = row['Texto']
+        if (2500 <= k <= 16500) or any(w in t for w in ["10.000", "10K", "1ER", "PRIMER", "DIEZ MIL"]): return "1er"
+        if (16501 <= k <= 27000) or any(w in t for w in ["20.000", "20K", "2DO", "SEGUNDO", "VEINTE MIL"]): return "2do"
+        if (27001 <= k <= 38000) or any(w in t for w in ["30.000", "30K", "3ER", "TERCER", "TREINTA MIL"]): return "3er"
+        return None
+    
+    df_t['Hito'] = df_t.apply(clasif_hibrida, axis=1)
+    df_validos = df_t.dropna(subset=['Hito'])
+    pivot_dates = df_validos.pivot_table(index='VIN', columns='Hito', values='Fecha_Servicio', aggfunc='min').reset_index()
+    merged = pd.merge(df_v, pivot_dates, on='VIN', how='left')
+    hoy = datetime.now()
+
+    def evaluar(row, actual, anterior=None):
+        if actual == '1er': base = row['Fecha_Entrega']
+        else: base = row.get(anterior, pd.NaT)
+        if pd.isna(base): return np.nan 
+        limite = base + timedelta(days=365)
+        hecho = row.get(actual, pd.NaT)
+        if not pd.isna(hecho): return 1.0 
+        if hoy >= limite: return 0.0 
+        return np.nan 
+
+    merged['R_1er'] = merged.apply(lambda r: evaluar(r, '1er'), axis=1)
+    merged['R_2do'] = merged.apply(lambda r: evaluar(r, '2do', '1er'), axis=1)
+    merged['R_3er'] = merged.apply(lambda r: evaluar(r, '3er', '2do'), axis=1)
+    res = merged.groupby('Año_Venta')[['R_1er', 'R_2do', 'R_3er']].mean()
+    res.columns = ['1er', '2do', '3er']
+    return res, "OK"
+
+# --- CASOS ---
+def csv(texto):
+    return io.BytesIO(texto.encode())
+
+# Un auto por caso de borde: fechas día primero con y sin hora, ISO, km justo en los bordes, hitos sólo en el texto,
+# VIN vacío o en minúscula, órdenes de Chapa. Las entregas son viejas (todo vencido) o de hace poco (todo en plazo)
+VENTAS_BORDES = """BASTIDOR;FECHA ENTREGA;MODELO
+VIN0001;15/03/2021;208
+VIN0002;2021-03-15;208
+vin0003 ;15/03/2021 10:30:00;2008
+;15/03/2021;208
+VIN0005;20-06-2022;208
+VIN0006;2022-06-20;PARTNER
+VIN0007;{reciente};208
+VIN0008;sin fecha;208
+VIN0009;14/02/2023;208
+"""
+TALLER_BORDES = """REF.OR;BASTIDOR;FECHA CIERRE;KM;TIPO O.R.;DESCRIPCION
+1;VIN0001;20/09/2021;2500;MECANICA;CAMBIO DE ACEITE
+2;VIN0001;2022-08-25;16501;MECANICA;CONTROL
+3;VIN0001;28/07/2023;27001;MECANICA;CONTROL
+4;VIN0002;20/09/2021;2499;MECANICA;1ER SERVICE
+5;VIN0002;2022-08-25;16500;MECANICA;CONTROL
+6;vin0003;20/09/2021 09:15:00;0;GARANTIA;primer service
+7;VIN0003;25/08/2022;s/d;MECANICA;SERVICE 20K
+8;VIN0003;28/07/2023;38000;MECANICA;CONTROL
+9;;20/09/2021;5000;MECANICA;CONTROL
+10;VIN0005;20/09/2022;10000;CHAPA;CONTROL
+11;VIN0005;20/10/2022;38001;MECANICA;diez mil
+12;VIN0005;2023-05-30;27000;MECANICA;CONTROL
+13;VIN0006;30/05/2023;40000;Pintura;TREINTA MIL
+14;VIN0006;30/05/2023;1000;MECANICA;TREINTA MIL
+15;VIN0007;{reciente};3000;MECANICA;CONTROL
+16;VIN0009;2023-03-14;;MECANICA;ALINEACION
+17;VIN9999;20/09/2021;5000;MECANICA;CONTROL
+"""
+
+def par_bordes():
+    reciente = (datetime.now() - timedelta(days=40)).strftime("%d/%m/%Y")
+    return VENTAS_BORDES.format(reciente=reciente), TALLER_BORDES.format(reciente=reciente)
+
+class EquivalenciaIrpv(unittest.TestCase):
+    def comparar(self, ventas, taller):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # la original avisa por cada fecha ISO con dayfirst
+            esperado, msg_original = procesar_irpv_original(csv(ventas), csv(taller))
+        obtenido, msg = procesar_irpv(csv(ventas), csv(taller))
+        self.assertEqual((msg_original, msg), ("OK", "OK"))
+        pd.testing.assert_frame_equal(obtenido, esperado, check_names=False, check_index_type=False)
+
+    def test_casos_de_borde(self):
+        self.comparar(*par_bordes())
+
+    def test_archivos_sinteticos(self):
+        for semilla in range(3):
+            with self.subTest(semilla=semilla):
+                ventas, taller = generar_archivos_prueba(3000, semilla=semilla)
+                self.comparar(ventas.decode(), taller.decode())
+
+    def test_km_en_los_bordes(self):
+        km = pd.Series([0, 2499, 2500, 16500, 16501, 27000, 27001, 38000, 38001, 5000, 5000, 0, 0, 0], dtype=float)
+        texto = pd.Series(["X"] * 9 + ["20K Y 1ER", "SEGUNDO", "VEINTE MIL", "TERCER", "10.000"])
+        self.assertEqual(clasificar_hitos(km, texto).fillna("-").tolist(),
+                         ["-", "-", "1er", "1er", "2do", "2do", "3er", "3er", "-", "1er", "1er", "2do", "3er", "1er"])
+
+    def test_fechas_dia_primero_e_iso(self):
+        textos = pd.Series(["15/03/2021", "15/03/2021 10:30:00", "20-06-2022", "2022-06-20", "05/04/2023", "sin fecha", None])
+        esperado = [pd.Timestamp(2021, 3, 15), pd.Timestamp(2021, 3, 15, 10, 30), pd.Timestamp(2022, 6, 20),
+                    pd.Timestamp(2022, 6, 20), pd.Timestamp(2023, 4, 5), pd.NaT, pd.NaT]
+        self.assertEqual(parsear_fechas_irpv(textos).tolist(), esperado)
+
+# --- DIFERENCIAS BUSCADAS CON LA VERSIÓN ORIGINAL ---
+class DiferenciasIrpv(unittest.TestCase):
+    def test_iso_ambigua_se_lee_como_iso(self):
+        # La original pasaba dayfirst=True celda por celda y daba vuelta día y mes: 2024-04-03 quedaba en marzo
+        self.assertEqual(parsear_fechas_irpv(pd.Series(["2024-04-03"])).iloc[0], pd.Timestamp(2024, 4, 3))
+
+    def test_descripcion_vacia(self):
+        # La original fallaba con descripciones vacías (NaN en el texto al buscar las palabras clave)
+        ventas = "BASTIDOR;FECHA ENTREGA\nVIN0001;15/03/2021\n"
+        taller = "BASTIDOR;FECHA CIERRE;KM;DESCRIPCION\nVIN0001;20/09/2021;5000;\n"
+        res, msg = procesar_irpv(csv(ventas), csv(taller))
+        self.assertEqual(msg, "OK")
+        self.assertEqual(res.loc[2021, '1er'], 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+import math
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from carga import cargar_datos, parsear_fechas
+from columnas import IndiceColumnas
+from fuentes import fuente_desde_config
+
+# --- ÓRDENES ABIERTAS (WIP) ---
+# La hoja WIP se prepara una vez por versión (huella de la hoja) y se comparte entre reruns y sesiones:
+# cambiar de asesor en el tablero sólo filtra lo ya preparado. Sin Streamlit, como kpis.py.
+
+ASESORES_MAP = {
+    "1": "Claudio Molina", "3": "Belen Juarez", "4": "Fatima Polli", "8": "Daniel Espin",
+    "11": "César Oliva", "12": "Hector Corrales", "13": "Nazareno Segovia", "14": "Haydee Garnica",
+    "21": "Javier Gutierrez", "22": "Antonio Mogro", "23": "Samuel Antunez",
+    "28": "Fernanda Barranco", "29": "Ricardo Alvarez", "30": "Andrea Martins", "31": "Cristian Portal"
+}
+CODIGOS_CYP = ['1B', '3G']
+TIPOS_TALLER = ['Mecánica', 'Chapa y Pintura']
+MAX_WIP_CACHE = 8  # Versiones de la hoja WIP preparadas en memoria
+TODOS = "Todos"  # Valor de una dimensión sumada en el cubo
+# Antigüedad de la orden (días desde Fecha_Alta): límite superior de cada tramo
+TRAMOS_ANTIGUEDAD = [(7, "0-7 días"), (15, "8-15 días"), (30, "16-30 días"), (60, "31-60 días"), (np.inf, "+60 días")]
+SIN_FECHA = "Sin fecha"
+DIMENSIONES_WIP = ['Nombre_Asesor', 'Tipo_Taller', 'Codigo_Cargo', 'Antiguedad']
+# Tabla de detalle: columnas que se muestran y filas por página
+COLUMNAS_DETALLE = ['Ref.OR', 'Fecha_Alta', 'Dias_Abierta', 'Tipo', 'Nombre_Asesor', 'Identificador', 'Modelo', 'Saldo']
+FILAS_POR_PAGINA = 50
+# Combinaciones que se precalculan (los autos distintos no se pueden sumar entre celdas: cada una se cuenta aparte)
+CONJUNTOS_WIP = [(), ('Nombre_Asesor',), ('Tipo_Taller',), ('Codigo_Cargo',), ('Nombre_Asesor', 'Tipo_Taller'),
+                 ('Nombre_Asesor', 'Codigo_Cargo'), tuple(DIMENSIONES_WIP)]
+
+
+def por_valor(serie, f, categorias=None):
+    # f se aplica a los valores distintos (son pocos) y el resultado vuelve a las filas como categórica
+    codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+    nuevos, etiquetas = pd.factorize(f(pd.Series(valores, dtype=object)))
+    categorias = sorted(etiquetas) if categorias is None else categorias  # Así ordenar por la columna es alfabético
+    nuevos = pd.Index(categorias).get_indexer(etiquetas)[nuevos]
+    return pd.Series(pd.Categorical.from_codes(nuevos[codigos], categorias), index=serie.index)
+
+def nombres_asesor(valores):
+    # "3", 3 o 3.0 -> "3" -> nombre del mapa; los códigos que no están quedan como "Asesor <código>"
+    codigo = valores.where(valores.notna(), "nan").astype(str).str.split('.').str[0]
+    return codigo.map(ASESORES_MAP).fillna("Asesor " + codigo)
+
+def tipos_taller(valores):
+    es_cyp = valores.astype(str).str.strip().str.upper().str[:2].isin(CODIGOS_CYP).to_numpy()
+    return np.where(es_cyp, TIPOS_TALLER[1], TIPOS_TALLER[0])
+
+def preparar_wip(df, indice):
+    # Devuelve una hoja nueva con las columnas del tablero; la hoja compartida no se toca
+    if df is None or df.empty: return None
+
+    def col_segura(nombre):
+        if not nombre: return pd.Series(np.nan, index=df.index)
+        data = df[nombre]
+        return data.iloc[:, 0] if isinstance(data, pd.DataFrame) else data
+
+    col_saldo = indice.kpi['wip_saldo']
+    if not col_saldo: return None
+
+    col_matricula = indice.col('WIP', ['MATRICUL'])
+    col_idv = indice.col('WIP', ['IDV'])
+    col_rec = indice.col('WIP', ['REC'])
+    col_tipo = indice.col('WIP', ['TIPO'])
+    col_fecha = indice.col('WIP', ['APER'])
+    col_modelo = indice.col('WIP', ['MODELO'])
+    col_ref = indice.col('WIP', ['REF'])
+
+    s_mat = col_segura(col_matricula)
+    s_idv = col_segura(col_idv)
+    if col_matricula and col_idv:
+        identificador = s_mat.replace('0', np.nan).fillna(s_idv.astype(str))
+    elif col_matricula:
+        identificador = s_mat
+    else:
+        identificador = pd.Series("S/D", index=df.index)
+
+    s_tipo = col_segura(col_tipo)
+    return df.assign(**{
+        'Saldo': col_segura(col_saldo),
+        'Identificador': identificador.astype(str).str.strip().str.upper(),
+        'Nombre_Asesor': por_valor(col_segura(col_rec), nombres_asesor) if col_rec else pd.Categorical(["Desconocido"] * len(df)),
+        'Tipo_Taller': por_valor(s_tipo, tipos_taller, TIPOS_TALLER) if col_tipo else pd.Categorical([TIPOS_TALLER[0]] * len(df), categories=TIPOS_TALLER),
+        'Tipo': s_tipo if col_tipo else 'S/D',
+        'Fecha_Alta': parsear_fechas(col_segura(col_fecha)) if col_fecha else pd.NaT,
+        'Modelo': col_segura(col_modelo) if col_modelo else "",
+        'Ref.OR': col_segura(col_ref) if col_ref else "",
+    }).assign(Codigo_Cargo=lambda d: d['Tipo'].astype(str).str.split().str[0])
+
+# --- CACHÉ POR HUELLA DE LA HOJA WIP ---
+_wip = OrderedDict()
+_lock_wip = threading.Lock()
+
+def wip_preparado(df, indice, huella_wip):
+    with _lock_wip:
+        if huella_wip in _wip:
+            _wip.move_to_end(huella_wip)
+            return _wip[huella_wip]
+    res = preparar_wip(df, indice)
+    with _lock_wip:
+        _wip[huella_wip] = res
+        while len(_wip) > MAX_WIP_CACHE:
+            _wip.popitem(last=False)
+    return res
+
+
+# --- CUBO WIP ---
+@dataclass(frozen=True)
+class CeldaWip:
+    saldo: float = 0.0
+    ordenes: int = 0
+    autos: int = 0  # Vehículos distintos
+
+
+@dataclass(frozen=True)
+class ResumenWip:
+    total: CeldaWip
+    mecanica: CeldaWip
+    cyp: CeldaWip
+
+
+def antiguedad(fecha_alta, hoy):
+    dias = (pd.Timestamp(hoy).normalize() - fecha_alta).dt.days
+    tramos = pd.cut(dias, [-np.inf] + [t for t, _ in TRAMOS_ANTIGUEDAD], labels=[e for _, e in TRAMOS_ANTIGUEDAD])
+    return dias, tramos.cat.add_categories(SIN_FECHA).fillna(SIN_FECHA)
+
+def agrupar_wip(df, claves):
+    if claves:
+        res = df.groupby(list(claves), observed=True).agg(Saldo=('Saldo', 'sum'), Ordenes=('Identificador', 'count'),
+                                                         Autos=('Identificador', 'nunique')).reset_index()
+    else:
+        res = pd.DataFrame({'Saldo': [df['Saldo'].sum()], 'Ordenes': [df['Identificador'].count()], 'Autos': [df['Identificador'].nunique()]})
+    return res.assign(**{d: (res[d].astype(str) if d in claves else TODOS) for d in DIMENSIONES_WIP})
+
+
+class CuboWip:
+    # Saldo, órdenes y autos distintos por (asesor, tipo de taller, código de cargo, antigüedad), con TODOS en las
+    # dimensiones sumadas. Se arma una vez por (versión de la hoja, día): elegir asesor es leer un diccionario
+    def __init__(self, df_w, hoy=None):
+        hoy = hoy or datetime.now()
+        self.dia = pd.Timestamp(hoy).date()
+        dias, tramos = antiguedad(df_w['Fecha_Alta'], hoy)
+        self.detalle = df_w.assign(Dias_Abierta=dias, Antiguedad=tramos)
+        self.tabla = pd.concat([agrupar_wip(self.detalle, c) for c in CONJUNTOS_WIP], ignore_index=True).set_index(DIMENSIONES_WIP)
+        self._celdas = {k: CeldaWip(float(v[0]), int(v[1]), int(v[2]))
+                        for k, v in zip(self.tabla.index, self.tabla[['Saldo', 'Ordenes', 'Autos']].to_numpy())}
+        self.asesores = sorted(self.detalle['Nombre_Asesor'].unique().tolist())
+        self.codigos_cargo = sorted(self.detalle['Codigo_Cargo'].dropna().unique().tolist())
+        self.max_dias = int(max(self.detalle['Dias_Abierta'].max(), 0)) if self.detalle['Dias_Abierta'].notna().any() else 0
+
+        # Ranking global de asesores
+        por_asesor = self.tabla.xs((TODOS, TODOS, TODOS), level=['Tipo_Taller', 'Codigo_Cargo', 'Antiguedad'])
+        por_asesor = por_asesor.drop(index=TODOS).sort_index()
+        self.ranking = pd.DataFrame({
+            'Nombre_Asesor': por_asesor.index, 'Dinero': por_asesor['Saldo'].to_numpy(), 'Autos': por_asesor['Autos'].to_numpy(),
+            'Etiqueta': por_asesor['Autos'].astype(str).to_numpy() + " autos ($" + (por_asesor['Saldo'] / 1000).map("{:.0f}".format).to_numpy() + "k)",
+        }).sort_values('Dinero', ascending=True)
+
+        # Órdenes por código de cargo, para cada asesor y para TODOS
+        por_cargo = self.tabla.xs((TODOS, TODOS), level=['Tipo_Taller', 'Antiguedad']).drop(index=TODOS, level='Codigo_Cargo')
+        self._cargos = {
+            a: pd.DataFrame({'Codigo_Cargo': g.index.get_level_values('Codigo_Cargo'), 'Cantidad': g['Ordenes'].to_numpy(),
+                             'Dinero': g['Saldo'].to_numpy()}).sort_values('Cantidad', ascending=True)
+            for a, g in por_cargo.sort_index().groupby(level='Nombre_Asesor')
+        }
+
+    def vigente(self, hoy=None):
+        return self.dia == pd.Timestamp(hoy or datetime.now()).date()
+
+    def celda(self, asesor=TODOS, tipo=TODOS, cargo=TODOS, tramo=TODOS):
+        return self._celdas.get((asesor, tipo, cargo, tramo), CeldaWip())
+
+    def resumen(self, asesor=TODOS):
+        return ResumenWip(self.celda(asesor), self.celda(asesor, TIPOS_TALLER[0]), self.celda(asesor, TIPOS_TALLER[1]))
+
+    def cargos(self, asesor=TODOS):
+        return self._cargos.get(asesor, pd.DataFrame({'Codigo_Cargo': [], 'Cantidad': [], 'Dinero': []}))
+
+    def filtrar(self, asesor=TODOS, texto="", dias=None, cargos=()):
+        d = self.detalle
+        mascara = np.ones(len(d), dtype=bool)
+        if asesor != TODOS: mascara &= (d['Nombre_Asesor'] == asesor).to_numpy()
+        if texto: mascara &= d['Identificador'].str.contains(texto.strip().upper(), regex=False, na=False).to_numpy()
+        if dias is not None: mascara &= d['Dias_Abierta'].between(*dias).to_numpy()  # Las órdenes sin fecha quedan afuera
+        if cargos: mascara &= d['Codigo_Cargo'].isin(cargos).to_numpy()
+        return d.loc[mascara, [c for c in COLUMNAS_DETALLE if c in d.columns]]
+
+def contar_paginas(n_filas, por_pagina=FILAS_POR_PAGINA):
+    return max(1, math.ceil(n_filas / por_pagina))
+
+def paginar(filas, orden=None, descendente=False, pagina=1, por_pagina=FILAS_POR_PAGINA):
+    # Ordena y corta la página pedida (acotada a las que hay): (filas de la página, página, páginas)
+    paginas = contar_paginas(len(filas), por_pagina)
+    pagina = min(max(1, pagina), paginas)
+    if orden: filas = filas.sort_values(orden, ascending=not descendente, na_position='last', kind='stable')
+    return filas.iloc[(pagina - 1) * por_pagina: pagina * por_pagina], pagina, paginas
+
+_cubos_wip = OrderedDict()
+
+def cubo_wip(df, indice, huella_wip, hoy=None):
+    # La antigüedad cambia con el día: el cubo se guarda por (huella de la hoja, día)
+    hoy = hoy or datetime.now()
+    clave = (huella_wip, pd.Timestamp(hoy).date())
+    with _lock_wip:
+        if clave in _cubos_wip:
+            _cubos_wip.move_to_end(clave)
+            return _cubos_wip[clave]
+    df_w = wip_preparado(df, indice, huella_wip)
+    res = CuboWip(df_w, hoy) if df_w is not None and not df_w.empty else None
+    with _lock_wip:
+        _cubos_wip[clave] = res
+        while len(_cubos_wip) > MAX_WIP_CACHE:
+            _cubos_wip.popitem(last=False)
+    return res
+
+if __name__ == "__main__":
+    # Medición por fuera del tablero: python wip.py [sheet_id]  (la fuente sale de TABLERO_FUENTE)
+    data, huellas, errores = cargar_datos(fuente_desde_config(sys.argv[1] if len(sys.argv) > 1 else ""))
+    indice = IndiceColumnas(data)
+    huella_wip = huellas.get('WIP')
+    t0 = time.perf_counter()
+    cubo = cubo_wip(data.get('WIP'), indice, huella_wip)
+    t1 = time.perf_counter()
+    cubo_wip(data.get('WIP'), indice, huella_wip)
+    print(f"WIP: {0 if cubo is None else len(cubo.detalle)} órdenes, cubo en {(t1 - t0) * 1000:.1f} ms, "
+          f"desde la caché en {(time.perf_counter() - t1) * 1000:.3f} ms")
+    if cubo is not None:
+        t0 = time.perf_counter()
+        for a in [TODOS] + cubo.asesores:
+            cubo.resumen(a), cubo.cargos(a)
+        print(f"Resumen y cargos de {len(cubo.asesores) + 1} asesores en {(time.perf_counter() - t0) * 1000:.3f} ms")